@@ -0,0 +1,70 @@
+"""
+Shows how the throughput of the ASGI app scales with the number of concurrent requests when the plugin
+waits on a slow backend, once for a plugin with `async def` functions and once for a sync plugin.
+
+    python -m benchmarks.async_concurrency [delay in seconds]
+"""
+import asyncio
+import sys
+import time
+from types import ModuleType
+
+from oai_pmh import APP
+from oai_pmh.asgi import ASGI_APP
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.plugin_handler import REQUIRED_FUNCTIONS, register_plugin
+
+def create_plugin(source: str, create_identify) -> ModuleType:
+    """A complete plugin that answers like the default plugin, except for its own create_identify"""
+    plugin = ModuleType(f'oai_pmh.plugins.{source}.convert')
+    for name in REQUIRED_FUNCTIONS:
+        setattr(plugin, name, getattr(default, name))
+    plugin.create_identify = create_identify # type: ignore
+    return plugin
+
+def register_slow_plugins(delay: float) -> None:
+    async def create_identify(url):
+        await asyncio.sleep(delay)
+        return default.create_identify(url)
+    register_plugin('slow_async', create_plugin('slow_async', create_identify))
+
+    def create_identify_sync(url):
+        time.sleep(delay)
+        return default.create_identify(url)
+    register_plugin('slow_sync', create_plugin('slow_sync', create_identify_sync))
+
+async def get(path: str, query: str) -> int:
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('latin-1'), 'headers': [],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 5000), 'client': ('127.0.0.1', 0)
+    }
+    status = 0
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+    await ASGI_APP(scope, receive, send)
+    return status
+
+async def measure(source: str, concurrency: int, requests_per_client: int) -> float:
+    async def client():
+        for _ in range(requests_per_client):
+            assert await get(f'/{source}/oai', 'verb=Identify') == 200
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return concurrency * requests_per_client / (time.perf_counter() - start)
+
+async def main(delay: float = 0.05) -> None:
+    # the admission control would answer the requests beyond its limit and queue with 503
+    APP.config['OAI_ADMISSION_LIMIT'] = 0
+    register_slow_plugins(delay)
+    print(f'{"plugin":<12}{"concurrency":>12}{"requests/s":>14}')
+    for source in ['slow_async', 'slow_sync']:
+        for concurrency in [1, 4, 16, 64]:
+            throughput = await measure(source, concurrency, 5)
+            print(f'{source:<12}{concurrency:>12}{throughput:>14.1f}')
+
+if __name__ == '__main__':
+    asyncio.run(main(*[float(x) for x in sys.argv[1:2]]))
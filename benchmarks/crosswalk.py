@@ -0,0 +1,52 @@
+"""
+Converts pages of synthetic records into every registered metadata format, in the request thread, in the process pool
+and from the cache of the crosswalk pipeline.
+
+    python -m benchmarks.crosswalk [page size] [pages]
+"""
+import sys
+import time
+from typing import Optional
+
+from benchmarks import synthetic
+from oai_pmh import APP
+from oai_pmh.shared.crosswalk import CROSSWALKS, CrosswalkPipeline, get_process_count, get_process_pool
+from oai_pmh.generated.models import MetadataPrefix
+
+def convert_pages(pipeline: CrosswalkPipeline, pages: list[list], metadata_prefix: MetadataPrefix) -> float:
+    start = time.perf_counter()
+    for page in pages:
+        pipeline.create_records(page, metadata_prefix)
+    return (time.perf_counter() - start) / sum(len(x) for x in pages) * 1000
+
+def main(page_size: int = 500, page_count: int = 10) -> None:
+    plugin = synthetic.register()
+    numbers = range(page_size * page_count)
+    entries = [(plugin.create_header(x), plugin.create_row(x).get('metadata')) for x in numbers]
+    pages = [entries[x:x + page_size] for x in range(0, len(entries), page_size)]
+    # the pool is started before it is measured
+    APP.config['OAI_CROSSWALK_PROCESSES'] = None
+    get_process_pool()
+
+    results: dict[str, list[Optional[float]]] = {}
+    APP.config['OAI_CROSSWALK_CACHE_SIZE'] = 0
+    for metadata_prefix in CROSSWALKS:
+        APP.config['OAI_CROSSWALK_PARALLEL_THRESHOLD'] = page_size + 1
+        sequential = convert_pages(CrosswalkPipeline('sequential'), pages, MetadataPrefix(metadata_prefix))
+        APP.config['OAI_CROSSWALK_PARALLEL_THRESHOLD'] = 1
+        # crosswalks registered with parallel=False never use the pool
+        parallel = convert_pages(CrosswalkPipeline('parallel'), pages, MetadataPrefix(metadata_prefix)) if CROSSWALKS[metadata_prefix].parallel else None
+        results[metadata_prefix] = [sequential, parallel]
+    # the cache is created on first use, so it is only enabled once the uncached runs are done
+    APP.config['OAI_CROSSWALK_CACHE_SIZE'] = 256 * 1024 * 1024
+    for metadata_prefix in CROSSWALKS:
+        pipeline = CrosswalkPipeline('cached')
+        convert_pages(pipeline, pages, MetadataPrefix(metadata_prefix))
+        results[metadata_prefix].append(convert_pages(pipeline, pages, MetadataPrefix(metadata_prefix)))
+
+    print(f'{"format":<10}{"sequential [ms/record]":>24}{f"{get_process_count()} processes [ms/record]":>28}{"cached [ms/record]":>20}')
+    for (metadata_prefix, (sequential, parallel, cached)) in results.items():
+        print(f'{metadata_prefix:<10}{sequential:>24.4f}{f"{parallel:.4f}" if parallel is not None else "-":>28}{cached:>20.4f}')
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
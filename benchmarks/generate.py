@@ -0,0 +1,36 @@
+"""
+Writes the synthetic repository as <set>.json files in the layout of oai_pmh/plugins/default/content.json,
+e.g. to load it into a RecordStore or to serve it from a copy of the default plugin.
+
+    python -m benchmarks.generate <directory> [record count] [seed]
+"""
+import json
+import pathlib
+import sys
+
+from benchmarks import synthetic
+from oai_pmh import APP
+
+def write_repository(directory: str | pathlib.Path, record_count: int, seed: int = 0) -> None:
+    APP.config['OAI_SYNTHETIC_RECORDS'] = record_count
+    APP.config['OAI_SYNTHETIC_SEED'] = seed
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = {spec: open(directory / f'{spec}.json', 'w', encoding='utf-8') for (spec, _, _) in synthetic.SETS}
+    first = {spec: True for spec in files}
+    try:
+        for filestream in files.values():
+            filestream.write('[\n')
+        for number in range(record_count):
+            row = synthetic.create_row(number)
+            for spec in row['sets']:
+                files[spec].write(('    ' if first[spec] else ',\n    ') + json.dumps(row, ensure_ascii=False))
+                first[spec] = False
+        for filestream in files.values():
+            filestream.write('\n]\n')
+    finally:
+        for filestream in files.values():
+            filestream.close()
+
+if __name__ == '__main__':
+    write_repository(sys.argv[1], *[int(x) for x in sys.argv[2:4]])
@@ -0,0 +1,156 @@
+"""
+Drives every verb against the synthetic plugin through the flask test client and reports throughput,
+p50/p99 latency, time to first byte and the peak RSS of the process per verb and page size.
+
+    python -m benchmarks.harness [--records N] [--page-sizes 100 500] [--requests N] [--output DIR]
+    python -m benchmarks.harness --compare <before.json> <after.json>
+
+Results are saved as JSON named after the current commit, so runs of different commits can be compared.
+"""
+import argparse
+from datetime import datetime
+import json
+import pathlib
+from random import Random
+import re
+import resource
+import statistics
+import subprocess
+import time
+from typing import Any, Iterator
+from urllib.parse import quote
+
+from benchmarks import synthetic
+from oai_pmh import APP
+
+RESULTS_DIRECTORY = pathlib.Path(__file__).parent / 'results'
+TOKEN_PATTERN = re.compile(rb'<resumptionToken[^>]*>([^<]*)</resumptionToken>')
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def get_peak_rss() -> float:
+    # ru_maxrss is the high-water mark of the process in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def harvest(first_query: str, body_of_previous: list[bytes]) -> Iterator[str]:
+    """Yields the query of the first page and then the resumption requests of the following pages, restarting when the list is complete"""
+    while True:
+        yield first_query
+        while True:
+            match = TOKEN_PATTERN.search(body_of_previous[0])
+            if match is None or match.group(1).strip() == b'':
+                break
+            yield f'{first_query.split("&")[0]}&resumptionToken={quote(match.group(1).decode("utf-8").strip())}'
+
+def create_scenarios(sample_identifiers: list[str]) -> dict[str, Any]:
+    random = Random(0)
+    return {
+        'Identify': lambda previous: iter(lambda: 'verb=Identify', None),
+        'ListSets': lambda previous: iter(lambda: 'verb=ListSets', None),
+        'ListMetadataFormats': lambda previous: iter(lambda: 'verb=ListMetadataFormats', None),
+        'GetRecord': lambda previous: iter(lambda: f'verb=GetRecord&metadataPrefix=oai_dc&identifier={random.choice(sample_identifiers)}', None),
+        'ListIdentifiers': lambda previous: harvest('verb=ListIdentifiers&metadataPrefix=oai_dc', previous),
+        'ListRecords': lambda previous: harvest('verb=ListRecords&metadataPrefix=oai_dc', previous),
+        'ListRecords set+from': lambda previous: harvest('verb=ListRecords&metadataPrefix=oai_dc&set=articles&from=2020-01-01', previous),
+    }
+
+def run_scenario(client: Any, create_queries: Any, request_count: int) -> dict[str, float]:
+    previous = [b'']
+    queries = create_queries(previous)
+    latencies = []
+    first_bytes = []
+    for _ in range(request_count):
+        query = next(queries)
+        start = time.perf_counter()
+        response = client.get(f'/synthetic/oai?{query}', buffered=False)
+        chunks = iter(response.response)
+        first_chunk = next(chunks, b'')
+        first_bytes.append(time.perf_counter() - start)
+        body = first_chunk + b''.join(chunks)
+        latencies.append(time.perf_counter() - start)
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f'{query} returned {response.status_code}')
+        previous[0] = body
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': request_count,
+        'throughput': request_count / sum(latencies),
+        'p50_ms': percentiles[49] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'ttfb_p50_ms': statistics.median(first_bytes) * 1000,
+        'peak_rss_mb': get_peak_rss()
+    }
+
+def run(record_count: int, page_sizes: list[int], request_count: int, caches: bool) -> dict[str, Any]:
+    APP.config['OAI_SYNTHETIC_RECORDS'] = record_count
+    # every page size is measured as it is configured
+    APP.config['OAI_PAGE_LATENCY_TARGET'] = None
+    if not caches:
+        APP.config['OAI_FRAGMENT_CACHE_SIZE'] = 0
+        APP.config['OAI_COMPRESSION_CACHE_SIZE'] = 0
+    synthetic.register()
+    start = time.perf_counter()
+    synthetic.get_index()
+    index_seconds = time.perf_counter() - start
+    sample_identifiers = [synthetic.create_header_row(x)[0] for x in Random(1).sample(range(record_count), min(record_count, 1000))]
+
+    results = []
+    client = APP.test_client()
+    for page_size in page_sizes:
+        APP.config['OAI_PAGE_SIZE'] = page_size
+        for (verb, create_queries) in create_scenarios(sample_identifiers).items():
+            result = {'verb': verb, 'page_size': page_size} | run_scenario(client, create_queries, request_count)
+            results.append(result)
+            print(f'{verb:<22}{page_size:>6}{result["throughput"]:>10.1f}/s  p50 {result["p50_ms"]:>8.2f}ms  p99 {result["p99_ms"]:>8.2f}ms  ttfb {result["ttfb_p50_ms"]:>8.2f}ms  rss {result["peak_rss_mb"]:>8.1f}MB')
+    return {
+        'commit': get_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'records': record_count,
+        'caches': caches,
+        'streaming': APP.config['OAI_STREAMING'],
+        'index_seconds': index_seconds,
+        'results': results
+    }
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path, encoding='utf-8') as filestream:
+        before = json.load(filestream)
+    with open(after_path, encoding='utf-8') as filestream:
+        after = json.load(filestream)
+    previous = {(x['verb'], x['page_size']): x for x in before['results']}
+    print(f'{before["commit"]} -> {after["commit"]}')
+    print(f'{"verb":<22}{"page":>6}{"throughput":>12}{"p50":>10}{"p99":>10}{"ttfb":>10}')
+    for result in after['results']:
+        old = previous.get((result['verb'], result['page_size']))
+        if old is None:
+            continue
+        change = lambda key: f'{(result[key] / old[key] - 1) * 100:+.1f}%' if old[key] else 'n/a'
+        print(f'{result["verb"]:<22}{result["page_size"]:>6}{change("throughput"):>12}{change("p50_ms"):>10}{change("p99_ms"):>10}{change("ttfb_p50_ms"):>10}')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--no-caches', action='store_true', help='disable the fragment and compressed response caches')
+    parser.add_argument('--output', default=str(RESULTS_DIRECTORY))
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    arguments = parser.parse_args()
+    if arguments.compare:
+        compare(*arguments.compare)
+        return
+    result = run(arguments.records, arguments.page_sizes, arguments.requests, not arguments.no_caches)
+    output = pathlib.Path(arguments.output)
+    output.mkdir(parents=True, exist_ok=True)
+    path = output / f'{result["date"].replace(":", "")}-{result["commit"]}.json'
+    with open(path, 'w', encoding='utf-8') as filestream:
+        json.dump(result, filestream, indent=2)
+    print(f'Saved results to {path}')
+
+if __name__ == '__main__':
+    main()
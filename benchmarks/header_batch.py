@@ -0,0 +1,44 @@
+"""
+Compares a list of Header models with a HeaderBatch of the synthetic repository: memory per header and
+the time to write the <header> elements of a ListIdentifiers page.
+
+    python -m benchmarks.header_batch [header count] [page size]
+"""
+import sys
+from timeit import timeit
+import tracemalloc
+
+from flask import render_template_string
+
+from benchmarks import synthetic
+from oai_pmh import APP
+
+HEADER_LOOP = "{% for header in headers %}{% include 'header.xml.jinja' %}{% endfor %}"
+
+def measure(create):
+    tracemalloc.start()
+    try:
+        result = create()
+        return (result, tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+
+def main(header_count: int = 100000, page_size: int = 500, repetitions: int = 20) -> None:
+    APP.config['OAI_SYNTHETIC_RECORDS'] = header_count
+    plugin = synthetic.register()
+    numbers = range(header_count)
+    (models, model_bytes) = measure(lambda: [plugin.create_header(x) for x in numbers])
+    (batch, batch_bytes) = measure(lambda: plugin.create_header_batch(numbers))
+    print(f'{"":<14}{"bytes/header":>14}{"page [ms]":>12}')
+
+    models_page = models[:page_size]
+    batch_page = batch[:page_size]
+    with APP.app_context():
+        template = timeit(lambda: render_template_string(HEADER_LOOP, headers=models_page), number=repetitions) / repetitions * 1000
+        serializer = timeit(lambda: batch_page.to_xml(), number=repetitions) / repetitions * 1000
+    print(f'{"Header list":<14}{model_bytes / header_count:>14.1f}{template:>12.3f}')
+    print(f'{"HeaderBatch":<14}{batch_bytes / header_count:>14.1f}{serializer:>12.3f}')
+    print(f'{"ratio":<14}{model_bytes / batch_bytes:>13.1f}x{template / serializer:>11.1f}x')
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
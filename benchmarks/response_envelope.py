@@ -0,0 +1,52 @@
+"""
+Compares the former to_dict/from_dict response envelope with the current one for every verb.
+
+    python -m benchmarks.response_envelope [repetitions]
+"""
+import sys
+from timeit import timeit
+
+from flask import request
+
+from oai_pmh import APP
+from oai_pmh.routes.oai import create_oai_response
+from oai_pmh.shared.entity_creation import create_base_response
+from oai_pmh.shared.plugin_handler import get_plugin
+from oai_pmh.generated.models import GetRecord, ListIdentifiers, ListMetadataFormats, ListRecords, ListSets, MetadataPrefix, OAIGetRecord, OAIIdentify, OAIListIdentifiers, OAIListMetadataFormats, OAIListRecords, OAIListSets
+
+def round_trip(result, base_response):
+    if isinstance(result, GetRecord):
+        return OAIGetRecord.from_dict(base_response.to_dict() | {'GetRecord': result.to_dict()})
+    elif isinstance(result, ListRecords):
+        return OAIListRecords.from_dict(base_response.to_dict() | {'ListRecords': result.to_dict()})
+    elif isinstance(result, ListIdentifiers):
+        return OAIListIdentifiers.from_dict(base_response.to_dict() | {'ListIdentifiers': result.to_dict()})
+    elif isinstance(result, ListSets):
+        return OAIListSets.from_dict(base_response.to_dict() | {'ListSets': result.to_dict()})
+    elif isinstance(result, ListMetadataFormats):
+        return OAIListMetadataFormats.from_dict(base_response.to_dict() | {'ListMetadataFormats': result.to_dict()})
+    return OAIIdentify.from_dict(base_response.to_dict() | {'Identify': result.to_dict()})
+
+def create_results(plugin, record_count: int) -> dict:
+    records = [plugin.create_record(str(x), MetadataPrefix.OAI_DC) for x in range(record_count)]
+    return {
+        'Identify': plugin.create_identify('http://localhost:5000/default/oai'),
+        'GetRecord': GetRecord(record=records[0]),
+        'ListRecords': ListRecords(record=records),
+        'ListIdentifiers': ListIdentifiers(header=[x.header for x in records]),
+        'ListSets': ListSets(set=plugin.create_sets()),
+        'ListMetadataFormats': ListMetadataFormats(metadataFormat=plugin.create_metadata_formats(None)),
+    }
+
+def main(repetitions: int = 200, record_count: int = 100) -> None:
+    plugin = get_plugin('default')
+    with APP.test_request_context('/default/oai?verb=Identify'):
+        base_response = create_base_response(request)
+        print(f'{"verb":<22}{"before [ms]":>14}{"after [ms]":>14}{"speedup":>10}')
+        for (verb, result) in create_results(plugin, record_count).items():
+            before = timeit(lambda: round_trip(result, base_response.model_copy()), number=repetitions) / repetitions * 1000
+            after = timeit(lambda: create_oai_response(result, base_response.model_copy()), number=repetitions) / repetitions * 1000
+            print(f'{verb:<22}{before:>14.3f}{after:>14.3f}{before / after:>9.1f}x')
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,181 @@
+"""
+A plugin that serves a deterministic repository of OAI_SYNTHETIC_RECORDS generated records for benchmarks.
+Every record is derived from its number and OAI_SYNTHETIC_SEED, so runs are repeatable and nothing has to be stored.
+It is not under oai_pmh/plugins, so deployments never build its index, the benchmarks serve it with `register()`.
+"""
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from random import Random
+from threading import Lock
+from types import ModuleType
+from typing import Any, Iterable, Iterator, Optional
+
+from oai_pmh import APP
+from oai_pmh.shared.crosswalk import CrosswalkPipeline
+from oai_pmh.shared.exceptions import IDDoesNotExistException, NoRecordsMatchException
+from oai_pmh.shared.header_batch import HeaderBatch
+from oai_pmh.shared.plugin_handler import register_plugin
+from oai_pmh.shared.selective import HarvestIndex
+
+from oai_pmh.generated.models import Header, MetadataPrefix, Record, MetadataFormat, Set, Identify
+
+NATIVE_FILTERS = {'from', 'until', 'set'}
+PIPELINE = CrosswalkPipeline('synthetic')
+
+SETS = [
+    ("books", "Books", "Monographs and edited volumes"),
+    ("articles", "Articles", "Journal articles and conference papers"),
+    ("theses", "Theses", "Doctoral and master theses"),
+    ("datasets", "Datasets", "Research data publications")
+]
+WORDS = [
+    'digital', 'library', 'metadata', 'harvesting', 'protocol', 'archive', 'repository', 'history', 'statistics', 'finance',
+    'structure', 'content', 'experience', 'framework', 'community', 'storage', 'rendering', 'object', 'information', 'system',
+    'analysis', 'theory', 'method', 'society', 'culture', 'language', 'network', 'literature', 'model', 'data',
+    'europe', 'century', 'science', 'public', 'research', 'infrastructure', 'access', 'open', 'preservation', 'collection'
+]
+NAMES = ['Dushay', 'Rowling', 'Meier', 'Schmidt', 'Novak', 'Rossi', 'Garcia', 'Nielsen', 'Kowalski', 'Dubois']
+GIVEN_NAMES = ['Naomi', 'Anna', 'Jonas', 'Lea', 'Marko', 'Giulia', 'Pablo', 'Freja', 'Piotr', 'Claire']
+EARLIEST_DATESTAMP = datetime(2000, 1, 1)
+DAYS = (datetime(2024, 1, 1) - EARLIEST_DATESTAMP).days
+IDENTIFIER_PREFIX = 'oai:synthetic:'
+
+# the index and the record count and seed it was built for
+_index: Optional[tuple[tuple[int, int], HarvestIndex]] = None
+_index_lock = Lock()
+
+def get_record_count() -> int:
+    return APP.config.get('OAI_SYNTHETIC_RECORDS', 100_000)
+
+def get_hash(number: int) -> int:
+    seed = APP.config.get('OAI_SYNTHETIC_SEED', 0)
+    return int.from_bytes(blake2b(f'{seed}:{number}'.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def get_number(identifier: str) -> Optional[int]:
+    if not identifier.startswith(IDENTIFIER_PREFIX) or not identifier[len(IDENTIFIER_PREFIX):].isdigit():
+        return None
+    number = int(identifier[len(IDENTIFIER_PREFIX):])
+    return number if number < get_record_count() else None
+
+def create_header_row(number: int) -> tuple[str, datetime, list[str], bool]:
+    """Identifier, datestamp, set specs and deleted flag of a record, cheap enough to index millions of records"""
+    value = get_hash(number)
+    sets = [SETS[(value >> 16) % len(SETS)][0]]
+    if (value >> 24) % 3 == 0 and SETS[(value >> 20) % len(SETS)][0] not in sets:
+        sets.append(SETS[(value >> 20) % len(SETS)][0])
+    return (f'{IDENTIFIER_PREFIX}{number:09d}', EARLIEST_DATESTAMP + timedelta(days=value % DAYS), sets, (value >> 32) % 50 == 0)
+
+def create_row(number: int) -> dict[str, Any]:
+    """A record in the JSON layout of plugins/default/content.json, extended by its sets and deleted flag"""
+    (identifier, datestamp, sets, deleted) = create_header_row(number)
+    random = Random(get_hash(number))
+    row: dict[str, Any] = {'identifier': identifier, 'datestamp': datestamp.strftime('%Y-%m-%d'), 'sets': sets, 'deleted': deleted}
+    if not deleted:
+        row['metadata'] = {
+            'title': [' '.join(random.choices(WORDS, k=random.randint(3, 8))).capitalize()],
+            'creator': [f'{random.choice(NAMES)}, {random.choice(GIVEN_NAMES)}' for _ in range(random.randint(1, 3))],
+            'subject': sorted({x for x in random.choices(WORDS, k=random.randint(1, 3))}),
+            'description': [' '.join(random.choices(WORDS, k=random.randint(20, 80))).capitalize()],
+            'date': [datestamp.strftime('%Y-%m-%d')],
+            'type': sets,
+            'identifier': [f'https://example.org/synthetic/{number}']
+        }
+    return row
+
+def get_index() -> HarvestIndex:
+    """The index is rebuilt when OAI_SYNTHETIC_RECORDS or OAI_SYNTHETIC_SEED change, e.g. by a benchmark after the preload"""
+    global _index
+    key = (get_record_count(), APP.config.get('OAI_SYNTHETIC_SEED', 0))
+    with _index_lock:
+        if _index is None or _index[0] != key:
+            _index = (key, HarvestIndex(create_header_row(number)[:3] for number in range(key[0])))
+        return _index[1]
+
+def preload() -> None:
+    # the index of all records is built at startup instead of on the first request
+    get_index()
+
+def create_header(number: int) -> Header:
+    (identifier, datestamp, sets, deleted) = create_header_row(number)
+    return Header(identifier=identifier, datestamp=datestamp, setSpec=sets, status="deleted" if deleted else None)
+
+def create_record_for_number(number: int, metadata_prefix: MetadataPrefix) -> Record:
+    return create_records_for_numbers([number], metadata_prefix)[0]
+
+def create_records_for_numbers(numbers: Iterable[int], metadata_prefix: MetadataPrefix) -> list[Record]:
+    """Deleted records have no metadata in their row, so the pipeline adds none"""
+    return PIPELINE.create_records(((create_header(x), create_row(x).get('metadata')) for x in numbers), metadata_prefix)
+
+def select(start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str], after: Optional[tuple[datetime, str]] = None, limit: Optional[int] = None) -> Iterator[int]:
+    index = get_index()
+    if set is not None and not index.has_set(set):
+        raise NoRecordsMatchException()
+    return (get_number(index.identifiers[x]) for x in index.select(start_date, end_date, set, after, limit)) # type: ignore
+
+def create_record(identifier: str, metadata_prefix: MetadataPrefix) -> Record:
+    number = get_number(identifier)
+    if number is None:
+        raise IDDoesNotExistException()
+    return create_record_for_number(number, metadata_prefix)
+
+def create_records(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> list[Record]:
+    return create_records_for_numbers(select(start_date, end_date, set), metadata_prefix)
+
+def create_header_batch(numbers: Iterable[int]) -> HeaderBatch:
+    batch = HeaderBatch()
+    for number in numbers:
+        (identifier, datestamp, sets, deleted) = create_header_row(number)
+        batch.append(identifier, datestamp, deleted, sets)
+    return batch
+
+def create_identifiers(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> HeaderBatch:
+    return create_header_batch(select(start_date, end_date, set))
+
+def create_records_page(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> list[Record]:
+    # the whole page is converted at once, so the crosswalks of its records can run in parallel
+    return create_records_for_numbers(select(start_date, end_date, set, after, limit), metadata_prefix)
+
+def create_identifiers_page(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> HeaderBatch:
+    return create_header_batch(select(start_date, end_date, set, after, limit))
+
+def count_records(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> int:
+    return get_index().count(start_date, end_date, set)
+
+def count_identifiers(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> int:
+    return get_index().count(start_date, end_date, set)
+
+def get_record_datestamp(identifier: str) -> Optional[datetime]:
+    number = get_number(identifier)
+    return create_header_row(number)[1] if number is not None else None
+
+def get_repository_version() -> str:
+    return f'{APP.config.get("OAI_SYNTHETIC_SEED", 0)}:{get_record_count()}'
+
+def create_metadata_formats(identifier: str | None) -> list[MetadataFormat]:
+    if identifier is not None and get_number(identifier) is None:
+        raise IDDoesNotExistException
+    return PIPELINE.create_metadata_formats()
+
+def create_sets() -> list[Set]:
+    return [Set(setSpec=spec, setName=name, setDescription=desc) for (spec, name, desc) in SETS]
+
+def create_identify(url) -> Identify:
+    return Identify.from_dict({
+        'baseURL': url,
+        'adminEmail': ["sysadmin@example.de"],
+        'granularity': "YYYY-MM-DD",
+        'repositoryName': "Synthetic Benchmark Repository",
+        "protocolVersion": "2.0",
+        "deletedRecord": 'persistent',
+        'earliestDatestamp': EARLIEST_DATESTAMP,
+        "compression": ["gzip", "br"],
+        'description': ["A deterministic generated repository for benchmarks"]
+    }) # type: ignore
+
+def register() -> ModuleType:
+    """Serves this module as the source synthetic, under the module name register_plugin expects of a plugin"""
+    plugin = ModuleType('oai_pmh.plugins.synthetic.convert', __doc__)
+    for (name, value) in list(globals().items()):
+        if not name.startswith('_') and name != 'register':
+            setattr(plugin, name, value)
+    return register_plugin('synthetic', plugin)
@@ -0,0 +1,79 @@
+"""
+Crosswalks from the Dublin Core metadata of a source record to the XML of the <metadata> element of a metadata format.
+
+The process pool of the crosswalk pipeline in oai_pmh/shared/crosswalk.py imports the converters in its processes,
+so this module must not import the oai_pmh package: importing it builds the flask app, loads every plugin
+and reads the configuration of the server, none of which a conversion needs.
+"""
+from typing import Any, Optional
+from xml.sax.saxutils import escape
+
+# the metadata of a record in the JSON layout of plugins/default/content.json, Dublin Core element names mapped to lists of values
+SourceRecord = dict[str, Any]
+
+# the elements in the order of oai_pmh/templates/dublincore.xml.jinja
+DUBLIN_CORE_ELEMENTS = [
+    'title', 'creator', 'subject', 'description', 'date', 'publisher', 'contributor', 'type',
+    'format', 'identifier', 'source', 'language', 'relation', 'coverage', 'rights'
+]
+
+def get_values(metadata: SourceRecord, element: str) -> list[str]:
+    values = metadata.get(element) or []
+    return [values] if isinstance(values, str) else [str(x) for x in values]
+
+def convert_to_oai_dc(metadata: SourceRecord) -> str:
+    elements = ''.join(f'<dc:{element}>{escape(value)}</dc:{element}>' for element in DUBLIN_CORE_ELEMENTS for value in get_values(metadata, element))
+    return ''.join([
+        '<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/"',
+        ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"',
+        ' xsi:schemaLocation="http://www.openarchives.org/OAI/2.0/oai_dc/ http://www.openarchives.org/OAI/2.0/oai_dc.xsd">',
+        elements,
+        '</oai_dc:dc>'
+    ])
+
+MARC_LEADER = '     nam a22     uu 4500'
+# Dublin Core element, MARC tag, indicators and subfields of the Library of Congress crosswalk from unqualified Dublin Core to MARC 21,
+# the value is written to the first subfield, the other subfields are fixed
+DUBLIN_CORE_TO_MARC: list[tuple[str, str, str, list[tuple[str, Optional[str]]]]] = [
+    ('identifier', '024', '8 ', [('a', None)]),
+    ('language', '546', '  ', [('a', None)]),
+    ('publisher', '260', '  ', [('b', None)]),
+    ('date', '260', '  ', [('c', None)]),
+    ('coverage', '500', '  ', [('a', None)]),
+    ('description', '520', '  ', [('a', None)]),
+    ('rights', '540', '  ', [('a', None)]),
+    ('subject', '653', '  ', [('a', None)]),
+    ('type', '655', ' 7', [('a', None), ('2', 'local')]),
+    ('creator', '720', '  ', [('a', None), ('e', 'author')]),
+    ('contributor', '720', '  ', [('a', None), ('e', 'contributor')]),
+    ('source', '786', '0 ', [('n', None)]),
+    ('relation', '787', '0 ', [('n', None)]),
+    ('format', '856', '  ', [('q', None)]),
+]
+
+def create_datafield(tag: str, indicators: str, subfields: list[tuple[str, str]]) -> str:
+    content = ''.join(f'<marc:subfield code="{code}">{escape(value)}</marc:subfield>' for (code, value) in subfields)
+    return f'<marc:datafield tag="{tag}" ind1="{indicators[0]}" ind2="{indicators[1]}">{content}</marc:datafield>'
+
+def convert_to_marcxml(metadata: SourceRecord) -> str:
+    fields: list[tuple[str, str]] = []
+    titles = get_values(metadata, 'title')
+    if titles:
+        fields.append(('245', create_datafield('245', '00', [('a', titles[0])])))
+        fields.extend(('246', create_datafield('246', '33', [('a', x)])) for x in titles[1:])
+    for (element, tag, indicators, subfields) in DUBLIN_CORE_TO_MARC:
+        for value in get_values(metadata, element):
+            # identifiers that are URLs are electronic locations
+            if element == 'identifier' and value.startswith(('http://', 'https://')):
+                fields.append(('856', create_datafield('856', '40', [('u', value)])))
+                continue
+            fields.append((tag, create_datafield(tag, indicators, [(code, fixed if fixed is not None else value) for (code, fixed) in subfields])))
+    # datafields are ordered by tag, fields with the same tag keep the order of the elements
+    fields.sort(key=lambda x: x[0])
+    return ''.join([
+        '<marc:record xmlns:marc="http://www.loc.gov/MARC21/slim" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"',
+        ' xsi:schemaLocation="http://www.loc.gov/MARC21/slim http://www.loc.gov/standards/marcxml/schema/MARC21slim.xsd">',
+        f'<marc:leader>{MARC_LEADER}</marc:leader>',
+        *(x for (_, x) in fields),
+        '</marc:record>'
+    ])
@@ -2,6 +2,43 @@ from flask import Flask
 
 
 APP = Flask(__name__)
+APP.config.from_mapping(
+    SECRET_KEY='dev',
+    OAI_RESUMPTION_TOKEN_SECRET=None,
+    OAI_RESUMPTION_TOKEN_TTL=24 * 60 * 60,
+    OAI_PAGE_SIZE=100,
+    OAI_STREAMING=False,
+    OAI_STREAM_BUFFER_SIZE=64,
+    OAI_TRUSTED_PLUGINS=[],
+    OAI_FRAGMENT_CACHE_SIZE=64 * 1024 * 1024,
+    OAI_FRAGMENT_CACHE_DIR=None,
+    OAI_FRAGMENT_CACHE_DIR_SIZE=1024 * 1024 * 1024,
+    OAI_COMPRESSION=True,
+    OAI_GZIP_LEVEL=6,
+    OAI_BROTLI_QUALITY=5,
+    OAI_COMPRESSION_CACHE_SIZE=32 * 1024 * 1024,
+    OAI_COMPRESSION_CACHE_TTL=60,
+    OAI_ASGI_THREADS=64,
+    OAI_ASGI_MAX_REQUESTS=256,
+    OAI_METRICS=True,
+    OAI_VALIDATION_SAMPLE_RATE=0.01,
+    OAI_VALIDATION_STRICT=False,
+    OAI_VALIDATION_QUEUE_SIZE=16,
+    OAI_SNAPSHOT_DIR=None,
+    OAI_DATA_DIR=None,
+    OAI_WARM_UP=True,
+    OAI_ADMISSION_LIMIT=8,
+    OAI_ADMISSION_QUEUE_SIZE=32,
+    OAI_ADMISSION_TIMEOUT=5,
+    OAI_PAGE_LATENCY_TARGET=1.0,
+    OAI_MIN_PAGE_SIZE=10,
+    OAI_FEDERATED_SOURCES={},
+    OAI_FEDERATION_THREADS=16,
+    OAI_CROSSWALK_CACHE_SIZE=64 * 1024 * 1024,
+    OAI_CROSSWALK_PROCESSES=None,
+    OAI_CROSSWALK_PARALLEL_THRESHOLD=256,
+)
+APP.config.from_prefixed_env()
 
 
 from .routes import oai
@@ -11,3 +48,5 @@ from .routes import list_records
 from .routes import list_identifiers
 from .routes import list_metadata_formats
 from .routes import list_sets
+from .routes import stats
+from . import commands
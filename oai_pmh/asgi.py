@@ -0,0 +1,156 @@
+"""
+ASGI entry point, e.g. `uvicorn oai_pmh.asgi:ASGI_APP`
+
+An adapter that runs the WSGI app in a thread pool: every request runs the flask app in a thread, so sync plugins never block
+the event loop, and at most OAI_ASGI_THREADS requests run at the same time. Plugin functions defined with `async def` are
+awaited on the event loop of the server, while the thread of the request blocks until they are done. It gives its slot back
+meanwhile, so slow async plugins are not limited by OAI_ASGI_THREADS, but every waiting request still holds a thread of its own,
+at most OAI_ASGI_MAX_REQUESTS of them. Async plugins can only be used with this app, where they can share connections to their
+backend across all requests of the process.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
+from io import BytesIO
+import sys
+from threading import BoundedSemaphore, local
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from . import APP
+from .shared.plugin_handler import set_event_loop
+from .shared.startup import start
+
+T = TypeVar('T')
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+def create_environ(scope: Scope, body: bytes) -> dict[str, Any]:
+    (server_name, server_port) = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for (name, value) in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ['CONTENT_TYPE', 'CONTENT_LENGTH']:
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class RequestSlots:
+    """
+    Bounds the number of request threads that run at the same time. A thread that waits for a coroutine of an async
+    plugin gives its slot back and takes a slot again once the coroutine is done.
+    """
+
+    def __init__(self, size: int):
+        self._semaphore = BoundedSemaphore(size)
+        self._local = local()
+
+    def run(self, function: Callable[..., T], *args: Any) -> T:
+        self._semaphore.acquire()
+        self._local.held = True
+        try:
+            return function(*args)
+        finally:
+            self._local.held = False
+            self._semaphore.release()
+
+    def wait(self, future: 'Future[T]') -> T:
+        # threads that do not run a request, e.g. those of a federated source, have no slot to give back
+        if not getattr(self._local, 'held', False):
+            return future.result()
+        self._local.held = False
+        self._semaphore.release()
+        try:
+            return future.result()
+        finally:
+            self._semaphore.acquire()
+            self._local.held = True
+
+class AsgiApp:
+
+    def __init__(self, wsgi_app: Callable[..., Any], max_threads: int, max_requests: int, startup: Optional[Callable[[], None]] = None):
+        self.wsgi_app = wsgi_app
+        self.startup = startup
+        self.slots = RequestSlots(max_threads)
+        # requests that wait for an async plugin keep their thread, so there are more threads than slots
+        self.executor = ThreadPoolExecutor(max(max_threads, max_requests), thread_name_prefix='oai-pmh')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            set_event_loop(asyncio.get_running_loop(), self.slots.wait)
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                set_event_loop(asyncio.get_running_loop(), self.slots.wait)
+                try:
+                    # runs in a thread, so the preload of an async plugin can await its coroutines on the loop
+                    if self.startup is not None:
+                        await asyncio.get_running_loop().run_in_executor(self.executor, self.startup)
+                except Exception as error: # the server reports the failed startup and exits
+                    await send({'type': 'lifespan.startup.failed', 'message': repr(error)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                set_event_loop(None)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        # flask keeps the request in context variables, every step of a request runs in the same context even though it may run on another thread
+        context = contextvars.copy_context()
+        def run(function: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+            return loop.run_in_executor(self.executor, context.run, self.slots.run, function, *args)
+
+        started: dict[str, Any] = {}
+        def start_response(status: str, headers: list[tuple[str, str]], exc_info: Optional[Any] = None) -> None:
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for (name, value) in headers]
+
+        iterable = await run(self.wsgi_app, create_environ(scope, body), start_response)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            iterator = iter(iterable)
+            while True:
+                chunk = await run(next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(iterable, 'close'):
+                await run(iterable.close)
+
+ASGI_APP = AsgiApp(APP, APP.config['OAI_ASGI_THREADS'], APP.config['OAI_ASGI_MAX_REQUESTS'], start)
@@ -0,0 +1,169 @@
+"""
+Command line interface of the server, e.g. `flask --app oai_pmh build-snapshots default --base-url https://example.org`
+"""
+from datetime import datetime, timezone
+from hashlib import sha1
+from itertools import islice
+from types import ModuleType
+from typing import Iterator, Optional
+
+import click
+from flask import render_template, request
+
+from . import APP
+from .routes.list_identifiers import create_list_identifiers
+from .routes.list_records import create_list_records
+from .routes.oai import create_oai_response, get_template
+from .shared.entity_creation import create_base_response
+from .shared.exceptions import BadResumptionTokenException, NoSetHierarchyException
+from .shared.plugin_handler import get_plugin
+from .shared.resumption import Cursor, decode_cursor, encode_cursor, header_key
+from .shared.selective import filter_pages, split_filters
+from .shared.snapshots import SNAPSHOT_VERBS, Manifest, SnapshotKey, SnapshotPage, get_page_path, get_snapshot_directory, read_manifest, remove_pages, write_manifest, write_page
+from .generated.models import Header, MetadataPrefix, ResumptionToken, Verb
+
+# number of headers that are requested from a plugin at once while the pages of a snapshot are planned
+HEADER_BATCH_SIZE = 1000
+
+def iter_headers(plugin: ModuleType, metadata_prefix: MetadataPrefix, set: Optional[str]) -> Iterator[Header]:
+    """Yields all headers of a harvest ordered by datestamp and identifier"""
+    (filters, matches) = split_filters(plugin, None, None, set)
+    if not hasattr(plugin, 'create_identifiers_page'):
+        headers = [x for x in plugin.create_identifiers(metadata_prefix, *filters) if matches is None or matches(x)]
+        yield from sorted(headers, key=header_key)
+        return
+    after = None
+    while True:
+        page = list(filter_pages(lambda key, limit: plugin.create_identifiers_page(metadata_prefix, *filters, key, limit), lambda x: x, matches, after, HEADER_BATCH_SIZE))
+        yield from page
+        if len(page) < HEADER_BATCH_SIZE:
+            return
+        after = header_key(page[-1])
+
+def plan_pages(plugin: ModuleType, key: SnapshotKey, page_size: int, previous: Optional[Manifest]) -> list[SnapshotPage]:
+    """
+    Splits a harvest into pages and describes every page by a digest of its headers, so pages whose entries did not change
+    are recognized. The resumption token of a page is kept from the previous build as long as the page starts at the same entry.
+    """
+    (source, verb, metadata_prefix, set) = key
+    previous_tokens = {(tuple(x.after), x.offset): x.token for x in previous.pages if x.after is not None and is_snapshot_token(plugin, verb, x.token)} if previous is not None else {}
+    headers = iter_headers(plugin, MetadataPrefix(metadata_prefix), set)
+    pages: list[SnapshotPage] = []
+    after: Optional[list[str]] = None
+    token: Optional[str] = None
+    offset = 0
+    while True:
+        batch = list(islice(headers, page_size))
+        if not batch:
+            return pages
+        digest = sha1()
+        for header in batch:
+            digest.update(f'{header.identifier}\x00{header.datestamp.isoformat()}\x00{header.status}\x00{",".join(header.set_spec or [])}\n'.encode('utf-8'))
+        pages.append(SnapshotPage(after, offset, len(batch), digest.hexdigest(), token))
+        offset += len(batch)
+        after = [batch[-1].datestamp.isoformat(), batch[-1].identifier]
+        token = previous_tokens.get((tuple(after), offset))
+        if token is None:
+            token = encode_cursor(Cursor(verb, plugin.__name__, metadata_prefix, set, last_datestamp=after[0], last_identifier=after[1], offset=offset, snapshot=True))
+
+def is_snapshot_token(plugin: ModuleType, verb: str, token: Optional[str]) -> bool:
+    """Tokens of former builds are only kept if they are still accepted, e.g. not if they were signed with a former secret"""
+    if token is None:
+        return False
+    try:
+        decode_cursor(token, verb, plugin.__name__, snapshot=True)
+    except BadResumptionTokenException:
+        return False
+    return True
+
+def get_following_token(pages: list[SnapshotPage], position: int) -> Optional[str]:
+    """The resumption token a page links to, empty for the last page of an incomplete list and None for a complete list"""
+    if len(pages) == 1:
+        return None
+    return pages[position + 1].token if position + 1 < len(pages) else ''
+
+def create_snapshot_token(pages: list[SnapshotPage], position: int) -> Optional[ResumptionToken]:
+    """Snapshot tokens have neither an expiration date nor a complete list size, so unchanged pages stay valid after a rebuild"""
+    following = get_following_token(pages, position)
+    if following is None:
+        return None
+    return ResumptionToken.from_dict({'cursor': pages[position].offset, 'content': following})
+
+def render_page(plugin: ModuleType, key: SnapshotKey, base_url: str, pages: list[SnapshotPage], position: int) -> bytes:
+    (source, verb, metadata_prefix, set) = key
+    page = pages[position]
+    if page.token is None:
+        arguments = {'verb': verb, 'metadataPrefix': metadata_prefix} | ({'set': set} if set is not None else {})
+    else:
+        arguments = {'verb': verb, 'resumptionToken': page.token}
+    with APP.test_request_context(f'/{source}/oai', base_url=base_url, query_string=arguments):
+        cursor = Cursor(verb, plugin.__name__, metadata_prefix, set,
+            last_datestamp=page.after[0] if page.after is not None else None,
+            last_identifier=page.after[1] if page.after is not None else None,
+            offset=page.offset)
+        create_list = create_list_records if verb == Verb.LISTRECORDS.value else create_list_identifiers
+        result = create_list(plugin, MetadataPrefix(metadata_prefix), None, None, set, cursor)
+        result.resumption_token = create_snapshot_token(pages, position)
+        return render_template(get_template(result), oai_response=create_oai_response(result, create_base_response(request))).encode('utf-8')
+
+def get_request_url(source: str, base_url: str) -> str:
+    with APP.test_request_context(f'/{source}/oai', base_url=base_url):
+        return request.base_url
+
+def build_snapshot(plugin: ModuleType, key: SnapshotKey, directory: str, base_url: str, page_size: int) -> tuple[int, int]:
+    """
+    Writes the pages of a harvest that changed since the previous build and returns the number of pages and of rendered pages.
+    Records are only ordered by datestamp, so a changed record leaves the unchanged pages before its previous position as they are.
+    """
+    snapshot_directory = get_snapshot_directory(directory, key)
+    request_url = get_request_url(key[0], base_url)
+    previous = read_manifest(snapshot_directory)
+    if previous is not None and (previous.base_url != request_url or previous.page_size != page_size):
+        previous = None
+    pages = plan_pages(plugin, key, page_size, previous)
+
+    rendered = 0
+    for (position, page) in enumerate(pages):
+        unchanged = previous is not None and position < len(previous.pages) and previous.pages[position] == page \
+            and get_following_token(previous.pages, position) == get_following_token(pages, position)
+        if unchanged and get_page_path(snapshot_directory, position).exists():
+            continue
+        write_page(snapshot_directory, position, render_page(plugin, key, base_url, pages, position))
+        rendered += 1
+    (source, verb, metadata_prefix, set) = key
+    write_manifest(snapshot_directory, Manifest(source, verb, metadata_prefix, set, request_url, page_size, datetime.now(timezone.utc).isoformat(timespec='seconds'), pages))
+    remove_pages(snapshot_directory, len(pages))
+    return (len(pages), rendered)
+
+@APP.cli.command('build-snapshots')
+@click.argument('source')
+@click.option('--base-url', required=True, help='URL under which the server is reachable, it is part of every page')
+@click.option('--directory', default=None, help='Defaults to OAI_SNAPSHOT_DIR')
+@click.option('--metadata-prefix', 'metadata_prefixes', multiple=True, help='Defaults to all formats of the source')
+@click.option('--set', 'sets', multiple=True, help='Defaults to all sets of the source, the harvest without a set is always built')
+@click.option('--page-size', type=int, default=None, help='Defaults to OAI_PAGE_SIZE')
+def build_snapshots(source: str, base_url: str, directory: Optional[str], metadata_prefixes: tuple[str, ...], sets: tuple[str, ...], page_size: Optional[int]) -> None:
+    """Writes the ListRecords and ListIdentifiers pages of full harvests of a source to disk, only changed pages are rendered again"""
+    directory = directory or APP.config['OAI_SNAPSHOT_DIR']
+    if directory is None:
+        raise click.UsageError('Set OAI_SNAPSHOT_DIR or pass --directory')
+    page_size = page_size or APP.config['OAI_PAGE_SIZE']
+    plugin = get_plugin(source)
+    if plugin is None:
+        raise click.UsageError(f'There is no plugin for the source {source}')
+    APP.config['OAI_STREAMING'] = False
+    APP.config['OAI_PAGE_SIZE'] = page_size
+    # every page of a snapshot has to hold exactly the planned entries
+    APP.config['OAI_PAGE_LATENCY_TARGET'] = None
+    if not metadata_prefixes:
+        metadata_prefixes = tuple(x.metadata_prefix.value for x in plugin.create_metadata_formats(None))
+    if not sets:
+        try:
+            sets = tuple(x.set_spec for x in plugin.create_sets())
+        except NoSetHierarchyException:
+            sets = ()
+    for verb in SNAPSHOT_VERBS:
+        for metadata_prefix in metadata_prefixes:
+            for set in [None, *sets]:
+                (page_count, rendered) = build_snapshot(plugin, (source, verb, metadata_prefix, set), directory, base_url, page_size)
+                click.echo(f'{verb} {metadata_prefix} {set or "(all sets)"}: {page_count} pages, {rendered} rendered')
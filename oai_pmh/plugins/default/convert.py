@@ -1,88 +1,160 @@
 from datetime import datetime
-import json
+import os
 import pathlib
 from random import randint, choice
-from typing import Any, Optional
+import tempfile
+from threading import Lock
+from typing import Any, Iterable, Optional
 
+from ... import APP
+from ...shared.crosswalk import CrosswalkPipeline
 from ...shared.exceptions import IDDoesNotExistException, NoMetadataFormatsException, NoRecordsMatchException
+from ...shared.record_store import RecordStore
 
-from ...generated.models import DublinCoreMetadata, Header, MetadataPrefix, Record, RecordMetadata, MetadataFormat, Set, Identify
+from ...generated.models import Header, MetadataPrefix, Record, MetadataFormat, Set, Identify
 
 
+# from, until and set are all applied by the queries of this plugin
+NATIVE_FILTERS = {'from', 'until', 'set'}
 
-def create_record_metadata(metadata: Optional[dict[str, Any]], metadata_prefix: MetadataPrefix) -> RecordMetadata:
-    # dublincore_metadata = DublinCoreMetadata(\
-    #     title= ['Using Structural Metadata to Localize Experience of Digital Content']\
-    #     creator= ['Dushay, Naomi']\
-    #     subject= ['Digital Libraries']\
-    #     description= ['With the increasing technical sophistication of both information consumers and providers, there is increasing demand for more meaningful experiences of digital information. We present a framework that separates digital object experience, or rendering, from digital object storage and manipulation, so the rendering can be tailored to particular communities of users.', 'Comment: 23 pages including 2 appendices, 8 figures']\
-    #     date= ['2001-12-14']\
-    #     )
-    if metadata is None:
-        metadata = {
-            'title': ['Using Structural Metadata to Localize Experience of Digital Content'],
-            'creator': ['Dushay, Naomi'],
-            'subject': ['Digital Libraries'],
-            'description': ['With the increasing technical sophistication of both information consumers and providers, there is increasing demand for more meaningful experiences of digital information. We present a framework that separates digital object experience, or rendering, from digital object storage and manipulation, so the rendering can be tailored to particular communities of users.', 'Comment: 23 pages including 2 appendices, 8 figures'],
-            'date': ['2001-12-14']
-        }
-    return RecordMetadata(dublincore=DublinCoreMetadata.from_dict(metadata))
+PLUGIN_DIRECTORY = pathlib.Path(__file__).parent.resolve()
+# every registered metadata format is converted from the Dublin Core metadata of the records
+PIPELINE = CrosswalkPipeline('default')
+# metadata of the records that are not in the record store
+MOCK_METADATA = {
+    'title': ['Using Structural Metadata to Localize Experience of Digital Content'],
+    'creator': ['Dushay, Naomi'],
+    'subject': ['Digital Libraries'],
+    'description': ['With the increasing technical sophistication of both information consumers and providers, there is increasing demand for more meaningful experiences of digital information. We present a framework that separates digital object experience, or rendering, from digital object storage and manipulation, so the rendering can be tailored to particular communities of users.', 'Comment: 23 pages including 2 appendices, 8 figures'],
+    'date': ['2001-12-14']
+}
+
+_store: Optional[RecordStore] = None
+_store_lock = Lock()
+
+def get_store_path() -> pathlib.Path:
+    """The record store is written to OAI_DATA_DIR, by default the instance folder of the app, never into the installed package"""
+    return pathlib.Path(APP.config['OAI_DATA_DIR'] or APP.instance_path) / 'default' / 'records.sqlite3'
+
+def get_store() -> RecordStore:
+    """Opens the record store, it is rebuilt from the <set>.json files whenever one of them is newer"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store_path = get_store_path()
+            sources = [PLUGIN_DIRECTORY / f'{set.set_spec}.json' for set in create_sets()]
+            if not store_path.exists() or any(x.stat().st_mtime > store_path.stat().st_mtime for x in sources):
+                store_path.parent.mkdir(parents=True, exist_ok=True)
+                # built next to the store and moved in place, so other workers never open a half built store
+                (handle, build_path) = tempfile.mkstemp(suffix='.tmp', dir=store_path.parent)
+                os.close(handle)
+                store = RecordStore(build_path)
+                for set in create_sets():
+                    store.add_set(set.set_spec, set.set_name, set.set_description)
+                    store.load_json(PLUGIN_DIRECTORY / f'{set.set_spec}.json', set.set_spec)
+                store.close()
+                os.replace(build_path, store_path)
+            _store = RecordStore(store_path)
+        return _store
+
+def preload() -> None:
+    # builds the record store before a prefork server forks, the connection of this thread is closed because sqlite connections must not be used across a fork
+    get_store().close()
+
+def create_record_from_row(row: dict[str, Any], metadata_prefix: MetadataPrefix) -> Record:
+    return create_records_from_rows([row], metadata_prefix)[0]
+
+def create_records_from_rows(rows: Iterable[dict[str, Any]], metadata_prefix: MetadataPrefix) -> list[Record]:
+    """The metadata of the rows is converted into the requested format by the crosswalk pipeline, deleted rows have none"""
+    return PIPELINE.create_records(((create_header_from_row(x), None if x['deleted'] else x['metadata'] or {}) for x in rows), metadata_prefix)
+
+def create_header_from_row(row: dict[str, Any]) -> Header:
+    return create_header(row['identifier'], row['datestamp'], row['deleted'], row['sets'])
 
 def create_header(identifier: str, datestamp: datetime, deleted: Optional[bool] = False, set: Optional[list[str]] = None) -> Header:
     return Header(identifier=identifier, datestamp=datestamp, setSpec=set or None, status="deleted" if deleted else None)
 
 def create_record(identifier: str, metadata_prefix: MetadataPrefix) -> Record:
-    has_body = randint(1,7) % 7 != 0
-    header = create_header(identifier, datetime(randint(1970, 2022), randint(1,12), randint(1, 28)), deleted=not has_body)
-    record = Record(header=header)
-    if has_body:
-        record.metadata = create_record_metadata(None, metadata_prefix)
+    row = get_store().get(identifier)
+    if row is not None:
+        return create_record_from_row(row, metadata_prefix)
+    header = create_header(identifier, datetime(randint(1970, 2022), randint(1,12), randint(1, 28)), deleted=randint(1,7) % 7 == 0)
+    return create_mock_record(header, metadata_prefix)
+
+def create_mock_record(header: Header, metadata_prefix: MetadataPrefix) -> Record:
+    record = PIPELINE.create_record(header, MOCK_METADATA if header.status is None else None, metadata_prefix)
+    if header.status is None:
         if randint(1,5) % 5 == 0:
             record.about = '<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://www.openarchives.org/OAI/2.0/oai_dc/ http://www.openarchives.org/OAI/2.0/oai_dc.xsd"> <dc:publisher>Los Alamos arXiv</dc:publisher> <dc:rights>Metadata may be used without restrictions as long as the oai identifier remains attached to it.</dc:rights> </oai_dc:dc>'
     return record
-    
+
 def create_records(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> list[Record]:
     if set is not None:
-        if set not in [set.set_spec for set in create_sets()]:
+        if not get_store().has_set(set):
             raise NoRecordsMatchException()
-        filestream = open (f'{pathlib.Path(__file__).parent.resolve()}/{set}.json', "r")
-        data = json.loads(filestream.read())
-        return [Record(header=create_header(x.get("identifier"), datetime.strptime(x.get('datestamp'), "%Y-%m-%d")), metadata=create_record_metadata(x.get('metadata'), metadata_prefix)) for x in data]
+        return create_records_from_rows(get_store().find(start_date, end_date, set), metadata_prefix)
     else:
-        records = [create_record(str(randint(100_000_000, 1_000_000_000)), metadata_prefix) for x in range(1, randint(1,100))]
-        if start_date is not None:
-            records = [x for x in records if x.header.datestamp >= start_date]
-        if end_date is not None:
-            records = [x for x in records if x.header.datestamp <= end_date]
-        return records
+        # the headers are filtered first, so records are only built for the ones that match
+        return [create_mock_record(x, metadata_prefix) for x in create_identifiers(metadata_prefix, start_date, end_date, set)]
 
 def create_identifiers(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> list[Header]:
     if set is not None:
-        if set not in [set.set_spec for set in create_sets()]:
+        if not get_store().has_set(set):
             raise NoRecordsMatchException()
-        filestream = open (f'{pathlib.Path(__file__).parent.resolve()}/{set}.json', "r")
-        data = json.loads(filestream.read())
-        return [create_header(x.get("identifier"), datetime.strptime(x.get('datestamp'), "%Y-%m-%d")) for x in data]
+        return [create_header_from_row(x) for x in get_store().find(start_date, end_date, set)]
     else:
         headers = [
                 create_header(str(randint(100_000_000, 1_000_000_000)),
                 datetime(randint(1970, 2022), randint(1,12), randint(1, 28)),
                 deleted=randint(1,7) % 7 == 0
             ) for x in range(1, randint(1,100))]
-        if start_date is not None:
-            headers = [x for x in headers if x.datestamp >= start_date]
-        if end_date is not None:
-            headers = [x for x in headers if x.datestamp <= end_date]
-        return headers
+        return [x for x in headers if (start_date is None or x.datestamp >= start_date) and (end_date is None or x.datestamp <= end_date)]
+
+def create_records_page(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> list[Record]:
+    """Optional paged variant of create_records: at most `limit` records ordered by (datestamp, identifier) that come after `after`"""
+    if set is not None:
+        if not get_store().has_set(set):
+            raise NoRecordsMatchException()
+        return create_records_from_rows(get_store().find(start_date, end_date, set, after, limit), metadata_prefix)
+    records = sorted(create_records(metadata_prefix, start_date, end_date, set), key=lambda x: (x.header.datestamp, x.header.identifier))
+    return [x for x in records if after is None or (x.header.datestamp, x.header.identifier) > after][:limit]
+
+def create_identifiers_page(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> list[Header]:
+    """Optional paged variant of create_identifiers: at most `limit` headers ordered by (datestamp, identifier) that come after `after`"""
+    if set is not None:
+        if not get_store().has_set(set):
+            raise NoRecordsMatchException()
+        return [create_header_from_row(x) for x in get_store().find(start_date, end_date, set, after, limit)]
+    headers = sorted(create_identifiers(metadata_prefix, start_date, end_date, set), key=lambda x: (x.datestamp, x.identifier))
+    return [x for x in headers if after is None or (x.datestamp, x.identifier) > after][:limit]
+
+def count_records(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> Optional[int]:
+    """Optional: the size of the complete list, None if it is not known"""
+    if set is not None and get_store().has_set(set):
+        return get_store().count(start_date, end_date, set)
+    return None
+
+def count_identifiers(metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> Optional[int]:
+    return count_records(metadata_prefix, start_date, end_date, set)
+
+def get_record_datestamp(identifier: str) -> Optional[datetime]:
+    """Optional: the datestamp of a record without building it, used to answer conditional GetRecord requests"""
+    row = get_store().get(identifier)
+    return row['datestamp'] if row is not None else None
+
+def get_repository_version() -> str:
+    """Optional: changes whenever Identify, ListSets or ListMetadataFormats change, used to answer conditional requests"""
+    get_store()
+    return str(get_store_path().stat().st_mtime_ns)
 
 def create_metadata_formats(identifier: str | None) -> list[MetadataFormat]:
     if identifier is None:
-        return [MetadataFormat(metadataPrefix=MetadataPrefix.OAI_DC, metadataNamespace="http://www.openarchives.org/OAI/2.0/oai_dc/", schema="http://www.openarchives.org/OAI/2.0/oai_dc.xsd")] # type: ignore
+        return PIPELINE.create_metadata_formats()
     return create_metadata_formats_for_record(identifier)
 
 def create_metadata_formats_for_record(identifier: str | None) -> list[MetadataFormat]:
     if choice([True,True,True,True,True,True,True,True,False]):
-        return [MetadataFormat(metadataPrefix=MetadataPrefix.OAI_DC, metadataNamespace="http://www.openarchives.org/OAI/2.0/oai_dc/", schema="http://www.openarchives.org/OAI/2.0/oai_dc.xsd")] # type: ignore
+        return PIPELINE.create_metadata_formats()
     if choice([True,True,True,True,True,True,True,True,False]):
         raise NoMetadataFormatsException
     raise IDDoesNotExistException
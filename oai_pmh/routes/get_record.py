@@ -1,13 +1,15 @@
 from types import ModuleType
+from flask import g
 
-from ..shared.entity_creation import create_error
+from ..shared.entity_creation import create_error, create_verb_object
 from ..shared.exceptions import CannotDissemintateFormatException, IDDoesNotExistException
 from ..generated.models import Error, ErrorCode, GetRecord, MetadataPrefix
 
 
 def create_get_record(plugin: ModuleType, identifier: str, metadata_prefix: MetadataPrefix) -> GetRecord:
+    g.metadata_prefix = metadata_prefix.value
     record = plugin.create_record(identifier, metadata_prefix)
-    return GetRecord(record=record)
+    return create_verb_object(plugin, GetRecord, record=record)
 
 def response_or_error(plugin: ModuleType, identifier: str | None, metadata_prefix: str | None) -> GetRecord | Error:
 
@@ -2,28 +2,85 @@ from datetime import datetime
 from types import ModuleType
 from typing import Optional
 
-from ..shared.entity_creation import create_error
-from ..shared.exceptions import NoRecordsMatchException
-from ..generated.models import Error, ErrorCode, ListIdentifiers, MetadataPrefix
+from .. import APP
+from ..shared.admission import get_page_size
+from ..shared.entity_creation import create_error, create_verb_object
+from ..shared.exceptions import BadResumptionTokenException, NoRecordsMatchException
+from ..shared.resumption import Cursor, create_resumption_token, decode_cursor, header_key, slice_page
+from ..shared.header_batch import HeaderBatch
+from ..shared.selective import filter_pages, server_filters, split_filters, to_utc
+from ..shared.streaming import PageStream, StreamedListIdentifiers
+from ..generated.models import Error, ErrorCode, Header, ListIdentifiers, MetadataPrefix, ResumptionToken, Verb
 
-def create_list_identifiers(plugin: ModuleType, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> ListIdentifiers:
+def create_list_identifiers(plugin: ModuleType, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, cursor: Optional[Cursor] = None) -> ListIdentifiers | StreamedListIdentifiers:
 
-    headers = plugin.create_identifiers(metadata_prefix, start_date, end_date, set)
+    page_size = get_page_size(plugin, Verb.LISTIDENTIFIERS.value)
+    after = cursor.after() if cursor is not None else None
+    complete_list_size = cursor.complete_list_size if cursor is not None else None
+    (filters, matches) = split_filters(plugin, start_date, end_date, set)
+    if hasattr(plugin, 'create_identifiers_page'):
+        headers = filter_pages(lambda key, limit: plugin.create_identifiers_page(metadata_prefix, *filters, key, limit), lambda x: x, matches, after, page_size + 1)
+        if cursor is None and matches is None and hasattr(plugin, 'count_identifiers'):
+            complete_list_size = plugin.count_identifiers(metadata_prefix, start_date, end_date, set)
+    else:
+        headers = plugin.create_identifiers(metadata_prefix, *filters)
+        if isinstance(headers, HeaderBatch):
+            # the columns are filtered, sorted and sliced without building a single header
+            headers = headers.select(*server_filters(plugin, start_date, end_date, set)).sorted()
+            complete_list_size = len(headers)
+            headers = headers.page(after, page_size + 1)
+        else:
+            headers = [x for x in headers if matches is None or matches(x)]
+            headers, complete_list_size = slice_page(headers, header_key, after, page_size + 1)
+
+    def create_token(last: Optional[Header], count: int, has_more: bool) -> Optional[ResumptionToken]:
+        if not has_more or last is None:
+            return create_resumption_token(cursor, None, complete_list_size)
+        base = cursor or Cursor(Verb.LISTIDENTIFIERS.value, plugin.__name__, metadata_prefix.value, set,
+            start_date.isoformat() if start_date is not None else None,
+            end_date.isoformat() if end_date is not None else None,
+            complete_list_size=complete_list_size)
+        return create_resumption_token(cursor, base.advance(last.datestamp, last.identifier, count), complete_list_size)
+
+    if APP.config['OAI_STREAMING']:
+        stream = PageStream(headers, page_size, create_token)
+        if stream.is_empty():
+            raise NoRecordsMatchException()
+        return StreamedListIdentifiers(stream)
+
+    if not isinstance(headers, HeaderBatch):
+        headers = list(headers)
     if len(headers) == 0:
         raise NoRecordsMatchException()
-    return ListIdentifiers(header=headers, resumptionToken=None)
+    has_more = len(headers) > page_size
+    headers = headers[:page_size]
+    token = create_token(headers[-1], len(headers), has_more)
+    if isinstance(headers, HeaderBatch):
+        # a batch is written by its own serializer, so it is not validated as a list of Header models
+        return ListIdentifiers.model_construct(header=headers, resumptionToken=token)
+    return create_verb_object(plugin, ListIdentifiers, header=headers, resumptionToken=token)
 
-def resume_list_identifiers(resumptionToken: str) -> ListIdentifiers | Error:
-    return create_error(ErrorCode.BADRESUMPTIONTOKEN, 'Resumption tokens are not supported yet') # type: ignore
+def resume_list_identifiers(plugin: ModuleType, resumption_token: str) -> ListIdentifiers | StreamedListIdentifiers | Error:
+    try:
+        cursor = decode_cursor(resumption_token, Verb.LISTIDENTIFIERS.value, plugin.__name__)
+        start_date = datetime.fromisoformat(cursor.fr0m) if cursor.fr0m is not None else None
+        end_date = datetime.fromisoformat(cursor.until) if cursor.until is not None else None
+        return create_list_identifiers(plugin, MetadataPrefix(cursor.metadata_prefix), start_date, end_date, cursor.set, cursor)
+    except (BadResumptionTokenException, ValueError):
+        return create_error(ErrorCode.BADRESUMPTIONTOKEN, f'The resumption token is invalid or has expired') # type: ignore
+    except NoRecordsMatchException:
+        return create_error(ErrorCode.NORECORDSMATCH, f'No identifiers in the repository match the selected criteria') # type: ignore
 
-def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metadata_prefix: Optional[str],  fr0m: Optional[str] = None, until: Optional[str] = None, set: Optional[str] = None) -> ListIdentifiers | Error:
+def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metadata_prefix: Optional[str],  fr0m: Optional[str] = None, until: Optional[str] = None, set: Optional[str] = None) -> ListIdentifiers | StreamedListIdentifiers | Error:
     if metadata_prefix is None and resumption_token is None:
         return create_error(ErrorCode.BADARGUMENT, f'Request with verb "ListIdentifiers" requires exactly one of the following query parameters: "metadataPrefix" or "resumptionToken"') # type: ignore
     if metadata_prefix is not None and resumption_token is not None:
         return create_error(ErrorCode.BADARGUMENT, f'Request with verb "ListIdentifiers" can only have ONE of the following query parameters: "metadataPrefix" or "resumptionToken"') # type: ignore
 
     if resumption_token is not None:
-        return resume_list_identifiers(resumption_token)
+        if fr0m is not None or until is not None or set is not None:
+            return create_error(ErrorCode.BADARGUMENT, f'The query parameter "resumptionToken" is exclusive and can not be combined with "from", "until" or "set"') # type: ignore
+        return resume_list_identifiers(plugin, resumption_token)
 
     if metadata_prefix is None:
         return create_error(ErrorCode.BADARGUMENT, 'Missing required query parameter: "metadataPrefix"') # type: ignore
@@ -32,12 +89,12 @@ def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metad
     start_date = end_date = None
     if fr0m is not None:
         try:
-            start_date = datetime.fromisoformat(fr0m)
+            start_date = to_utc(datetime.fromisoformat(fr0m))
         except:
             return create_error(ErrorCode.BADARGUMENT, f'The following value is not a valid "from" datetime: "{fr0m}"') # type: ignore
     if until is not None:
         try:
-            end_date = datetime.fromisoformat(until)
+            end_date = to_utc(datetime.fromisoformat(until))
         except:
             return create_error(ErrorCode.BADARGUMENT, f'The following value is not a valid "until" datetime: "{until}"') # type: ignore
 
@@ -1,13 +1,13 @@
 from types import ModuleType
 
-from ..shared.entity_creation import create_error
+from ..shared.entity_creation import create_error, create_verb_object
 from ..shared.exceptions import IDDoesNotExistException, NoMetadataFormatsException
 from ..generated.models import Error, ErrorCode, ListMetadataFormats
 
 
 def create_list_metadata_formats(plugin: ModuleType, identifier: str | None) -> ListMetadataFormats:
     metadata_formats = plugin.create_metadata_formats(identifier)
-    return ListMetadataFormats(metadataFormat=metadata_formats)
+    return create_verb_object(plugin, ListMetadataFormats, metadataFormat=metadata_formats)
 
 def response_or_error(plugin: ModuleType, identifier: str | None) -> ListMetadataFormats | Error:
 
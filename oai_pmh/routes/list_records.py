@@ -1,30 +1,78 @@
 from datetime import datetime
 from types import ModuleType
 from typing import Optional
+from flask import g
 
-from ..shared.entity_creation import create_error
-from ..shared.exceptions import NoRecordsMatchException
-from ..generated.models import Error, ErrorCode, ListRecords, MetadataPrefix
+from .. import APP
+from ..shared.admission import get_page_size
+from ..shared.entity_creation import create_error, create_verb_object
+from ..shared.exceptions import BadResumptionTokenException, CannotDissemintateFormatException, NoRecordsMatchException
+from ..shared.resumption import Cursor, create_resumption_token, decode_cursor, header_key, slice_page
+from ..shared.selective import filter_pages, split_filters, to_utc
+from ..shared.streaming import PageStream, StreamedListRecords
+from ..generated.models import Error, ErrorCode, ListRecords, MetadataPrefix, Record, ResumptionToken, Verb
 
 
-def create_list_records(plugin: ModuleType, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> ListRecords:
+def create_list_records(plugin: ModuleType, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, cursor: Optional[Cursor] = None) -> ListRecords | StreamedListRecords:
 
-    records = plugin.create_records(metadata_prefix, start_date, end_date, set)
+    g.metadata_prefix = metadata_prefix.value
+    page_size = get_page_size(plugin, Verb.LISTRECORDS.value)
+    after = cursor.after() if cursor is not None else None
+    complete_list_size = cursor.complete_list_size if cursor is not None else None
+    (filters, matches) = split_filters(plugin, start_date, end_date, set)
+    if hasattr(plugin, 'create_records_page'):
+        records = filter_pages(lambda key, limit: plugin.create_records_page(metadata_prefix, *filters, key, limit), lambda x: x.header, matches, after, page_size + 1)
+        if cursor is None and matches is None and hasattr(plugin, 'count_records'):
+            complete_list_size = plugin.count_records(metadata_prefix, start_date, end_date, set)
+    else:
+        records = [x for x in plugin.create_records(metadata_prefix, *filters) if matches is None or matches(x.header)]
+        records, complete_list_size = slice_page(records, lambda x: header_key(x.header), after, page_size + 1)
+
+    def create_token(last: Optional[Record], count: int, has_more: bool) -> Optional[ResumptionToken]:
+        if not has_more or last is None:
+            return create_resumption_token(cursor, None, complete_list_size)
+        base = cursor or Cursor(Verb.LISTRECORDS.value, plugin.__name__, metadata_prefix.value, set,
+            start_date.isoformat() if start_date is not None else None,
+            end_date.isoformat() if end_date is not None else None,
+            complete_list_size=complete_list_size)
+        return create_resumption_token(cursor, base.advance(last.header.datestamp, last.header.identifier, count), complete_list_size)
+
+    if APP.config['OAI_STREAMING']:
+        stream = PageStream(records, page_size, create_token)
+        if stream.is_empty():
+            raise NoRecordsMatchException()
+        return StreamedListRecords(stream)
+
+    records = list(records)
     if len(records) == 0:
         raise NoRecordsMatchException()
-    return ListRecords(record=records, resumptionToken=None)
+    has_more = len(records) > page_size
+    records = records[:page_size]
+    return create_verb_object(plugin, ListRecords, record=records, resumptionToken=create_token(records[-1], len(records), has_more))
 
-def resume_list_records(resumptionToken: str) -> ListRecords | Error:
-    return create_error(ErrorCode.BADRESUMPTIONTOKEN, 'Resumption tokens are not supported yet') # type: ignore
+def resume_list_records(plugin: ModuleType, resumption_token: str) -> ListRecords | StreamedListRecords | Error:
+    try:
+        cursor = decode_cursor(resumption_token, Verb.LISTRECORDS.value, plugin.__name__)
+        start_date = datetime.fromisoformat(cursor.fr0m) if cursor.fr0m is not None else None
+        end_date = datetime.fromisoformat(cursor.until) if cursor.until is not None else None
+        return create_list_records(plugin, MetadataPrefix(cursor.metadata_prefix), start_date, end_date, cursor.set, cursor)
+    except (BadResumptionTokenException, ValueError):
+        return create_error(ErrorCode.BADRESUMPTIONTOKEN, f'The resumption token is invalid or has expired') # type: ignore
+    except NoRecordsMatchException:
+        return create_error(ErrorCode.NORECORDSMATCH, f'No records in the repository match the selected criteria') # type: ignore
+    except CannotDissemintateFormatException:
+        return create_error(ErrorCode.CANNOTDISSEMINATEFORMAT, f'The metadata format "{cursor.metadata_prefix}" is not available from this repository') # type: ignore
 
-def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metadata_prefix: Optional[str],  fr0m: Optional[str] = None, until: Optional[str] = None, set: Optional[str] = None) -> ListRecords | Error:
+def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metadata_prefix: Optional[str],  fr0m: Optional[str] = None, until: Optional[str] = None, set: Optional[str] = None) -> ListRecords | StreamedListRecords | Error:
     if metadata_prefix is None and resumption_token is None:
         return create_error(ErrorCode.BADARGUMENT, f'Request with verb "ListRecords" requires exactly one of the following query parameters: "metadataPrefix" or "resumptionToken"') # type: ignore
     if metadata_prefix is not None and resumption_token is not None:
         return create_error(ErrorCode.BADARGUMENT, f'Request with verb "ListRecords" can only have ONE of the following query parameters: "metadataPrefix" or "resumptionToken"') # type: ignore
 
     if resumption_token is not None:
-        return resume_list_records(resumption_token)
+        if fr0m is not None or until is not None or set is not None:
+            return create_error(ErrorCode.BADARGUMENT, f'The query parameter "resumptionToken" is exclusive and can not be combined with "from", "until" or "set"') # type: ignore
+        return resume_list_records(plugin, resumption_token)
     
     if metadata_prefix is None:
         return create_error(ErrorCode.BADARGUMENT, 'Missing required query parameter: "metadataPrefix"') # type: ignore
@@ -34,12 +82,12 @@ def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metad
     start_date = end_date = None
     if fr0m is not None:
         try:
-            start_date = datetime.fromisoformat(fr0m)
+            start_date = to_utc(datetime.fromisoformat(fr0m))
         except:
             return create_error(ErrorCode.BADARGUMENT, f'The following value is not a valid "from" datetime: "{fr0m}"') # type: ignore
     if until is not None:
         try:
-            end_date = datetime.fromisoformat(until)
+            end_date = to_utc(datetime.fromisoformat(until))
         except:
             return create_error(ErrorCode.BADARGUMENT, f'The following value is not a valid "until" datetime: "{until}"') # type: ignore
 
@@ -47,5 +95,6 @@ def response_or_error(plugin: ModuleType, resumption_token: Optional[str], metad
         return create_list_records(plugin, MetadataPrefix(metadata_prefix), start_date, end_date, set) # type: ignore
     except NoRecordsMatchException:
         return create_error(ErrorCode.NORECORDSMATCH, f'No records in the repository match the selected criteria') # type: ignore
+    except CannotDissemintateFormatException:
+        return create_error(ErrorCode.CANNOTDISSEMINATEFORMAT, f'The metadata format "{metadata_prefix}" is not available from this repository') # type: ignore
 
-    
\ No newline at end of file
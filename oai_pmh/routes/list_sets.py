@@ -1,24 +1,43 @@
 from types import ModuleType
 from typing import Optional
 
-from ..shared.entity_creation import create_error
-from ..shared.exceptions import NoSetHierarchyException
-from ..generated.models import Error, ErrorCode, ListSets
-
-
-def create_list_sets(plugin: ModuleType) -> ListSets:
-
-    sets = plugin.create_sets()
+from .. import APP
+from ..shared.entity_creation import create_error, create_verb_object
+from ..shared.exceptions import BadResumptionTokenException, NoSetHierarchyException
+from ..shared.resumption import Cursor, create_resumption_token, decode_cursor, slice_page
+from ..generated.models import Error, ErrorCode, ListSets, Verb
+
+
+def create_list_sets(plugin: ModuleType, cursor: Optional[Cursor] = None) -> ListSets:
+
+    page_size = APP.config['OAI_PAGE_SIZE']
+    after = cursor.last_identifier if cursor is not None else None
+    if hasattr(plugin, 'create_sets_page'):
+        sets = plugin.create_sets_page(after, page_size + 1)
+        complete_list_size = cursor.complete_list_size if cursor is not None else None
+    else:
+        sets, complete_list_size = slice_page(plugin.create_sets() or [], lambda x: x.set_spec, after, page_size + 1)
     if not sets or len(sets) == 0:
         raise NoSetHierarchyException
-    return ListSets(set=sets, resumptionToken=None)
 
-def resume_list_sets(resumptionToken: str) -> ListSets | Error:
-    return create_error(ErrorCode.BADRESUMPTIONTOKEN, 'Resumption tokens are not supported yet') # type: ignore
+    next_cursor = None
+    if len(sets) > page_size:
+        sets = sets[:page_size]
+        base = cursor or Cursor(Verb.LISTSETS.value, plugin.__name__, complete_list_size=complete_list_size)
+        next_cursor = base.advance(None, sets[-1].set_spec, len(sets))
+    return create_verb_object(plugin, ListSets, set=sets, resumptionToken=create_resumption_token(cursor, next_cursor, complete_list_size))
+
+def resume_list_sets(plugin: ModuleType, resumption_token: str) -> ListSets | Error:
+    try:
+        return create_list_sets(plugin, decode_cursor(resumption_token, Verb.LISTSETS.value, plugin.__name__))
+    except BadResumptionTokenException:
+        return create_error(ErrorCode.BADRESUMPTIONTOKEN, f'The resumption token is invalid or has expired') # type: ignore
+    except NoSetHierarchyException:
+        return create_error(ErrorCode.NOSETHIERARCHY, f'This repository does not support sets') # type: ignore
 
 def response_or_error(plugin: ModuleType, resumption_token: Optional[str]) -> ListSets | Error:
     if resumption_token is not None:
-        return resume_list_sets(resumption_token)
+        return resume_list_sets(plugin, resumption_token)
 
     try:
         return create_list_sets(plugin)
@@ -1,17 +1,25 @@
 from io import BytesIO
+from time import perf_counter
 from types import ModuleType
 from typing import Optional
-from flask import redirect, render_template, make_response, request, url_for, send_file
-from xmlschema import XMLSchema
+from flask import Response, g, redirect, render_template, make_response, request, url_for
 
 from . import identify, get_record, list_records, list_identifiers, list_metadata_formats, list_sets
 
+from ..shared import fragment_cache # registers the render_record template global
+from ..shared.admission import get_admission, observe_page, observe_page_cost, overloaded_response
+from ..shared.conditional import get_validators, is_not_modified, not_modified_response, set_validators
+from ..shared.compression import cached_response, compress_response, get_cache_key, negotiate_encoding
 from ..shared.entity_creation import create_base_response, create_error
-from ..shared.plugin_handler import get_plugin
+from ..shared.metrics import observe_result, phase
+from ..shared.plugin_handler import get_plugin, get_sources
+from ..shared.snapshots import snapshot_response
+from ..shared.streaming import StreamedListIdentifiers, StreamedListRecords, stream_xml
+from ..shared.validation import validate_response
 from .. import APP
 from ..generated.models import Error, ErrorCode, MetadataPrefix, Verb, ListIdentifiers, ListRecords, ListMetadataFormats, ListSets, GetRecord, Identify, OAIListIdentifiers, OAIListRecords, OAIListMetadataFormats, OAIListSets, OAIGetRecord, OAIIdentify, OAIPMH
 
-GenericOAIObject = ListIdentifiers | ListRecords | ListMetadataFormats | ListSets | GetRecord | Identify
+GenericOAIObject = ListIdentifiers | ListRecords | ListMetadataFormats | ListSets | GetRecord | Identify | StreamedListIdentifiers | StreamedListRecords
 GenericOAIResponse = OAIListIdentifiers | OAIListRecords | OAIListMetadataFormats | OAIListSets | OAIGetRecord | OAIIdentify | OAIPMH
 
 @APP.route("/")
@@ -20,7 +28,7 @@ def redirect_root():
 
 @APP.route("/<source>/")
 def redirect_source_root(source: str):
-    if source not in ['favicon.ico']:
+    if source in get_sources():
         return redirect(f'/{source}/oai?verb=Identify')
     return make_response('Not Found', 404)
 
@@ -28,6 +36,48 @@ def redirect_source_root(source: str):
 def oai_get(source: str):
 
     plugin = get_plugin(source)
+    if plugin is None:
+        return make_response('Not Found', 404)
+    snapshot = snapshot_response(plugin, source)
+    if snapshot is not None:
+        return snapshot
+
+    admission = get_admission(source)
+    if admission is not None and not admission.acquire():
+        return overloaded_response(admission)
+    start = perf_counter()
+    try:
+        response = create_response(plugin, source)
+    except BaseException:
+        if admission is not None:
+            admission.release(perf_counter() - start)
+        raise
+
+    # a streamed page is produced while it is sent, so its cost is only known once it is closed
+    verb = request.args.get('verb')
+    result = g.get('page_result')
+    if not response.is_streamed:
+        observe_page_cost(source, verb, result, perf_counter() - start)
+    def finish() -> None:
+        if response.is_streamed:
+            observe_page_cost(source, verb, result, perf_counter() - start)
+        if admission is not None:
+            admission.release(perf_counter() - start)
+    response.call_on_close(finish)
+    return response
+
+def create_response(plugin: ModuleType, source: str) -> Response:
+    with phase('validation'):
+        validators = get_validators(plugin, source)
+    if validators is not None and is_not_modified(validators):
+        return not_modified_response(validators)
+
+    encoding = negotiate_encoding()
+    cache_key = get_cache_key(plugin, source, encoding)
+    cached = cached_response(cache_key)
+    if cached is not None:
+        return set_validators(cached, validators)
+
     verb = request.args.get('verb')
     resumption_token = request.args.get('resumptionToken')
     metadata_prefix = request.args.get('metadataPrefix')
@@ -39,34 +89,42 @@ def oai_get(source: str):
     s3t = request.args.get('set')
 
 
-    result = response_or_error(plugin, verb, resumption_token, metadata_prefix, identifier, fr0m, until, s3t)
+    with phase('validation'):
+        result = response_or_error(plugin, verb, resumption_token, metadata_prefix, identifier, fr0m, until, s3t)
+    observe_result(result)
+    observe_page(result)
 
-    if isinstance(result, Error):
-        base_response = create_base_response(request, result)
-    else:
-        base_response = create_base_response(request)
+    with phase('envelope'):
+        if isinstance(result, Error):
+            base_response = create_base_response(request, result)
+            cache_key = validators = None
+        else:
+            base_response = create_base_response(request)
 
-    response_data = create_oai_response(result, base_response)
+        response_data = create_oai_response(result, base_response)
 
-    template = render_template(get_template(result), oai_response=response_data) # type: ignore
-    # schema = XMLSchema('https://www.openarchives.org/OAI/2.0/OAI-PMH.xsd', build=False)
-    # schema.add_schema('https://www.openarchives.org/OAI/2.0/oai_dc.xsd')
-    # schema.add_schema('https://www.dublincore.org/schemas/xmls/qdc/dc.xsd')
-    # schema.build()
-    # schema.validate(template)
+    if isinstance(result, (StreamedListRecords, StreamedListIdentifiers)):
+        response = validate_response(stream_xml(get_template(result), oai_response=response_data), source)
+        return set_validators(compress_response(response, encoding, cache_key), validators)
+
+    with phase('render'):
+        template = render_template(get_template(result), oai_response=response_data) # type: ignore
     response = make_response(template)
     response.headers['Content-Type'] = 'application/xml'
+    response = validate_response(response, source)
 
-    return response
+    with phase('compression'):
+        response = compress_response(response, encoding, cache_key)
+    return set_validators(response, validators)
 
 def get_template(result: GenericOAIObject | Error) -> str:
     if isinstance(result, Identify):
         return 'identify.xml.jinja'
     elif isinstance(result, GetRecord):
         return 'get-record.xml.jinja'
-    elif isinstance(result, ListIdentifiers):
+    elif isinstance(result, (ListIdentifiers, StreamedListIdentifiers)):
         return 'list-identifiers.xml.jinja'
-    elif isinstance(result, ListRecords):
+    elif isinstance(result, (ListRecords, StreamedListRecords)):
         return 'list-records.xml.jinja'
     elif isinstance(result, ListSets):
         return 'list-sets.xml.jinja'
@@ -78,18 +136,19 @@ def get_template(result: GenericOAIObject | Error) -> str:
         return 'oai-pmh.xml.jinja'
 
 def create_oai_response(result: GenericOAIObject | Error, base_response: OAIPMH) -> GenericOAIResponse:
+    # base_response and result are already validated, so the envelope only references them instead of copying and validating them again
     if isinstance(result, GetRecord):
-        return OAIGetRecord.from_dict(base_response.to_dict() | {'GetRecord': result.to_dict()})
+        return OAIGetRecord.model_construct(**dict(base_response), get_record=result)
     elif isinstance(result, Identify):
-        return OAIIdentify.from_dict(base_response.to_dict() | {'Identify': result.to_dict()})
-    elif isinstance(result, ListRecords):
-        return OAIListRecords.from_dict(base_response.to_dict() | {'ListRecords': result.to_dict()})
-    elif isinstance(result, ListIdentifiers):
-        return OAIListIdentifiers.from_dict(base_response.to_dict() | {'ListIdentifiers': result.to_dict()})
+        return OAIIdentify.model_construct(**dict(base_response), identify=result)
+    elif isinstance(result, (ListRecords, StreamedListRecords)):
+        return OAIListRecords.model_construct(**dict(base_response), list_records=result)
+    elif isinstance(result, (ListIdentifiers, StreamedListIdentifiers)):
+        return OAIListIdentifiers.model_construct(**dict(base_response), list_identifiers=result)
     elif isinstance(result, ListSets):
-        return OAIListSets.from_dict(base_response.to_dict() | {'ListSets': result.to_dict()})
+        return OAIListSets.model_construct(**dict(base_response), list_sets=result)
     elif isinstance(result, ListMetadataFormats):
-        return OAIListMetadataFormats.from_dict(base_response.to_dict() | {'ListMetadataFormats': result.to_dict()})
+        return OAIListMetadataFormats.model_construct(**dict(base_response), list_metadata_formats=result)
     elif isinstance(result, Error):
         base_response.error = result
         return base_response
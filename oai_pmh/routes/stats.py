@@ -0,0 +1,36 @@
+from flask import Response, jsonify
+
+from ..shared.admission import admission_stats
+from ..shared.compression import get_compressed_cache
+from ..shared.crosswalk import get_crosswalk_cache
+from ..shared.fragment_cache import get_fragment_cache
+from ..shared.metrics import METRICS
+from ..shared.validation import get_validator
+from .. import APP
+
+@APP.route("/stats/fragment-cache")
+def fragment_cache_stats():
+    cache = get_fragment_cache()
+    return jsonify(cache.stats() if cache is not None else {})
+
+@APP.route("/stats/compressed-cache")
+def compressed_cache_stats():
+    cache = get_compressed_cache()
+    return jsonify(cache.stats() if cache is not None else {})
+
+@APP.route("/stats/crosswalk-cache")
+def crosswalk_cache_stats():
+    cache = get_crosswalk_cache()
+    return jsonify(cache.stats() if cache is not None else {})
+
+@APP.route("/stats/validation")
+def validation_stats():
+    return jsonify(get_validator().stats())
+
+@APP.route("/stats/admission")
+def admission_statistics():
+    return jsonify(admission_stats())
+
+@APP.route("/metrics")
+def metrics():
+    return Response(METRICS.expose(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,149 @@
+import math
+from threading import Condition, Lock
+from types import ModuleType
+from typing import Any, Optional
+
+from flask import Response, g, make_response
+
+from .metrics import get_entries
+from .plugin_handler import get_source
+from .. import APP
+from ..generated.models import Verb
+
+# weight of the newest measurement in the moving averages
+SMOOTHING = 0.2
+
+class Admission:
+    """
+    Limits the number of requests a source answers at the same time. Further requests wait in a queue of bounded size
+    for at most `timeout` seconds, requests that find the queue full or time out are rejected.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self._condition = Condition()
+        self._limit = limit
+        self._queue_size = queue_size
+        self._timeout = timeout
+        # moving average of the seconds a request holds its slot
+        self._duration: Optional[float] = None
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def acquire(self) -> bool:
+        with self._condition:
+            if self.active >= self._limit:
+                if self.waiting >= self._queue_size:
+                    self.shed += 1
+                    return False
+                self.waiting += 1
+                self.queued += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+                admitted = self._condition.wait_for(lambda: self.active < self._limit, self._timeout)
+                self.waiting -= 1
+                if not admitted:
+                    self.shed += 1
+                    self.timed_out += 1
+                    return False
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self, duration: float) -> None:
+        with self._condition:
+            self.active -= 1
+            self._duration = duration if self._duration is None else SMOOTHING * duration + (1 - SMOOTHING) * self._duration
+            self._condition.notify()
+
+    def retry_after(self) -> int:
+        """Seconds until the requests that are queued now are expected to be answered"""
+        with self._condition:
+            return max(1, math.ceil((self._duration or 1.0) * (self.waiting + 1) / self._limit))
+
+    def stats(self) -> dict[str, Any]:
+        with self._condition:
+            return {
+                'limit': self._limit,
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': self.shed,
+                'timed_out': self.timed_out,
+                'mean_duration': self._duration
+            }
+
+class PageSizer:
+    """
+    Measures the seconds per entry of ListRecords and ListIdentifiers pages per source and verb and chooses
+    the page size so a page is produced within OAI_PAGE_LATENCY_TARGET seconds.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._costs: dict[tuple[str, str], float] = {}
+
+    def observe(self, source: str, verb: str, seconds: float, entries: int) -> None:
+        if entries <= 0:
+            return
+        cost = seconds / entries
+        with self._lock:
+            previous = self._costs.get((source, verb))
+            self._costs[(source, verb)] = cost if previous is None else SMOOTHING * cost + (1 - SMOOTHING) * previous
+
+    def page_size(self, source: str, verb: str) -> int:
+        maximum = APP.config['OAI_PAGE_SIZE']
+        target = APP.config['OAI_PAGE_LATENCY_TARGET']
+        with self._lock:
+            cost = self._costs.get((source, verb))
+        if not target or cost is None or cost <= 0:
+            return maximum
+        return max(min(APP.config['OAI_MIN_PAGE_SIZE'], maximum), min(maximum, int(target / cost)))
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            costs = dict(self._costs)
+        return {f'{source} {verb}': {'seconds_per_entry': cost, 'page_size': self.page_size(source, verb)} for ((source, verb), cost) in costs.items()}
+
+_admissions: dict[str, Admission] = {}
+_admissions_lock = Lock()
+PAGE_SIZER = PageSizer()
+
+def get_admission(source: str) -> Optional[Admission]:
+    if APP.config['OAI_ADMISSION_LIMIT'] <= 0:
+        return None
+    with _admissions_lock:
+        admission = _admissions.get(source)
+        if admission is None:
+            admission = _admissions[source] = Admission(APP.config['OAI_ADMISSION_LIMIT'], APP.config['OAI_ADMISSION_QUEUE_SIZE'], APP.config['OAI_ADMISSION_TIMEOUT'])
+        return admission
+
+def admission_stats() -> dict[str, Any]:
+    with _admissions_lock:
+        admissions = dict(_admissions)
+    return {'sources': {source: x.stats() for (source, x) in admissions.items()}, 'page_sizes': PAGE_SIZER.stats()}
+
+def get_page_size(plugin: ModuleType, verb: str) -> int:
+    return PAGE_SIZER.page_size(get_source(plugin), verb)
+
+def observe_page(result: Any) -> None:
+    """Remembers the result of a list request, its entries are counted once the page is rendered"""
+    g.page_result = result
+
+def observe_page_cost(source: str, verb: Optional[str], result: Any, seconds: float) -> None:
+    if verb not in [Verb.LISTRECORDS.value, Verb.LISTIDENTIFIERS.value] or result is None:
+        return
+    entries = get_entries(result)
+    if entries is not None:
+        PAGE_SIZER.observe(source, verb, seconds, entries)
+
+def overloaded_response(admission: Admission) -> Response:
+    """Flow control of the OAI-PMH guidelines, harvesters are asked to repeat the request after Retry-After seconds"""
+    response = make_response('The server is busy, retry the request later', 503)
+    response.headers['Retry-After'] = str(admission.retry_after())
+    return response
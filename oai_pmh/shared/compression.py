@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+from types import ModuleType
+from typing import Callable, Iterable, Iterator, Optional
+import zlib
+
+from flask import Response, request
+
+from .exceptions import BadResumptionTokenException
+from .resumption import decode_cursor
+from .. import APP
+
+try:
+    import brotli
+except ImportError: # brotli is optional, without it only gzip is offered
+    brotli = None
+
+CompressedKey = tuple[str, str, str]
+
+def available_encodings() -> list[str]:
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def negotiate_encoding() -> Optional[str]:
+    """The best content coding the client accepts, None for an uncompressed response"""
+    if not APP.config['OAI_COMPRESSION']:
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+def create_compressor(encoding: str) -> tuple[Callable[[bytes], bytes], Callable[[], bytes], Callable[[], bytes]]:
+    """Returns functions to compress a chunk, to flush everything compressed so far and to finish the stream"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=APP.config['OAI_BROTLI_QUALITY'])
+        return (compressor.process, compressor.flush, compressor.finish)
+    compressobj = zlib.compressobj(APP.config['OAI_GZIP_LEVEL'], zlib.DEFLATED, 31)
+    return (compressobj.compress, lambda: compressobj.flush(zlib.Z_SYNC_FLUSH), compressobj.flush)
+
+def compress_chunks(chunks: Iterable[str | bytes], encoding: str, on_complete: Optional[Callable[[bytes], None]] = None) -> Iterator[bytes]:
+    """
+    Compresses a streamed body chunk by chunk. Every chunk is flushed, so a client can start parsing
+    before the body is complete. If `on_complete` is given it receives the complete compressed body.
+    """
+    (compress, flush, finish) = create_compressor(encoding)
+    collected: Optional[list[bytes]] = [] if on_complete is not None else None
+    for chunk in chunks:
+        data = compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk) + flush()
+        if data:
+            if collected is not None:
+                collected.append(data)
+            yield data
+    data = finish()
+    if collected is not None:
+        collected.append(data)
+        on_complete(b''.join(collected)) # type: ignore
+    yield data
+
+class CompressedCache:
+    """LRU cache for compressed response bodies that is bounded by the summed body size, entries expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._entries: OrderedDict[CompressedKey, tuple[float, bytes]] = OrderedDict()
+        self._lock = Lock()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CompressedKey) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self._size -= len(entry[1])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: CompressedKey, body: bytes) -> None:
+        if len(body) > self._max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (time.monotonic() + self._ttl, body)
+            self._size += len(body)
+            while self._size > self._max_size:
+                (_, (_, evicted)) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'size': self._size, 'max_size': self._max_size, 'hits': self.hits, 'misses': self.misses}
+
+_compressed_cache: Optional[CompressedCache] = None
+
+def get_compressed_cache() -> Optional[CompressedCache]:
+    global _compressed_cache
+    if _compressed_cache is None and APP.config['OAI_COMPRESSION_CACHE_SIZE'] > 0:
+        _compressed_cache = CompressedCache(APP.config['OAI_COMPRESSION_CACHE_SIZE'], APP.config['OAI_COMPRESSION_CACHE_TTL'])
+    return _compressed_cache
+
+def get_cache_key(plugin: ModuleType, source: str, encoding: Optional[str]) -> Optional[CompressedKey]:
+    """
+    Identify, ListSets, ListMetadataFormats and resumption pages only depend on their arguments, so their compressed
+    bodies are cached. Other requests return None. The resumption token is checked before the cache is asked,
+    so an expired token or one signed with a former secret is never answered from the cache.
+    """
+    if encoding is None or get_compressed_cache() is None:
+        return None
+    verb = request.args.get('verb')
+    resumption_token = request.args.get('resumptionToken')
+    if resumption_token is not None:
+        try:
+            decode_cursor(resumption_token, verb or '', plugin.__name__)
+        except BadResumptionTokenException:
+            return None
+    if verb in ['Identify', 'ListSets', 'ListMetadataFormats'] or resumption_token is not None:
+        return (source, '&'.join(sorted(f'{key}={value}' for (key, value) in request.args.items(multi=True))), encoding)
+    return None
+
+def cached_response(key: Optional[CompressedKey]) -> Optional[Response]:
+    cache = get_compressed_cache()
+    if key is None or cache is None:
+        return None
+    body = cache.get(key)
+    if body is None:
+        return None
+    response = Response(body, mimetype='application/xml')
+    response.headers['Content-Encoding'] = key[2]
+    response.vary.add('Accept-Encoding')
+    return response
+
+def compress_response(response: Response, encoding: Optional[str], key: Optional[CompressedKey] = None) -> Response:
+    """Compresses a buffered or streamed response, the compressed body is cached under `key` if it is given"""
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    cache = get_compressed_cache()
+    on_complete = (lambda body: cache.put(key, body)) if key is not None and cache is not None else None # type: ignore
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding, on_complete)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(b''.join(compress_chunks([response.get_data()], encoding, on_complete)))
+    response.headers['Content-Encoding'] = encoding
+    return response
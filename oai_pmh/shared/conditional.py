@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from hashlib import sha1
+from types import ModuleType
+from typing import Optional
+
+from flask import Response, request
+
+Validators = tuple[str, Optional[datetime]]
+
+def get_validators(plugin: ModuleType, source: str) -> Optional[Validators]:
+    """
+    Computes the ETag and Last-Modified date of a request without building the response.
+    GetRecord and ListMetadataFormats for an identifier use the datestamp of the record from the plugin function
+    get_record_datestamp(identifier), Identify, ListSets and ListMetadataFormats use get_repository_version().
+    Returns None if the plugin supplies neither or the request can not be validated.
+    """
+    verb = request.args.get('verb')
+    identifier = request.args.get('identifier')
+    last_modified = None
+    if verb == 'GetRecord' or (verb == 'ListMetadataFormats' and identifier is not None):
+        if identifier is None or not hasattr(plugin, 'get_record_datestamp'):
+            return None
+        last_modified = plugin.get_record_datestamp(identifier)
+        if last_modified is None:
+            return None
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        version = last_modified.isoformat()
+    elif verb in ['Identify', 'ListSets', 'ListMetadataFormats']:
+        if not hasattr(plugin, 'get_repository_version'):
+            return None
+        version = str(plugin.get_repository_version())
+    else:
+        return None
+    arguments = '&'.join(sorted(f'{key}={value}' for (key, value) in request.args.items(multi=True)))
+    etag = sha1(f'{source}\x00{arguments}\x00{version}'.encode('utf-8')).hexdigest()[:32]
+    return (etag, last_modified)
+
+def is_not_modified(validators: Validators) -> bool:
+    (etag, last_modified) = validators
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def set_validators(response: Response, validators: Optional[Validators]) -> Response:
+    if validators is None:
+        return response
+    (etag, last_modified) = validators
+    # responses differ in their responseDate and content coding, so the ETag is weak
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def not_modified_response(validators: Validators) -> Response:
+    response = Response(status=304)
+    response.vary.add('Accept-Encoding')
+    return set_validators(response, validators)
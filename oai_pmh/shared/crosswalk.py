@@ -0,0 +1,128 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import multiprocessing
+import os
+from threading import Lock
+from typing import Callable, Iterable, Optional
+
+from oai_crosswalks import SourceRecord, convert_to_marcxml, convert_to_oai_dc
+
+from .exceptions import CannotDissemintateFormatException
+from .fragment_cache import FragmentCache
+from .metrics import phase
+from .. import APP
+from ..generated.models import Header, MetadataFormat, MetadataPrefix, Record, RecordMetadata
+
+Converter = Callable[[SourceRecord], str]
+
+@dataclass(frozen=True)
+class Crosswalk:
+    metadata_prefix: str
+    namespace: str
+    schema: str
+    # a module level function, so it can be sent to the processes of the pool
+    convert: Converter
+    # cheap conversions take less time than sending the records to the pool and back, they always run in the request thread
+    parallel: bool = True
+
+CROSSWALKS: dict[str, Crosswalk] = {}
+
+def register_crosswalk(metadata_prefix: str, namespace: str, schema: str, parallel: bool = True) -> Callable[[Converter], Converter]:
+    """
+    Registers a function that converts a source record into the XML of the <metadata> element of a metadata format.
+    With `parallel` large pages are converted in the process pool, whose processes import the module of the function,
+    so it should live in a module like oai_crosswalks that does not import the oai_pmh package.
+    """
+    def register(convert: Converter) -> Converter:
+        CROSSWALKS[metadata_prefix] = Crosswalk(metadata_prefix, namespace, schema, convert, parallel)
+        return convert
+    return register
+
+_cache: Optional[FragmentCache] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+def get_crosswalk_cache() -> Optional[FragmentCache]:
+    global _cache
+    if _cache is None and APP.config['OAI_CROSSWALK_CACHE_SIZE'] > 0:
+        _cache = FragmentCache(APP.config['OAI_CROSSWALK_CACHE_SIZE'])
+    return _cache
+
+def get_process_count() -> int:
+    return APP.config['OAI_CROSSWALK_PROCESSES'] if APP.config['OAI_CROSSWALK_PROCESSES'] is not None else os.cpu_count() or 1
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if get_process_count() <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # the processes are spawned, forking a process whose other threads hold locks can deadlock the child.
+            # They only import the modules of the converters, which do not import the app.
+            _pool = ProcessPoolExecutor(get_process_count(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+class CrosswalkPipeline:
+    """
+    Builds the records of a plugin from source records with the registered crosswalks, so a plugin supplies the metadata of a record once
+    and every metadata format is derived from it. Converted metadata is kept in a LRU cache keyed by source, identifier, metadata prefix
+    and datestamp. The misses of a page with at least OAI_CROSSWALK_PARALLEL_THRESHOLD records are converted in a process pool,
+    unless the crosswalk is registered as too cheap for it.
+    """
+
+    def __init__(self, source: str, metadata_prefixes: Optional[Iterable[str]] = None):
+        self.source = source
+        self.metadata_prefixes = list(metadata_prefixes) if metadata_prefixes is not None else None
+
+    def get_crosswalks(self) -> list[Crosswalk]:
+        if self.metadata_prefixes is None:
+            return list(CROSSWALKS.values())
+        return [CROSSWALKS[x] for x in self.metadata_prefixes if x in CROSSWALKS]
+
+    def get_crosswalk(self, metadata_prefix: MetadataPrefix) -> Crosswalk:
+        crosswalk = next((x for x in self.get_crosswalks() if x.metadata_prefix == metadata_prefix.value), None)
+        if crosswalk is None:
+            raise CannotDissemintateFormatException()
+        return crosswalk
+
+    def create_metadata_formats(self) -> list[MetadataFormat]:
+        return [MetadataFormat(metadataPrefix=MetadataPrefix(x.metadata_prefix), metadataNamespace=x.namespace, schema=x.schema) for x in self.get_crosswalks()] # type: ignore
+
+    def create_record(self, header: Header, metadata: Optional[SourceRecord], metadata_prefix: MetadataPrefix) -> Record:
+        return self.create_records([(header, metadata)], metadata_prefix)[0]
+
+    def create_records(self, entries: Iterable[tuple[Header, Optional[SourceRecord]]], metadata_prefix: MetadataPrefix) -> list[Record]:
+        """Records with the metadata of their source records in the requested format, deleted records and records without metadata get none"""
+        crosswalk = self.get_crosswalk(metadata_prefix)
+        entries = list(entries)
+        cache = get_crosswalk_cache()
+        converted: list[Optional[str]] = [None] * len(entries)
+        misses = []
+        for (position, (header, metadata)) in enumerate(entries):
+            if metadata is None or header.status is not None:
+                continue
+            converted[position] = cache.get(self.get_key(header, crosswalk)) if cache is not None else None
+            if converted[position] is None:
+                misses.append(position)
+
+        if misses:
+            with phase('crosswalk'):
+                sources = [entries[x][1] for x in misses]
+                pool = get_process_pool() if crosswalk.parallel and len(misses) >= APP.config['OAI_CROSSWALK_PARALLEL_THRESHOLD'] else None
+                if pool is not None:
+                    results = list(pool.map(crosswalk.convert, sources, chunksize=max(1, len(sources) // (4 * get_process_count()))))
+                else:
+                    results = [crosswalk.convert(x) for x in sources]
+            for (position, xml) in zip(misses, results):
+                converted[position] = xml
+                if cache is not None:
+                    cache.put(self.get_key(entries[position][0], crosswalk), xml)
+
+        return [Record(header=header, metadata=RecordMetadata(xml=xml) if xml is not None else None) for ((header, _), xml) in zip(entries, converted)]
+
+    def get_key(self, header: Header, crosswalk: Crosswalk) -> tuple[str, str, str, str]:
+        # a record only changes together with its datestamp, so converted metadata never has to be invalidated
+        return (self.source, header.identifier, crosswalk.metadata_prefix, header.datestamp.isoformat())
+
+register_crosswalk('oai_dc', 'http://www.openarchives.org/OAI/2.0/oai_dc/', 'http://www.openarchives.org/OAI/2.0/oai_dc.xsd', parallel=False)(convert_to_oai_dc)
+register_crosswalk('marcxml', 'http://www.loc.gov/MARC21/slim', 'http://www.loc.gov/standards/marcxml/schema/MARC21slim.xsd')(convert_to_marcxml)
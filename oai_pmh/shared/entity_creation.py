@@ -1,10 +1,14 @@
 from datetime import datetime
+from types import ModuleType
 
-from typing import Optional
+from typing import Any, Optional, TypeVar
 from flask import Request
 
+from .plugin_handler import is_trusted
 from ..generated.models import OAIPMH, Error, ErrorCode
 
+M = TypeVar('M')
+
 def create_error(error_code: ErrorCode, error_message) -> Error:
 
     error_data = {
@@ -13,6 +17,12 @@ def create_error(error_code: ErrorCode, error_message) -> Error:
     }
     return Error.from_dict(error_data)
 
+def create_verb_object(plugin: ModuleType, model: type[M], **fields: Any) -> M:
+    """Wraps plugin objects in a verb model, objects of trusted plugins are not validated again"""
+    if is_trusted(plugin):
+        return model.model_construct(**fields) # type: ignore
+    return model(**fields)
+
 def create_base_response(request: Request, error: Optional[Error] = None) -> OAIPMH:
     request_attributes = {'content': request.base_url}
     if error is None or error.code not in [ErrorCode.BADARGUMENT, ErrorCode.BADVERB]:
@@ -11,3 +11,15 @@ class NoSetHierarchyException(Exception):
     pass
 class NoMetadataFormatsException(Exception):
     pass
+
+class BadResumptionTokenException(Exception):
+    pass
+
+class InvalidResponseException(Exception):
+    pass
+
+class InvalidPluginException(Exception):
+    pass
+
+class InsecureSecretException(Exception):
+    pass
@@ -0,0 +1,257 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from hashlib import sha1
+import heapq
+from itertools import islice
+from threading import Lock
+from types import ModuleType
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+from .exceptions import IDDoesNotExistException, NoMetadataFormatsException, NoRecordsMatchException, NoSetHierarchyException
+from .header_batch import HeaderBatch
+from .resumption import header_key, slice_page
+from .selective import filter_pages, server_filters, split_filters
+from .. import APP
+from ..generated.models import Header, Identify, MetadataFormat, MetadataPrefix, Record, Set
+
+T = TypeVar('T')
+
+# identifiers and set specs of a member are prefixed with its source name and this separator, source names never contain it
+SEPARATOR = ':'
+# sorts after every identifier, a member keyset after it skips all entries of a datestamp
+LAST_IDENTIFIER = '\U0010ffff'
+GRANULARITIES = ['YYYY-MM-DDThh:mm:ssZ', 'YYYY-MM-DD']
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(APP.config['OAI_FEDERATION_THREADS'], thread_name_prefix='oai-federation')
+        return _executor
+
+def namespace_header(name: str, header: Header) -> Header:
+    """The header of a member with its identifier and set specs prefixed by the member, every entry is in the set of its member"""
+    return header.model_copy(update={
+        'identifier': f'{name}{SEPARATOR}{header.identifier}',
+        'set_spec': [name, *(f'{name}{SEPARATOR}{x}' for x in header.set_spec or [])]
+    })
+
+def namespace_record(name: str, record: Record) -> Record:
+    return record.model_copy(update={'header': namespace_header(name, record.header)})
+
+def namespace_rows(name: str, page: HeaderBatch | list[Header]) -> Iterator[tuple[datetime, str, bool, list[str]]]:
+    """Datestamp, identifier, deleted flag and set specs of the headers of a member page like namespace_header returns them, batches are read from their columns"""
+    if isinstance(page, HeaderBatch):
+        rows: Iterable[tuple[datetime, str, bool, list[str]]] = ((page.datestamp(x), page.identifier(x), page.is_deleted(x), page.set_specs(x)) for x in range(len(page)))
+    else:
+        rows = ((x.datestamp, x.identifier, x.status is not None, x.set_spec or []) for x in page)
+    for (datestamp, identifier, deleted, sets) in rows:
+        yield (datestamp, f'{name}{SEPARATOR}{identifier}', deleted, [name, *(f'{name}{SEPARATOR}{x}' for x in sets)])
+
+def merge_header_batches(pages: list[tuple[str, HeaderBatch | list[Header]]], limit: Optional[int]) -> HeaderBatch:
+    """Merges the pages of members that return header batches into one batch, without building a Header for any entry"""
+    merged = heapq.merge(*[namespace_rows(name, page) for (name, page) in pages], key=lambda x: (x[0], x[1]))
+    batch = HeaderBatch()
+    for (datestamp, identifier, deleted, sets) in (islice(merged, limit) if limit is not None else merged):
+        batch.append(identifier, datestamp, deleted, sets)
+    return batch
+
+def get_member_after(name: str, after: Optional[tuple[datetime, str]]) -> Optional[tuple[datetime, str]]:
+    """
+    The position of a member that corresponds to the position `after` in the merged list. Entries are merged by datestamp
+    and namespaced identifier, so at the datestamp of `after` a member either continues after its own identifier,
+    or all of its entries come before or after the ones of the member the last entry was taken from.
+    """
+    if after is None:
+        return None
+    (datestamp, identifier) = after
+    (member, _, local_identifier) = identifier.partition(SEPARATOR)
+    if member == name:
+        return (datestamp, local_identifier)
+    return (datestamp, LAST_IDENTIFIER if f'{name}{SEPARATOR}' < f'{member}{SEPARATOR}' else '')
+
+def value_of(value: Any) -> Any:
+    return getattr(value, 'value', value)
+
+class Federation:
+    """
+    Virtual source that answers every request from its member plugins. The list verbs ask all members for a page
+    concurrently in a thread pool and merge the pages by datestamp and identifier while the response is rendered,
+    the identifiers and set specs of each member are prefixed by the name of its source.
+    The resumption token keeps the position of the last merged entry, which is a position in every member,
+    so every member is only asked for the entries after its own position.
+    """
+
+    # from, until and set are passed on to the members, which apply them themselves or have them applied per member
+    NATIVE_FILTERS = {'from', 'until', 'set'}
+
+    def __init__(self, name: str, members: dict[str, ModuleType]):
+        self.name = name
+        self.members = members
+
+    def select_members(self, set: Optional[str]) -> dict[str, Optional[str]]:
+        """The members a set spec selects and the set spec of the member to ask them for"""
+        if set is None:
+            return {name: None for name in self.members}
+        (name, _, member_set) = set.partition(SEPARATOR)
+        return {name: member_set or None} if name in self.members else {}
+
+    def fan_out(self, call: Callable[[str, ModuleType, Optional[str]], T], set: Optional[str] = None) -> list[tuple[str, T]]:
+        """Calls `call` for every selected member in the thread pool and returns the results in the order of the members"""
+        selected = self.select_members(set)
+        futures = [(name, get_executor().submit(call, name, self.members[name], member_set)) for (name, member_set) in selected.items()]
+        return [(name, future.result()) for (name, future) in futures]
+
+    def get_member(self, identifier: str) -> tuple[str, ModuleType, str]:
+        (name, _, local_identifier) = identifier.partition(SEPARATOR)
+        member = self.members.get(name)
+        if member is None or not local_identifier:
+            raise IDDoesNotExistException()
+        return (name, member, local_identifier)
+
+    def fetch(self, member: ModuleType, kind: str, metadata_prefix: MetadataPrefix, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str], after: Optional[tuple[datetime, str]], limit: Optional[int]) -> list[Any] | HeaderBatch:
+        """
+        A page of records or headers of a member like the list routes request it, the complete list if `limit` is None.
+        Header batches of a member stay batches.
+        """
+        header_of = (lambda x: x.header) if kind == 'records' else (lambda x: x)
+        (filters, matches) = split_filters(member, start_date, end_date, set)
+        try:
+            if limit is not None and hasattr(member, f'create_{kind}_page'):
+                create_page = getattr(member, f'create_{kind}_page')
+                page = filter_pages(lambda key, size: create_page(metadata_prefix, *filters, key, size), header_of, matches, after, limit)
+                return page if isinstance(page, HeaderBatch) else list(page)
+            entries = getattr(member, f'create_{kind}')(metadata_prefix, *filters)
+            if isinstance(entries, HeaderBatch):
+                entries = entries.select(*server_filters(member, start_date, end_date, set)).sorted()
+                return entries.page(after, limit if limit is not None else len(entries))
+            entries = [x for x in entries if matches is None or matches(header_of(x))]
+        except NoRecordsMatchException:
+            return []
+        return slice_page(entries, lambda x: header_key(header_of(x)), after, limit if limit is not None else len(entries))[0]
+
+    def merge(self, kind: str, metadata_prefix: MetadataPrefix, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str], after: Optional[tuple[datetime, str]], limit: Optional[int]) -> Iterator[Any] | HeaderBatch:
+        pages = self.fan_out(lambda name, member, member_set: self.fetch(member, kind, metadata_prefix, start_date, end_date, member_set, get_member_after(name, after), limit), set)
+        # batches keep datestamps to the second, so headers are only merged into a batch if no member returns models
+        if kind == 'identifiers' and any(isinstance(page, HeaderBatch) for (_, page) in pages) and all(isinstance(page, HeaderBatch) or not page for (_, page) in pages):
+            return merge_header_batches(pages, limit) # type: ignore
+        if kind == 'records':
+            # partial binds the name of each member, a generator expression would read it after the loop has ended
+            streams: list[Iterable[Any]] = [map(partial(namespace_record, name), page) for (name, page) in pages]
+            key: Callable[[Any], tuple[datetime, str]] = lambda x: header_key(x.header)
+        else:
+            streams = [map(partial(namespace_header, name), page) for (name, page) in pages]
+            key = header_key
+        # every page is already ordered, so the merge only ever compares the next entry of each member
+        merged = heapq.merge(*streams, key=key)
+        return islice(merged, limit) if limit is not None else merged
+
+    def create_records(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> list[Record]:
+        return list(self.merge('records', metadata_prefix, start_date, end_date, set, None, None))
+
+    def create_identifiers(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> list[Header] | HeaderBatch:
+        headers = self.merge('identifiers', metadata_prefix, start_date, end_date, set, None, None)
+        return headers if isinstance(headers, HeaderBatch) else list(headers)
+
+    def create_records_page(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> Iterator[Record]:
+        return self.merge('records', metadata_prefix, start_date, end_date, set, after, limit)
+
+    def create_identifiers_page(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: int = 100) -> Iterator[Header] | HeaderBatch:
+        return self.merge('identifiers', metadata_prefix, start_date, end_date, set, after, limit)
+
+    def count(self, kind: str, metadata_prefix: MetadataPrefix, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str]) -> Optional[int]:
+        """The sum of the counts of the members, None if a member can not count its entries exactly"""
+        def count_member(name: str, member: ModuleType, member_set: Optional[str]) -> Optional[int]:
+            if split_filters(member, start_date, end_date, member_set)[1] is not None:
+                return None
+            try:
+                return getattr(member, f'count_{kind}')(metadata_prefix, start_date, end_date, member_set)
+            except NoRecordsMatchException:
+                return 0
+        counts = [x for (_, x) in self.fan_out(count_member, set)]
+        return None if None in counts else sum(counts) # type: ignore
+
+    def count_records(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> Optional[int]:
+        return self.count('records', metadata_prefix, start_date, end_date, set)
+
+    def count_identifiers(self, metadata_prefix: MetadataPrefix, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> Optional[int]:
+        return self.count('identifiers', metadata_prefix, start_date, end_date, set)
+
+    def create_record(self, identifier: str, metadata_prefix: MetadataPrefix) -> Record:
+        (name, member, local_identifier) = self.get_member(identifier)
+        return namespace_record(name, member.create_record(local_identifier, metadata_prefix))
+
+    def get_record_datestamp(self, identifier: str) -> Optional[datetime]:
+        try:
+            (_, member, local_identifier) = self.get_member(identifier)
+        except IDDoesNotExistException:
+            return None
+        return member.get_record_datestamp(local_identifier) if hasattr(member, 'get_record_datestamp') else None
+
+    def get_repository_version(self) -> str:
+        versions = self.fan_out(lambda name, member, member_set: str(member.get_repository_version()))
+        return sha1('\x00'.join(f'{name}={version}' for (name, version) in versions).encode('utf-8')).hexdigest()
+
+    def create_metadata_formats(self, identifier: str | None) -> list[MetadataFormat]:
+        """The formats of the record of a member, without an identifier every format that at least one member offers"""
+        if identifier is not None:
+            (_, member, local_identifier) = self.get_member(identifier)
+            return member.create_metadata_formats(local_identifier)
+        formats: dict[Any, MetadataFormat] = {}
+        for (_, member_formats) in self.fan_out(lambda name, member, member_set: member.create_metadata_formats(None)):
+            for metadata_format in member_formats:
+                formats.setdefault(metadata_format.metadata_prefix, metadata_format)
+        if not formats:
+            raise NoMetadataFormatsException()
+        return list(formats.values())
+
+    def create_sets(self) -> list[Set]:
+        """
+        A set per member named after its source that contains all of its entries, followed by the namespaced sets of the member.
+        It does not depend on a request, so `flask build-snapshots` can list the sets of a federated source.
+        """
+        def member_sets(name: str, member: ModuleType, member_set: Optional[str]) -> list[Set]:
+            try:
+                return member.create_sets() or []
+            except NoSetHierarchyException:
+                return []
+        sets = []
+        for (name, member_sets) in self.fan_out(member_sets):
+            sets.append(Set(setSpec=name, setName=name))
+            sets.extend(x.model_copy(update={'set_spec': f'{name}{SEPARATOR}{x.set_spec}'}) for x in member_sets)
+        return sets
+
+    def create_identify(self, url: str) -> Identify:
+        identifies = [x for (_, x) in self.fan_out(lambda name, member, member_set: member.create_identify(url))]
+        deleted_records = {value_of(x.deleted_record) for x in identifies}
+        return Identify.from_dict({
+            'baseURL': url,
+            'adminEmail': list(dict.fromkeys(email for x in identifies for email in x.admin_email)),
+            # the coarsest granularity of the members, finer datestamps of the other members are truncated by the server
+            'granularity': GRANULARITIES[max(GRANULARITIES.index(value_of(x.granularity)) for x in identifies)],
+            'repositoryName': f'{self.name}: {", ".join(x.repository_name for x in identifies)}',
+            'protocolVersion': '2.0',
+            'deletedRecord': deleted_records.pop() if len(deleted_records) == 1 else 'transient',
+            'earliestDatestamp': min(x.earliest_datestamp for x in identifies),
+            'compression': [x for x in ['gzip', 'br'] if all(x in [value_of(y) for y in z.compression or []] for z in identifies)],
+            'description': [f'Federation of the sources {", ".join(self.members)}']
+        }) # type: ignore
+
+def create_federation(name: str, members: dict[str, ModuleType]) -> ModuleType:
+    """
+    Builds a plugin module for a virtual source from its members. The optional functions that need every member
+    to implement them are only added if all members do.
+    """
+    federation = Federation(name, members)
+    plugin = ModuleType(f'{__package__.rsplit(".", 1)[0]}.plugins.{name}.convert', Federation.__doc__)
+    plugin.NATIVE_FILTERS = Federation.NATIVE_FILTERS # type: ignore
+    functions = ['create_identify', 'create_identifiers', 'create_records', 'create_record', 'create_metadata_formats', 'create_sets',
+        'create_records_page', 'create_identifiers_page', 'get_record_datestamp']
+    functions += [x for x in ['count_records', 'count_identifiers', 'get_repository_version'] if all(hasattr(y, x) for y in members.values())]
+    for function in functions:
+        setattr(plugin, function, getattr(federation, function))
+    return plugin
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from hashlib import sha1
+import os
+import pathlib
+from queue import Full, Queue
+import tempfile
+from threading import Lock, Thread
+from typing import Optional
+
+from flask import g, request
+
+from .. import APP
+from ..generated.models import Record
+
+FragmentKey = tuple[str, str, str, str]
+WRITE_QUEUE_SIZE = 1024
+
+class FragmentCache:
+    """
+    Keeps rendered <record> elements in a LRU cache that is bounded by the summed length of the fragments.
+    If a directory is given, new fragments are also kept on disk, so they survive a restart. They are written by a background thread,
+    which drops fragments instead of queueing them if it falls behind, and removes the oldest files once they exceed max_disk_size bytes.
+    A record only changes together with its datestamp, which is part of the key, so entries never have to be invalidated.
+    """
+
+    def __init__(self, max_size: int, directory: Optional[str] = None, max_disk_size: int = 0):
+        self._entries: OrderedDict[FragmentKey, str] = OrderedDict()
+        self._lock = Lock()
+        self._max_size = max_size
+        self._size = 0
+        self._directory = pathlib.Path(directory) if directory else None
+        self._max_disk_size = max_disk_size
+        self._disk_size = 0
+        # the files on disk and their sizes in the order they were written, only used by the writer thread
+        self._files: OrderedDict[pathlib.Path, int] = OrderedDict()
+        self._queue: Queue[tuple[FragmentKey, str]] = Queue(WRITE_QUEUE_SIZE)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.dropped_writes = 0
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            Thread(target=self._run_writer, name='fragment-cache-writer', daemon=True).start()
+
+    def get(self, key: FragmentKey) -> Optional[str]:
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+        fragment = self._read(key)
+        with self._lock:
+            if fragment is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, fragment)
+        return fragment
+
+    def put(self, key: FragmentKey, fragment: str) -> None:
+        self._remember(key, fragment)
+        if self._directory is None:
+            return
+        try:
+            self._queue.put_nowait((key, fragment))
+        except Full:
+            with self._lock:
+                self.dropped_writes += 1
+
+    def flush(self) -> None:
+        """Waits until the queued fragments are on disk"""
+        self._queue.join()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_size': self._disk_size,
+                'max_disk_size': self._max_disk_size,
+                'disk_evictions': self.disk_evictions,
+                'dropped_writes': self.dropped_writes
+            }
+
+    def _remember(self, key: FragmentKey, fragment: str) -> None:
+        if len(fragment) > self._max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = fragment
+            self._size += len(fragment)
+            while self._size > self._max_size:
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _path(self, key: FragmentKey) -> pathlib.Path:
+        digest = sha1('\x00'.join(key).encode('utf-8')).hexdigest()
+        return self._directory / digest[:2] / f'{digest}.xml' # type: ignore
+
+    def _read(self, key: FragmentKey) -> Optional[str]:
+        if self._directory is None:
+            return None
+        try:
+            return self._path(key).read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+    def _run_writer(self) -> None:
+        self._scan()
+        while True:
+            (key, fragment) = self._queue.get()
+            try:
+                self._write(key, fragment)
+                self._prune()
+            except OSError as error: # a full or read-only disk must not stop the writer
+                APP.logger.warning('Could not write a fragment to %s: %s', self._directory, error)
+            finally:
+                self._queue.task_done()
+
+    def _scan(self) -> None:
+        """Counts the files of earlier runs against the budget, the oldest of them are removed first"""
+        files = [x for directory in self._directory.iterdir() if directory.is_dir() for x in os.scandir(directory) if x.name.endswith('.xml')] # type: ignore
+        for file in sorted(files, key=lambda x: x.stat().st_mtime):
+            self._add_file(pathlib.Path(file.path), file.stat().st_size)
+        self._prune()
+
+    def _write(self, key: FragmentKey, fragment: str) -> None:
+        data = fragment.encode('utf-8')
+        if len(data) > self._max_disk_size:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        (handle, temp_path) = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+        self._add_file(path, len(data))
+
+    def _add_file(self, path: pathlib.Path, size: int) -> None:
+        previous = self._files.pop(path, 0)
+        self._files[path] = size
+        with self._lock:
+            self._disk_size += size - previous
+
+    def _prune(self) -> None:
+        while self._disk_size > self._max_disk_size and self._files:
+            (path, size) = self._files.popitem(last=False)
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self._disk_size -= size
+                self.disk_evictions += 1
+
+_fragment_cache: Optional[FragmentCache] = None
+
+def get_fragment_cache() -> Optional[FragmentCache]:
+    global _fragment_cache
+    if _fragment_cache is None and APP.config['OAI_FRAGMENT_CACHE_SIZE'] > 0:
+        _fragment_cache = FragmentCache(APP.config['OAI_FRAGMENT_CACHE_SIZE'], APP.config['OAI_FRAGMENT_CACHE_DIR'], APP.config['OAI_FRAGMENT_CACHE_DIR_SIZE'])
+    return _fragment_cache
+
+@APP.template_global()
+def render_record(record: Record) -> str:
+    """Renders a <record> element or takes it from the fragment cache"""
+    cache = get_fragment_cache()
+    metadata_prefix = g.get('metadata_prefix')
+    if cache is None or metadata_prefix is None:
+        return APP.jinja_env.get_template('record.xml.jinja').render(record=record)
+    key = (str(request.view_args.get('source')), record.header.identifier, metadata_prefix, record.header.datestamp.isoformat()) # type: ignore
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = APP.jinja_env.get_template('record.xml.jinja').render(record=record)
+        cache.put(key, fragment)
+    return fragment
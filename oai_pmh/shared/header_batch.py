@@ -0,0 +1,177 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional, overload
+
+from markupsafe import Markup, escape
+
+from .. import APP
+from ..generated.models import Header
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_seconds(datestamp: datetime) -> int:
+    """Seconds since the epoch, naive datestamps are taken as UTC like everywhere else in the server"""
+    if datestamp.tzinfo is not None:
+        datestamp = datestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (datestamp - EPOCH) // timedelta(seconds=1)
+
+class HeaderBatch:
+    """
+    Compact, column oriented list of headers that plugins can return from create_identifiers and create_identifiers_page
+    instead of a list of Header models. Identifiers are kept in one UTF-8 buffer, datestamps as seconds in an integer array,
+    the deleted flags in a bitmap and set specs as indexes into a table of interned set specs, which takes about
+    a tenth of the memory of the models. Header models are only built for the entries that are accessed one by one,
+    the <header> elements of a page are written directly by `to_xml`.
+    """
+
+    __slots__ = ('_identifiers', '_offsets', '_datestamps', '_deleted', '_set_ids', '_set_offsets', '_set_specs', '_set_index')
+
+    def __init__(self) -> None:
+        self._identifiers = bytearray()
+        self._offsets = array('Q', [0])
+        self._datestamps = array('q')
+        self._deleted = bytearray()
+        self._set_ids = array('I')
+        self._set_offsets = array('Q', [0])
+        self._set_specs: list[str] = []
+        self._set_index: dict[str, int] = {}
+
+    @classmethod
+    def from_headers(cls, headers: Iterable[Header]) -> 'HeaderBatch':
+        batch = cls()
+        for header in headers:
+            batch.append(header.identifier, header.datestamp, header.status is not None, header.set_spec or [])
+        return batch
+
+    def append(self, identifier: str, datestamp: datetime, deleted: bool = False, sets: Iterable[str] = ()) -> None:
+        position = len(self._datestamps)
+        self._identifiers += identifier.encode('utf-8')
+        self._offsets.append(len(self._identifiers))
+        self._datestamps.append(to_seconds(datestamp))
+        if position % 8 == 0:
+            self._deleted.append(0)
+        if deleted:
+            self._deleted[position // 8] |= 1 << (position % 8)
+        for spec in sets:
+            set_id = self._set_index.get(spec)
+            if set_id is None:
+                set_id = self._set_index[spec] = len(self._set_specs)
+                self._set_specs.append(spec)
+            self._set_ids.append(set_id)
+        self._set_offsets.append(len(self._set_ids))
+
+    def __len__(self) -> int:
+        return len(self._datestamps)
+
+    def identifier(self, position: int) -> str:
+        return self._identifiers[self._offsets[position]:self._offsets[position + 1]].decode('utf-8')
+
+    def datestamp(self, position: int) -> datetime:
+        return EPOCH + timedelta(seconds=self._datestamps[position])
+
+    def is_deleted(self, position: int) -> bool:
+        return bool(self._deleted[position // 8] & (1 << (position % 8)))
+
+    def set_specs(self, position: int) -> list[str]:
+        return [self._set_specs[x] for x in self._set_ids[self._set_offsets[position]:self._set_offsets[position + 1]]]
+
+    def key(self, position: int) -> tuple[datetime, str]:
+        return (self.datestamp(position), self.identifier(position))
+
+    def header(self, position: int) -> Header:
+        return Header(identifier=self.identifier(position), datestamp=self.datestamp(position), setSpec=self.set_specs(position) or None, status='deleted' if self.is_deleted(position) else None)
+
+    @overload
+    def __getitem__(self, index: int) -> Header: ...
+    @overload
+    def __getitem__(self, index: slice) -> 'HeaderBatch': ...
+    def __getitem__(self, index: int | slice) -> 'Header | HeaderBatch':
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('HeaderBatch index out of range')
+        return self.header(index)
+
+    def __iter__(self) -> Iterator[Header]:
+        return (self.header(x) for x in range(len(self)))
+
+    def take(self, positions: Iterable[int]) -> 'HeaderBatch':
+        """A new batch with the entries at `positions`, in their order"""
+        batch = HeaderBatch()
+        # copied, so appending to the new batch never changes the set specs of this one
+        batch._set_specs = list(self._set_specs)
+        batch._set_index = dict(self._set_index)
+        for (count, position) in enumerate(positions):
+            batch._identifiers += self._identifiers[self._offsets[position]:self._offsets[position + 1]]
+            batch._offsets.append(len(batch._identifiers))
+            batch._datestamps.append(self._datestamps[position])
+            if count % 8 == 0:
+                batch._deleted.append(0)
+            if self.is_deleted(position):
+                batch._deleted[count // 8] |= 1 << (count % 8)
+            batch._set_ids.extend(self._set_ids[self._set_offsets[position]:self._set_offsets[position + 1]])
+            batch._set_offsets.append(len(batch._set_ids))
+        return batch
+
+    def sorted(self) -> 'HeaderBatch':
+        """The entries ordered by datestamp and identifier, batches that are already ordered are returned as they are"""
+        count = len(self)
+        sort_key = lambda x: (self._datestamps[x], self._identifiers[self._offsets[x]:self._offsets[x + 1]])
+        if all(sort_key(x) <= sort_key(x + 1) for x in range(count - 1)):
+            return self
+        return self.take(sorted(range(count), key=sort_key))
+
+    def select(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> 'HeaderBatch':
+        """The entries that match the selective harvesting arguments, compared on the columns without building any header"""
+        if start_date is None and end_date is None and set is None:
+            return self
+        start = to_seconds(start_date) if start_date is not None else None
+        end = to_seconds(end_date) if end_date is not None else None
+        set_id = self._set_index.get(set) if set is not None else None
+        if set is not None and set_id is None:
+            return self.take([])
+        def matches(position: int) -> bool:
+            datestamp = self._datestamps[position]
+            if (start is not None and datestamp < start) or (end is not None and datestamp > end):
+                return False
+            return set_id is None or set_id in self._set_ids[self._set_offsets[position]:self._set_offsets[position + 1]]
+        return self.take(x for x in range(len(self)) if matches(x))
+
+    def page(self, after: Optional[tuple[datetime, str]], limit: int) -> 'HeaderBatch':
+        """The first `limit` entries after the key `after` of a sorted batch"""
+        start = 0
+        if after is not None:
+            key = (to_seconds(after[0]), after[1].encode('utf-8'))
+            end = len(self)
+            while start < end:
+                middle = (start + end) // 2
+                if (self._datestamps[middle], self._identifiers[self._offsets[middle]:self._offsets[middle + 1]]) <= key:
+                    start = middle + 1
+                else:
+                    end = middle
+        return self.take(range(start, min(start + limit, len(self))))
+
+    def to_xml(self) -> Markup:
+        """Writes the <header> elements of all entries like header.xml.jinja, without building a model or rendering a template"""
+        days: dict[int, str] = {}
+        set_elements = [f'<setSpec>{escape(x)}</setSpec>' for x in self._set_specs]
+        parts = []
+        for position in range(len(self)):
+            day = self._datestamps[position] // 86400
+            date = days.get(day)
+            if date is None:
+                date = days[day] = (EPOCH + timedelta(days=day)).strftime('%Y-%m-%d')
+            sets = ''.join(set_elements[x] for x in self._set_ids[self._set_offsets[position]:self._set_offsets[position + 1]])
+            status = ' status="deleted"' if self.is_deleted(position) else ''
+            parts.append(f'<header{status}><identifier>{escape(self.identifier(position))}</identifier><datestamp>{date}</datestamp>{sets}</header>')
+        return Markup('\n'.join(parts))
+
+    def memory_size(self) -> int:
+        """Bytes taken by the columns, without the table of set specs"""
+        return len(self._identifiers) + len(self._deleted) + sum(x.itemsize * len(x) for x in [self._offsets, self._datestamps, self._set_ids, self._set_offsets])
+
+@APP.template_test('header_batch')
+def is_header_batch(value: object) -> bool:
+    return isinstance(value, HeaderBatch)
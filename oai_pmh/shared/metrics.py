@@ -0,0 +1,150 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+from flask import Response, g, has_request_context, request
+
+from .streaming import PageStream, StreamedListIdentifiers, StreamedListRecords
+from .. import APP
+from ..generated.models import Error, ListIdentifiers, ListRecords, ListSets, Verb
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ENTRY_BUCKETS = (0, 1, 10, 50, 100, 250, 500, 1000, 5000, 10000)
+
+Labels = tuple[tuple[str, str], ...]
+
+class Histogram:
+    """Prometheus style histogram, observations are counted per bucket and only accumulated when they are exposed"""
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series: dict[Labels, list[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # one counter per bucket, one for +Inf, then sum and count
+            series = self.series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def expose(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        for (labels, series) in self.series.items():
+            cumulative = 0.0
+            for (bound, count) in zip([*[str(x) for x in self.buckets], '+Inf'], series):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(labels + (("le", bound),))} {cumulative:g}'
+            yield f'{self.name}_sum{format_labels(labels)} {series[-2]:g}'
+            yield f'{self.name}_count{format_labels(labels)} {series[-1]:g}'
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.phases = Histogram('oai_request_phase_seconds', 'Time spent per phase of an OAI request', LATENCY_BUCKETS)
+        self.requests = Histogram('oai_request_seconds', 'Time until an OAI response is complete', LATENCY_BUCKETS)
+        self.entries = Histogram('oai_response_entries', 'Records, headers or sets in a list response', ENTRY_BUCKETS)
+        self.errors: dict[Labels, int] = {}
+
+    def observe(self, source: str, verb: str, timings: dict[str, float], total: float, entries: Optional[int], error: Optional[str]) -> None:
+        labels = (('source', source), ('verb', verb))
+        with self._lock:
+            for (name, seconds) in timings.items():
+                self.phases.observe(labels + (('phase', name),), seconds)
+            self.requests.observe(labels, total)
+            if entries is not None:
+                self.entries.observe(labels, entries)
+            if error is not None:
+                key = labels + (('code', error),)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def expose(self) -> str:
+        with self._lock:
+            lines = [*self.phases.expose(), *self.requests.expose(), *self.entries.expose()]
+            lines.append('# HELP oai_errors_total OAI error responses by error code')
+            lines.append('# TYPE oai_errors_total counter')
+            lines.extend(f'oai_errors_total{format_labels(labels)} {count}' for (labels, count) in self.errors.items())
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+def format_labels(labels: Labels) -> str:
+    return '{' + ','.join(f'{key}="{value}"' for (key, value) in labels) + '}'
+
+def is_enabled() -> bool:
+    return APP.config['OAI_METRICS'] and has_request_context() and 'timings' in g
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Times a phase of the current request. Nested phases are not counted twice, their time is only added to the inner phase."""
+    if not is_enabled():
+        yield
+        return
+    frame = [perf_counter(), 0.0]
+    g.phase_stack.append(frame)
+    try:
+        yield
+    finally:
+        g.phase_stack.pop()
+        elapsed = perf_counter() - frame[0]
+        g.timings[name] = g.timings.get(name, 0.0) + elapsed - frame[1]
+        if g.phase_stack:
+            g.phase_stack[-1][1] += elapsed
+
+def observe_result(result: Any) -> None:
+    """Remembers the verb result of the request for the error and entry count metrics"""
+    if is_enabled():
+        g.oai_result = result
+
+def get_entries(result: Any) -> Optional[int]:
+    if isinstance(result, (ListRecords, StreamedListRecords)):
+        entries = result.record
+    elif isinstance(result, (ListIdentifiers, StreamedListIdentifiers)):
+        entries = result.header
+    elif isinstance(result, ListSets):
+        entries = result.set
+    else:
+        return None
+    return entries.count if isinstance(entries, PageStream) else len(entries)
+
+@APP.before_request
+def start_request() -> None:
+    if APP.config['OAI_METRICS'] and request.endpoint == 'oai_get':
+        g.timings = {}
+        g.phase_stack = []
+        g.request_start = perf_counter()
+
+@APP.after_request
+def finish_request(response: Response) -> Response:
+    # unknown sources are not observed, every label combination is kept forever
+    if not is_enabled() or response.status_code == 404:
+        return response
+    source = str(request.view_args.get('source')) # type: ignore
+    verb = request.args.get('verb')
+    verb = verb if any(x.value == verb for x in Verb) else 'unknown'
+    timings = g.timings
+    start = g.request_start
+    result = g.get('oai_result')
+    error = result.code.value if isinstance(result, Error) else None
+    response.headers['Server-Timing'] = ', '.join([*(f'{name};dur={seconds * 1000:.2f}' for (name, seconds) in timings.items()), f'total;dur={(perf_counter() - start) * 1000:.2f}'])
+    if not response.is_streamed:
+        METRICS.observe(source, verb, timings, perf_counter() - start, get_entries(result), error)
+        return response
+
+    # a streamed page is rendered while it is sent, so its render time and entry count are only known once it is closed
+    render_start = perf_counter()
+    plugin_time = timings.get('plugin', 0.0)
+    def observe_stream() -> None:
+        # plugin calls made while the page is rendered are already counted in the plugin phase
+        render_time = perf_counter() - render_start - (timings.get('plugin', 0.0) - plugin_time)
+        timings['render'] = timings.get('render', 0.0) + render_time
+        METRICS.observe(source, verb, timings, perf_counter() - start, get_entries(result), error)
+    response.call_on_close(observe_stream)
+    return response
@@ -1,5 +1,163 @@
+import asyncio
+from concurrent.futures import Future
+import functools
 import importlib
+import inspect
+import pathlib
 from types import ModuleType
+from typing import Any, Callable, Coroutine, Iterator, Optional
 
-def get_plugin(source: str) -> ModuleType:
-    return importlib.import_module(f'.plugins.{source}.convert', 'oai_pmh')
\ No newline at end of file
+from .exceptions import InvalidPluginException
+from .metrics import phase
+from .. import APP
+
+PLUGIN_DIRECTORY = pathlib.Path(__file__).parent.parent / 'plugins'
+# every plugin has to implement these functions in its convert.py, one per OAI verb
+REQUIRED_FUNCTIONS = ['create_identify', 'create_identifiers', 'create_records', 'create_record', 'create_metadata_formats', 'create_sets']
+OPTIONAL_FUNCTIONS = ['create_records_page', 'create_identifiers_page', 'create_sets_page', 'count_records', 'count_identifiers', 'get_record_datestamp', 'get_repository_version', 'preload']
+
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+# waits for the result of a coroutine that runs on the event loop
+_wait: Optional[Callable[[Future], Any]] = None
+_sources: Optional[frozenset[str]] = None
+# plugins by source, async plugins and plugins timed for the metrics are replaced by their wrapped copy
+_plugins: dict[str, ModuleType] = {}
+
+def get_sources() -> frozenset[str]:
+    """The names of all folders under plugins/ that contain a convert.py and of the federated sources in OAI_FEDERATED_SOURCES"""
+    global _sources
+    if _sources is None:
+        _sources = frozenset(x.parent.name for x in PLUGIN_DIRECTORY.glob('*/convert.py')) | frozenset(APP.config['OAI_FEDERATED_SOURCES'])
+    return _sources
+
+def get_plugin(source: str) -> Optional[ModuleType]:
+    """Returns the plugin of a source or None if there is none, so unknown sources never reach the import system"""
+    plugin = _plugins.get(source)
+    if plugin is None and source in get_sources():
+        plugin = load_plugin(source)
+    return plugin
+
+def load_plugin(source: str) -> ModuleType:
+    if source in APP.config['OAI_FEDERATED_SOURCES']:
+        _plugins[source] = load_federation(source)
+        return _plugins[source]
+    return register_plugin(source, importlib.import_module(f'.plugins.{source}.convert', 'oai_pmh'))
+
+def register_plugin(source: str, plugin: ModuleType) -> ModuleType:
+    """
+    Validates a plugin and serves it under `source`. Plugins under plugins/ are registered when they are discovered,
+    tests and benchmarks can register modules they build at runtime, whose __name__ has to be oai_pmh.plugins.<source>.convert.
+    """
+    global _sources
+    problems = validate_plugin(plugin)
+    if plugin.__name__ != f'oai_pmh.plugins.{source}.convert':
+        problems.append(f'its module is named {plugin.__name__}')
+    if problems:
+        raise InvalidPluginException(f'The plugin {source} is invalid: {", ".join(problems)}')
+    is_async = any(inspect.iscoroutinefunction(x) for x in vars(plugin).values())
+    _plugins[source] = wrap_plugin(plugin) if is_async or APP.config['OAI_METRICS'] else plugin
+    _sources = get_sources() | {source}
+    return _plugins[source]
+
+def load_federation(source: str) -> ModuleType:
+    """Builds a federated source from its members, which have to be plugins under plugins/"""
+    # imported here because the federation calls the member plugins through this module
+    from .federation import create_federation
+    members = APP.config['OAI_FEDERATED_SOURCES'][source]
+    if (PLUGIN_DIRECTORY / source / 'convert.py').exists():
+        raise InvalidPluginException(f'The federated source {source} has the name of a plugin')
+    invalid = [x for x in members if x in APP.config['OAI_FEDERATED_SOURCES'] or not (PLUGIN_DIRECTORY / x / 'convert.py').exists()]
+    if not members or invalid:
+        raise InvalidPluginException(f'The federated source {source} has invalid members: {", ".join(invalid) or "none"}')
+    federation = create_federation(source, {x: get_plugin(x) for x in members}) # type: ignore
+    # the calls of the federation are timed as a whole, including the merge of the member pages while they are rendered
+    return wrap_plugin(federation) if APP.config['OAI_METRICS'] else federation
+
+def validate_plugin(plugin: ModuleType) -> list[str]:
+    """Checks a plugin against the functions of the convert.py contract"""
+    problems = [f'{name} is missing' for name in REQUIRED_FUNCTIONS if not hasattr(plugin, name)]
+    problems += [f'{name} is not a function' for name in REQUIRED_FUNCTIONS + OPTIONAL_FUNCTIONS if hasattr(plugin, name) and not callable(getattr(plugin, name))]
+    return problems
+
+def discover_plugins() -> list[ModuleType]:
+    """Imports and validates every plugin, so a broken plugin fails at startup instead of on its first request"""
+    return [get_plugin(source) for source in sorted(get_sources())] # type: ignore
+
+def preload_plugins() -> None:
+    """Calls the optional preload() of every loaded plugin, which builds the indexes and stores the plugin needs for requests"""
+    for plugin in list(_plugins.values()):
+        if hasattr(plugin, 'preload'):
+            plugin.preload()
+
+def get_source(plugin: ModuleType) -> str:
+    return plugin.__name__.split('.')[-2]
+
+def is_trusted(plugin: ModuleType) -> bool:
+    return get_source(plugin) in APP.config['OAI_TRUSTED_PLUGINS']
+
+def set_event_loop(loop: Optional[asyncio.AbstractEventLoop], wait: Optional[Callable[[Future], Any]] = None) -> None:
+    """
+    Called by the ASGI app, coroutines of async plugins are then awaited on its event loop.
+    The request thread waits for them with `wait`, which lets the ASGI app run other requests in the meantime.
+    """
+    global _event_loop, _wait
+    _event_loop = loop
+    _wait = wait
+
+def run_coroutine(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Blocks the calling request thread until the coroutine of an async plugin function is done on the event loop of the ASGI app.
+    Outside of its request threads, e.g. under a WSGI server or in the flask CLI, there is no loop the plugin could share its
+    connections on, a loop per call would break them, so this raises instead.
+    """
+    try:
+        on_loop = asyncio.get_running_loop() is _event_loop
+    except RuntimeError:
+        on_loop = False
+    if _event_loop is None or not _event_loop.is_running() or on_loop:
+        coroutine.close()
+        raise RuntimeError('Plugin functions defined with async def can only be called by the request threads of the ASGI app in oai_pmh/asgi.py')
+    future = asyncio.run_coroutine_threadsafe(coroutine, _event_loop)
+    return _wait(future) if _wait is not None else future.result()
+
+def wrap_plugin(plugin: ModuleType) -> ModuleType:
+    """
+    Copies a plugin and wraps the functions of the convert.py contract, so the time spent in them is counted in the plugin phase
+    of the request metrics. Functions defined with `async def` are replaced by functions that block until their coroutine is done
+    on the event loop of the ASGI app, so the routes can call them like any other function.
+    """
+    wrapper = ModuleType(plugin.__name__, plugin.__doc__)
+    for (name, value) in vars(plugin).items():
+        if inspect.iscoroutinefunction(value):
+            setattr(wrapper, name, _time(_synchronize(value)))
+        elif name in REQUIRED_FUNCTIONS + OPTIONAL_FUNCTIONS and callable(value):
+            setattr(wrapper, name, _time(value))
+        else:
+            setattr(wrapper, name, value)
+    return wrapper
+
+def _synchronize(function: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Any]:
+    def call(*args: Any, **kwargs: Any) -> Any:
+        return run_coroutine(function(*args, **kwargs))
+    return functools.wraps(function)(call)
+
+def _time(function: Callable[..., Any]) -> Callable[..., Any]:
+    def call(*args: Any, **kwargs: Any) -> Any:
+        with phase('plugin'):
+            result = function(*args, **kwargs)
+        # lazy results are produced while the route iterates over them, e.g. while the page is filtered or rendered
+        return _time_iteration(result) if isinstance(result, Iterator) else result
+    return functools.wraps(function)(call)
+
+def _time_iteration(iterator: Iterator[Any]) -> Iterator[Any]:
+    try:
+        while True:
+            with phase('plugin'):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close() # type: ignore
\ No newline at end of file
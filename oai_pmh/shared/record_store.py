@@ -0,0 +1,150 @@
+from datetime import datetime
+import json
+import pathlib
+import sqlite3
+from threading import local
+from typing import Any, Iterable, Iterator, Optional
+
+from .selective import to_utc
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    identifier TEXT PRIMARY KEY,
+    datestamp TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_datestamp ON records (datestamp, identifier);
+CREATE TABLE IF NOT EXISTS record_sets (
+    set_spec TEXT NOT NULL,
+    datestamp TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    PRIMARY KEY (set_spec, datestamp, identifier)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS record_sets_identifier ON record_sets (identifier);
+CREATE TABLE IF NOT EXISTS sets (
+    set_spec TEXT PRIMARY KEY,
+    set_name TEXT NOT NULL,
+    set_description TEXT
+) WITHOUT ROWID;
+'''
+# the columns of a record and its set specs, which are aggregated in the query so a page of records is read with a single query
+RECORD_COLUMNS = '''records.*, (
+    SELECT GROUP_CONCAT(memberships.set_spec, char(31)) FROM record_sets AS memberships WHERE memberships.identifier = records.identifier
+) AS set_specs'''
+SET_SPEC_SEPARATOR = chr(31)
+
+def parse_datestamp(datestamp: str | datetime) -> datetime:
+    return to_utc(datestamp if isinstance(datestamp, datetime) else datetime.fromisoformat(datestamp))
+
+class RecordStore:
+    """
+    File based record store for plugins, backed by SQLite.
+    Records are indexed by identifier, by datestamp and by set membership, so a lookup by identifier
+    and a page of a from/until/set query only read the rows they return.
+    Rows are returned as dicts in the layout of the JSON files of the default plugin:
+    {"identifier": ..., "datestamp": datetime, "deleted": bool, "sets": [...], "metadata": {...}}
+    Datestamps are stored as naive UTC ISO strings, which sort like the datestamps, and returned as naive UTC datetimes.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = str(path)
+        self._local = local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads, so every thread opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def add_set(self, set_spec: str, set_name: str, set_description: Optional[str] = None) -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO sets VALUES (?, ?, ?)', (set_spec, set_name, set_description))
+
+    def load(self, records: Iterable[dict[str, Any]], set_spec: Optional[str] = None) -> int:
+        """Bulk loads records in the JSON layout, optionally as members of `set_spec`. Returns the number of loaded records."""
+        count = 0
+        with self._connection() as connection:
+            for record in records:
+                identifier = record['identifier']
+                datestamp = parse_datestamp(record['datestamp']).isoformat()
+                metadata = record.get('metadata')
+                previous = connection.execute('SELECT datestamp FROM records WHERE identifier = ?', (identifier,)).fetchone()
+                if previous is not None and previous['datestamp'] != datestamp:
+                    connection.execute('UPDATE record_sets SET datestamp = ? WHERE identifier = ?', (datestamp, identifier))
+                connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)', (
+                    identifier, datestamp, int(bool(record.get('deleted'))), json.dumps(metadata) if metadata is not None else None
+                ))
+                for spec in [*record.get('sets', []), *([set_spec] if set_spec is not None else [])]:
+                    connection.execute('INSERT OR IGNORE INTO record_sets VALUES (?, ?, ?)', (spec, datestamp, identifier))
+                count += 1
+        return count
+
+    def load_json(self, path: str | pathlib.Path, set_spec: Optional[str] = None) -> int:
+        with open(path, 'r', encoding='utf-8') as filestream:
+            return self.load(json.load(filestream), set_spec)
+
+    def get(self, identifier: str) -> Optional[dict[str, Any]]:
+        row = self._connection().execute(f'SELECT {RECORD_COLUMNS} FROM records WHERE identifier = ?', (identifier,)).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    def has_set(self, set_spec: str) -> bool:
+        return self._connection().execute('SELECT 1 FROM sets WHERE set_spec = ?', (set_spec,)).fetchone() is not None
+
+    def sets(self) -> list[dict[str, Any]]:
+        rows = self._connection().execute('SELECT * FROM sets ORDER BY set_spec').fetchall()
+        return [dict(row) for row in rows]
+
+    def find(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: Optional[int] = None) -> Iterator[dict[str, Any]]:
+        """Yields the matching records ordered by (datestamp, identifier), starting after the key `after`"""
+        (query, parameters) = self._query(RECORD_COLUMNS, start_date, end_date, set, after)
+        query += f' ORDER BY {"record_sets" if set is not None else "records"}.datestamp, identifier'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        for row in self._connection().execute(query, parameters):
+            yield self._to_record(row)
+
+    def count(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> int:
+        (query, parameters) = self._query('COUNT(*)', start_date, end_date, set, None)
+        return self._connection().execute(query, parameters).fetchone()[0]
+
+    def _query(self, columns: str, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str], after: Optional[tuple[datetime, str]]) -> tuple[str, list[Any]]:
+        # for set queries the (set_spec, datestamp, identifier) key of record_sets is scanned instead of the records table
+        if set is not None:
+            table = 'record_sets'
+            query = f'SELECT {columns} FROM record_sets JOIN records USING (identifier) WHERE record_sets.set_spec = ?'
+            parameters: list[Any] = [set]
+        else:
+            table = 'records'
+            query = f'SELECT {columns} FROM records WHERE 1'
+            parameters = []
+        if start_date is not None:
+            query += f' AND {table}.datestamp >= ?'
+            parameters.append(to_utc(start_date).isoformat())
+        if end_date is not None:
+            query += f' AND {table}.datestamp <= ?'
+            parameters.append(to_utc(end_date).isoformat())
+        if after is not None:
+            query += f' AND ({table}.datestamp, {table}.identifier) > (?, ?)'
+            parameters.extend([to_utc(after[0]).isoformat(), after[1]])
+        return (query, parameters)
+
+    def _to_record(self, row: sqlite3.Row) -> dict[str, Any]:
+        return {
+            'identifier': row['identifier'],
+            'datestamp': datetime.fromisoformat(row['datestamp']),
+            'deleted': bool(row['deleted']),
+            'sets': sorted(row['set_specs'].split(SET_SPEC_SEPARATOR)) if row['set_specs'] is not None else [],
+            'metadata': json.loads(row['metadata']) if row['metadata'] is not None else None
+        }
@@ -0,0 +1,92 @@
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, TypeVar
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from .. import APP
+from .exceptions import BadResumptionTokenException
+from ..generated.models import Header, ResumptionToken
+
+T = TypeVar('T')
+
+@dataclass(frozen=True)
+class Cursor:
+    """Everything needed to continue an incomplete list, so no state has to be kept on the server"""
+    verb: str
+    source: str
+    metadata_prefix: Optional[str] = None
+    set: Optional[str] = None
+    fr0m: Optional[str] = None
+    until: Optional[str] = None
+    last_datestamp: Optional[str] = None
+    last_identifier: Optional[str] = None
+    offset: int = 0
+    complete_list_size: Optional[int] = None
+    # set in the tokens of snapshot pages, which do not expire while their page exists
+    snapshot: Optional[bool] = None
+
+    def after(self) -> Optional[tuple[datetime, str]]:
+        if self.last_datestamp is None or self.last_identifier is None:
+            return None
+        return (datetime.fromisoformat(self.last_datestamp), self.last_identifier)
+
+    def advance(self, last_datestamp: Optional[datetime], last_identifier: str, count: int) -> 'Cursor':
+        return replace(self,
+            last_datestamp=last_datestamp.isoformat() if last_datestamp is not None else None,
+            last_identifier=last_identifier,
+            offset=self.offset + count,
+            # a page answered dynamically links to a dynamic page, even if it was requested with a snapshot token
+            snapshot=None)
+
+def has_default_secret() -> bool:
+    """Whether resumption tokens are signed with the SECRET_KEY of __init__.py, with which anyone can forge them"""
+    return not APP.config['OAI_RESUMPTION_TOKEN_SECRET'] and APP.config['SECRET_KEY'] in [None, '', 'dev']
+
+def get_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(APP.config['OAI_RESUMPTION_TOKEN_SECRET'] or APP.config['SECRET_KEY'], salt='oai-resumption-token')
+
+def encode_cursor(cursor: Cursor) -> str:
+    return get_serializer().dumps({key: value for (key, value) in asdict(cursor).items() if value is not None})
+
+def decode_cursor(token: str, verb: str, source: str, snapshot: bool = False) -> Cursor:
+    """
+    Checks the signature and expiry of a resumption token. With `snapshot` only the tokens of snapshot pages are accepted,
+    and as they are only served while their page exists their age is not checked.
+    """
+    try:
+        data = get_serializer().loads(token, max_age=None if snapshot else APP.config['OAI_RESUMPTION_TOKEN_TTL'])
+        cursor = Cursor(**data)
+    except (BadSignature, TypeError):
+        raise BadResumptionTokenException()
+    if cursor.verb != verb or cursor.source != source or (snapshot and not cursor.snapshot):
+        raise BadResumptionTokenException()
+    return cursor
+
+def header_key(header: Header) -> tuple[datetime, str]:
+    return (header.datestamp, header.identifier)
+
+def slice_page(items: list[T], key: Callable[[T], Any], after: Optional[Any], limit: int) -> tuple[list[T], int]:
+    """Emulates a keyset page on top of a plugin that can only return the complete list"""
+    ordered = sorted(items, key=key)
+    start = bisect_right([key(x) for x in ordered], after) if after is not None else 0
+    return ordered[start:start + limit], len(ordered)
+
+def create_resumption_token(cursor: Optional[Cursor], next_cursor: Optional[Cursor], complete_list_size: Optional[int]) -> Optional[ResumptionToken]:
+    """
+    Builds the resumptionToken element of a page.
+    The first page of a complete list has no token, the last page of an incomplete list has an empty one.
+    """
+    if cursor is None and next_cursor is None:
+        return None
+    token_data: dict[str, Any] = {
+        'cursor': cursor.offset if cursor is not None else 0,
+        'content': encode_cursor(next_cursor) if next_cursor is not None else ''
+    }
+    if complete_list_size is not None:
+        token_data['completeListSize'] = complete_list_size
+    if next_cursor is not None:
+        expiration_date = datetime.utcnow() + timedelta(seconds=APP.config['OAI_RESUMPTION_TOKEN_TTL'])
+        token_data['expirationDate'] = expiration_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return ResumptionToken.from_dict(token_data)
@@ -0,0 +1,140 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from types import ModuleType
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from .resumption import header_key
+from ..generated.models import Header
+
+T = TypeVar('T')
+
+FILTERS = frozenset(['from', 'until', 'set'])
+
+PluginFilters = tuple[Optional[datetime], Optional[datetime], Optional[str]]
+
+def to_utc(datestamp: datetime) -> datetime:
+    """Naive UTC datetime of a datestamp, naive datestamps are taken as UTC like everywhere else in the server"""
+    if datestamp.tzinfo is not None:
+        return datestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return datestamp
+
+def native_filters(plugin: ModuleType) -> frozenset[str]:
+    """
+    The filters a plugin applies itself, declared with NATIVE_FILTERS in its convert.py.
+    Plugins without the declaration are expected to handle from, until and set.
+    """
+    return frozenset(getattr(plugin, 'NATIVE_FILTERS', FILTERS))
+
+def split_filters(plugin: ModuleType, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str]) -> tuple[PluginFilters, Optional[Callable[[Header], bool]]]:
+    """
+    Splits the selective harvesting arguments into the ones that are passed to the plugin and a
+    predicate for the ones the server has to apply. The predicate is None if the plugin handles all of them.
+    """
+    native = native_filters(plugin)
+    plugin_filters = (
+        start_date if 'from' in native else None,
+        end_date if 'until' in native else None,
+        set if 'set' in native else None
+    )
+    check_start = start_date is not None and 'from' not in native
+    check_end = end_date is not None and 'until' not in native
+    check_set = set is not None and 'set' not in native
+    if not (check_start or check_end or check_set):
+        return (plugin_filters, None)
+
+    def matches(header: Header) -> bool:
+        if check_start and header.datestamp < start_date:
+            return False
+        if check_end and header.datestamp > end_date:
+            return False
+        if check_set and set not in (header.set_spec or []):
+            return False
+        return True
+    return (plugin_filters, matches)
+
+def server_filters(plugin: ModuleType, start_date: Optional[datetime], end_date: Optional[datetime], set: Optional[str]) -> PluginFilters:
+    """The selective harvesting arguments the server applies itself, None for the ones the plugin handles"""
+    native = native_filters(plugin)
+    return (
+        start_date if 'from' not in native else None,
+        end_date if 'until' not in native else None,
+        set if 'set' not in native else None
+    )
+
+def filter_pages(create_page: Callable[[Optional[tuple[datetime, str]], int], Iterable[T]], header_of: Callable[[T], Header], matches: Optional[Callable[[Header], bool]], after: Optional[tuple[datetime, str]], limit: int) -> Iterable[T]:
+    """Returns up to `limit` entries of a paged plugin function, asking for further pages while entries are removed by `matches`"""
+    if matches is None:
+        return create_page(after, limit)
+    return _filter_pages(create_page, header_of, matches, after, limit)
+
+def _filter_pages(create_page: Callable[[Optional[tuple[datetime, str]], int], Iterable[T]], header_of: Callable[[T], Header], matches: Callable[[Header], bool], after: Optional[tuple[datetime, str]], limit: int) -> Iterator[T]:
+    count = 0
+    while True:
+        page = list(create_page(after, limit))
+        for item in page:
+            if matches(header_of(item)):
+                yield item
+                count += 1
+                if count == limit:
+                    return
+        if len(page) < limit:
+            return
+        after = header_key(header_of(page[-1]))
+
+class HarvestIndex:
+    """
+    In-memory index over the headers of a repository that answers selective harvesting queries with positions
+    before any record is built. The entries are sorted by (datestamp, identifier), so from/until and a resumption
+    cursor are bisections, and every set is a bitmap over the sorted positions that is intersected with that range.
+    """
+
+    def __init__(self, entries: Iterable[tuple[str, datetime, Iterable[str]]]):
+        ordered = sorted((to_utc(datestamp), identifier, tuple(sets)) for (identifier, datestamp, sets) in entries)
+        self.datestamps = [x[0] for x in ordered]
+        self.identifiers = [x[1] for x in ordered]
+        bitmaps: dict[str, bytearray] = {}
+        for (position, (_, _, sets)) in enumerate(ordered):
+            for spec in sets:
+                bitmap = bitmaps.setdefault(spec, bytearray(len(ordered) // 8 + 1))
+                bitmap[position >> 3] |= 1 << (position & 7)
+        self.sets = {spec: int.from_bytes(bitmap, 'little') for (spec, bitmap) in bitmaps.items()}
+
+    def __len__(self) -> int:
+        return len(self.identifiers)
+
+    def bounds(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, after: Optional[tuple[datetime, str]] = None) -> tuple[int, int]:
+        """The half open range of positions between from, until and the resumption cursor `after`"""
+        start = bisect_left(self.datestamps, to_utc(start_date)) if start_date is not None else 0
+        end = bisect_right(self.datestamps, to_utc(end_date)) if end_date is not None else len(self.datestamps)
+        if after is not None:
+            low = bisect_left(self.datestamps, to_utc(after[0]))
+            high = bisect_right(self.datestamps, to_utc(after[0]), low)
+            start = max(start, bisect_right(self.identifiers, after[1], low, high))
+        return (start, max(start, end))
+
+    def select(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None, after: Optional[tuple[datetime, str]] = None, limit: Optional[int] = None) -> Iterator[int]:
+        """Yields the positions of the matching entries in (datestamp, identifier) order"""
+        (start, end) = self.bounds(start_date, end_date, after)
+        if limit is not None and set is None:
+            end = min(end, start + limit)
+        if set is None:
+            yield from range(start, end)
+            return
+        bitmap = (self.sets.get(set, 0) >> start) & ((1 << (end - start)) - 1)
+        count = 0
+        while bitmap and (limit is None or count < limit):
+            offset = (bitmap & -bitmap).bit_length() - 1
+            start += offset
+            yield start
+            count += 1
+            bitmap >>= offset + 1
+            start += 1
+
+    def count(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, set: Optional[str] = None) -> int:
+        (start, end) = self.bounds(start_date, end_date)
+        if set is None:
+            return end - start
+        return ((self.sets.get(set, 0) >> start) & ((1 << (end - start)) - 1)).bit_count()
+
+    def has_set(self, set: str) -> bool:
+        return set in self.sets
@@ -0,0 +1,190 @@
+from dataclasses import asdict, dataclass, field
+import gzip
+import json
+import os
+import pathlib
+import tempfile
+from threading import Lock
+from types import ModuleType
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+
+from .. import APP
+from .compression import brotli, negotiate_encoding
+from .exceptions import BadResumptionTokenException
+from .resumption import decode_cursor
+from ..generated.models import MetadataPrefix, Verb
+
+# source, verb, metadata prefix and set of a harvest
+SnapshotKey = tuple[str, str, str, Optional[str]]
+
+SNAPSHOT_VERBS = [Verb.LISTRECORDS.value, Verb.LISTIDENTIFIERS.value]
+SUFFIXES = {None: '.xml', 'gzip': '.xml.gz', 'br': '.xml.br'}
+# quoted set specs never contain a % that is not followed by two hex digits
+ALL_SETS = '%all'
+
+@dataclass
+class SnapshotPage:
+    # datestamp and identifier of the last entry of the previous page, None for the first page
+    after: Optional[list[str]]
+    offset: int
+    count: int
+    digest: str
+    # the resumption token that requests this page, None for the first page
+    token: Optional[str] = None
+
+@dataclass
+class Manifest:
+    """Describes the pages of a snapshot, the page files are named after their position"""
+    source: str
+    verb: str
+    metadata_prefix: str
+    set: Optional[str]
+    base_url: str
+    page_size: int
+    built: str
+    pages: list[SnapshotPage] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.pages = [x if isinstance(x, SnapshotPage) else SnapshotPage(**x) for x in self.pages]
+        self._positions = {tuple(x.after) if x.after is not None else None: position for (position, x) in enumerate(self.pages)}
+
+    def find(self, after: Optional[tuple[str, str]]) -> Optional[int]:
+        return self._positions.get(after)
+
+def quote_part(value: str) -> str:
+    """A file name for a part of a snapshot key, '/' and the names '.' and '..' are quoted as well"""
+    quoted = quote(value, safe='')
+    return quoted.replace('.', '%2E') if quoted in ['.', '..'] else quoted
+
+def get_snapshot_directory(directory: str | pathlib.Path, key: SnapshotKey) -> pathlib.Path:
+    """The directory of a snapshot, raises ValueError if the key would lead outside of `directory`"""
+    (source, verb, metadata_prefix, set) = key
+    # set specs may contain ':', which is not allowed in file names on every platform
+    snapshot_directory = pathlib.Path(directory) / quote_part(source) / quote_part(verb) / quote_part(metadata_prefix) / (quote_part(set) if set is not None else ALL_SETS)
+    if not snapshot_directory.resolve().is_relative_to(pathlib.Path(directory).resolve()):
+        raise ValueError(f'The snapshot {key} is outside of {directory}')
+    return snapshot_directory
+
+def get_page_path(snapshot_directory: pathlib.Path, position: int, encoding: Optional[str] = None) -> pathlib.Path:
+    return snapshot_directory / 'pages' / f'{position:06d}{SUFFIXES[encoding]}'
+
+def read_manifest(snapshot_directory: pathlib.Path) -> Optional[Manifest]:
+    try:
+        with open(snapshot_directory / 'manifest.json', encoding='utf-8') as filestream:
+            return Manifest(**json.load(filestream))
+    except FileNotFoundError:
+        return None
+
+def write_manifest(snapshot_directory: pathlib.Path, manifest: Manifest) -> None:
+    data = asdict(manifest)
+    write_file(snapshot_directory / 'manifest.json', json.dumps(data, indent=2).encode('utf-8'))
+
+def write_page(snapshot_directory: pathlib.Path, position: int, xml: bytes) -> None:
+    """Writes a page uncompressed and in every content coding, compressed with the highest level as it is only done once"""
+    write_file(get_page_path(snapshot_directory, position), xml)
+    write_file(get_page_path(snapshot_directory, position, 'gzip'), gzip.compress(xml, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_file(get_page_path(snapshot_directory, position, 'br'), brotli.compress(xml, quality=11))
+
+def remove_pages(snapshot_directory: pathlib.Path, start: int) -> None:
+    """Removes the files of all pages from position `start` on"""
+    for path in (snapshot_directory / 'pages').glob('*.xml*'):
+        if int(path.name.split('.', 1)[0]) >= start:
+            path.unlink(missing_ok=True)
+
+def write_file(path: pathlib.Path, data: bytes) -> None:
+    # written next to the file and moved in place, so a running server never sends a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    (handle, temp_path) = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(handle, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+class SnapshotIndex:
+    """Keeps the manifests of a snapshot directory in memory, a manifest is read again when its file changes"""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._manifests: dict[SnapshotKey, tuple[float, Optional[Manifest]]] = {}
+        self._lock = Lock()
+
+    def get(self, key: SnapshotKey) -> Optional[tuple[pathlib.Path, Manifest]]:
+        try:
+            snapshot_directory = get_snapshot_directory(self._directory, key)
+            modified = (snapshot_directory / 'manifest.json').stat().st_mtime
+        except (ValueError, FileNotFoundError):
+            return None
+        with self._lock:
+            entry = self._manifests.get(key)
+        if entry is None or entry[0] != modified:
+            entry = (modified, read_manifest(snapshot_directory))
+            with self._lock:
+                self._manifests[key] = entry
+        return (snapshot_directory, entry[1]) if entry[1] is not None else None
+
+_snapshot_index: Optional[SnapshotIndex] = None
+
+def get_snapshot_index() -> Optional[SnapshotIndex]:
+    global _snapshot_index
+    if _snapshot_index is None and APP.config['OAI_SNAPSHOT_DIR'] is not None:
+        _snapshot_index = SnapshotIndex(APP.config['OAI_SNAPSHOT_DIR'])
+    return _snapshot_index
+
+def get_requested_page(plugin: ModuleType, source: str) -> Optional[tuple[SnapshotKey, Optional[tuple[str, str]]]]:
+    """The snapshot and the position in it a request asks for, None if no snapshot can answer the request"""
+    verb = request.args.get('verb')
+    if verb not in SNAPSHOT_VERBS:
+        return None
+    arguments = set(request.args.keys())
+    resumption_token = request.args.get('resumptionToken')
+    if resumption_token is None:
+        if 'metadataPrefix' not in arguments or not arguments <= {'verb', 'metadataPrefix', 'set'}:
+            return None
+        # the arguments are not validated before the snapshot is looked up, unknown prefixes are answered dynamically with an error
+        if not any(x.value == request.args['metadataPrefix'] for x in MetadataPrefix):
+            return None
+        return ((source, verb, request.args['metadataPrefix'], request.args.get('set')), None)
+    if arguments != {'verb', 'resumptionToken'}:
+        return None
+    try:
+        # snapshot tokens are served as long as their page exists, dynamic tokens and the dynamic pages still expire
+        cursor = decode_cursor(resumption_token, verb, plugin.__name__, snapshot=True)
+    except BadResumptionTokenException:
+        return None
+    after = cursor.after()
+    if cursor.metadata_prefix is None or cursor.fr0m is not None or cursor.until is not None or after is None:
+        return None
+    return ((source, verb, cursor.metadata_prefix, cursor.set), (cursor.last_datestamp, cursor.last_identifier)) # type: ignore
+
+def snapshot_response(plugin: ModuleType, source: str) -> Optional[Response]:
+    """
+    Answers full harvests with the pages written by `flask build-snapshots`, the files are sent as they are,
+    so no model is built and no template is rendered. Returns None if the request has to be answered dynamically.
+    """
+    index = get_snapshot_index()
+    if index is None:
+        return None
+    requested = get_requested_page(plugin, source)
+    if requested is None:
+        return None
+    (key, after) = requested
+    snapshot = index.get(key)
+    if snapshot is None:
+        return None
+    (snapshot_directory, manifest) = snapshot
+    position = manifest.find(after)
+    if position is None or manifest.base_url != request.base_url:
+        return None
+    encoding = negotiate_encoding()
+    path = get_page_path(snapshot_directory, position, encoding)
+    if not path.exists():
+        encoding = None
+        path = get_page_path(snapshot_directory, position)
+    response = send_file(path, mimetype='application/xml', conditional=True)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,36 @@
+import gc
+
+from .exceptions import InsecureSecretException
+from .plugin_handler import discover_plugins, preload_plugins
+from .resumption import has_default_secret
+from .validation import get_schema
+from .. import APP
+
+def precompile_templates() -> None:
+    """Compiles every template into the template cache of the app, so the first request of a worker renders without compiling"""
+    for name in APP.jinja_env.list_templates(extensions=['jinja']):
+        APP.jinja_env.get_template(name)
+
+def start() -> None:
+    """Called by the entry points of servers, oai_pmh/wsgi.py and the lifespan of the ASGI app, before the first request"""
+    if has_default_secret():
+        raise InsecureSecretException('Resumption tokens would be signed with the default SECRET_KEY, set FLASK_SECRET_KEY or FLASK_OAI_RESUMPTION_TOKEN_SECRET')
+    warm_up()
+
+def warm_up() -> None:
+    """
+    Loads everything requests need before the first request, unless OAI_WARM_UP is off. It is called by the entry points of servers
+    and not when the package is imported, so the flask CLI and tests start without it.
+    Prefork servers that import the app before they fork, e.g. `gunicorn --preload`, share this state copy-on-write between their workers.
+    """
+    if not APP.config['OAI_WARM_UP']:
+        return
+    discover_plugins()
+    precompile_templates()
+    preload_plugins()
+    if APP.config['OAI_VALIDATION_SAMPLE_RATE'] > 0 or APP.config['OAI_VALIDATION_STRICT']:
+        # compiled here instead of on the first validated response
+        get_schema()
+    # the objects loaded so far live as long as the process, frozen they are never touched by the garbage collector,
+    # which would otherwise write to the shared pages of every worker and copy them
+    gc.freeze()
@@ -0,0 +1,82 @@
+from typing import Any, Callable, Generic, Iterable, Iterator, Optional, TypeVar
+
+from flask import Response, stream_with_context
+
+from .. import APP
+from ..generated.models import Header, Record, ResumptionToken
+
+T = TypeVar('T')
+
+class PageStream(Generic[T]):
+    """
+    Lazily iterates over at most `limit` entries of a plugin result.
+    The resumption token of the page is only known after the page has been iterated, so it is created on first access.
+    """
+
+    def __init__(self, items: Iterable[T], limit: int, create_token: Callable[[Optional[T], int, bool], Optional[ResumptionToken]]):
+        self._items = iter(items)
+        self._head = next(self._items, None)
+        self._limit = limit
+        self._create_token = create_token
+        self._last: Optional[T] = None
+        self._count = 0
+        self._has_more = False
+        self._token: Optional[ResumptionToken] = None
+        self._exhausted = False
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def is_empty(self) -> bool:
+        return self._head is None
+
+    def __iter__(self) -> Iterator[T]:
+        if self._head is None:
+            self._exhausted = True
+            return
+        self._last = self._head
+        self._count = 1
+        yield self._head
+        for item in self._items:
+            if self._count == self._limit:
+                self._has_more = True
+                break
+            self._last = item
+            self._count += 1
+            yield item
+        self._exhausted = True
+
+    @property
+    def resumption_token(self) -> Optional[ResumptionToken]:
+        if not self._exhausted:
+            raise RuntimeError('The resumption token of a page is only known after the page has been iterated')
+        if self._token is None:
+            self._token = self._create_token(self._last, self._count, self._has_more)
+        return self._token
+
+class StreamedListRecords:
+    """Stands in for ListRecords in streaming mode, the records are rendered while they are produced by the plugin"""
+
+    def __init__(self, record: PageStream[Record]):
+        self.record = record
+
+    @property
+    def resumption_token(self) -> Optional[ResumptionToken]:
+        return self.record.resumption_token
+
+class StreamedListIdentifiers:
+    """Stands in for ListIdentifiers in streaming mode, the headers are rendered while they are produced by the plugin"""
+
+    def __init__(self, header: PageStream[Header]):
+        self.header = header
+
+    @property
+    def resumption_token(self) -> Optional[ResumptionToken]:
+        return self.header.resumption_token
+
+def stream_xml(template_name: str, **context: Any) -> Response:
+    APP.update_template_context(context)
+    stream = APP.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(APP.config['OAI_STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream), mimetype='application/xml')
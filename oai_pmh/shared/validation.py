@@ -0,0 +1,180 @@
+from collections import deque
+from datetime import datetime, timezone
+import functools
+import os
+import pathlib
+from queue import Full, Queue
+import random
+from threading import Lock, Thread
+from typing import Any, Iterable, Iterator, Optional
+from xml.etree import ElementTree
+
+from flask import Response, request
+from xmlschema import XMLSchema
+
+from .exceptions import InvalidResponseException
+from .. import APP
+
+SCHEMA_DIRECTORY = pathlib.Path(__file__).parent.parent / 'schemas'
+OAI_NAMESPACE = '{http://www.openarchives.org/OAI/2.0/}'
+MAX_FAILURES = 100
+
+# source, verb and identifier of the request a response belongs to
+Job = tuple[str, Optional[str], Optional[str]]
+Failure = dict[str, Any]
+
+@functools.cache
+def get_schema() -> XMLSchema:
+    """
+    Compiles the bundled OAI-PMH, oai_dc and marcxml schemas once.
+    The Dublin Core schema is added before the schemas that import it, so no import is fetched from the network.
+    """
+    schema = XMLSchema(str(SCHEMA_DIRECTORY / 'OAI-PMH.xsd'), build=False)
+    schema.add_schema(str(SCHEMA_DIRECTORY / 'simpledc20021212.xsd'))
+    schema.add_schema(str(SCHEMA_DIRECTORY / 'oai_dc.xsd'))
+    schema.add_schema(str(SCHEMA_DIRECTORY / 'MARC21slim.xsd'))
+    schema.build()
+    return schema
+
+def create_failure(job: Job, reason: str, path: Optional[str], identifier: Optional[str] = None) -> Failure:
+    (source, verb, request_identifier) = job
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': source,
+        'verb': verb,
+        'identifier': identifier or request_identifier,
+        'reason': reason,
+        'path': path
+    }
+
+def validate(xml: bytes, job: Job) -> list[Failure]:
+    """Validates a response and returns one failure per violation, failures inside a record name the identifier of the record"""
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError as error:
+        return [create_failure(job, f'The response is not well-formed: {error}', None)]
+    errors = list(get_schema().iter_errors(root))
+    if not errors:
+        return []
+    parents = {child: parent for parent in root.iter() for child in parent}
+    return [create_failure(job, error.reason or str(error), error.path, find_identifier(error.elem, parents)) for error in errors]
+
+def find_identifier(element: Optional[ElementTree.Element], parents: dict[ElementTree.Element, ElementTree.Element]) -> Optional[str]:
+    while element is not None:
+        if element.tag == f'{OAI_NAMESPACE}header':
+            identifier = element.find(f'{OAI_NAMESPACE}identifier')
+            return identifier.text if identifier is not None else None
+        if element.tag == f'{OAI_NAMESPACE}record':
+            identifier = element.find(f'{OAI_NAMESPACE}header/{OAI_NAMESPACE}identifier')
+            return identifier.text if identifier is not None else None
+        element = parents.get(element)
+    return None
+
+class ResponseValidator:
+    """
+    Validates sampled responses in a background thread, so the schema never slows down a request.
+    Responses are dropped instead of queued if the worker falls behind. The schema is compiled by the worker when it starts.
+    """
+
+    def __init__(self, queue_size: int):
+        self._queue: Queue[tuple[bytes, Job]] = Queue(queue_size)
+        self._lock = Lock()
+        self.failures: deque[Failure] = deque(maxlen=MAX_FAILURES)
+        self.validated = 0
+        self.invalid = 0
+        self.dropped = 0
+        self._worker = Thread(target=self._run, name='oai-pmh-validation', daemon=True)
+        self._worker.start()
+
+    def submit(self, xml: bytes, job: Job) -> None:
+        try:
+            self._queue.put_nowait((xml, job))
+        except Full:
+            with self._lock:
+                self.dropped += 1
+
+    def record(self, failures: list[Failure]) -> None:
+        with self._lock:
+            self.validated += 1
+            if failures:
+                self.invalid += 1
+                self.failures.extend(failures)
+        for failure in failures:
+            APP.logger.warning('Invalid %s response of %s for %s at %s: %s', failure['verb'], failure['source'], failure['identifier'], failure['path'], failure['reason'])
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'validated': self.validated,
+                'invalid': self.invalid,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize(),
+                'failures': list(self.failures)
+            }
+
+    def _run(self) -> None:
+        get_schema()
+        while True:
+            (xml, job) = self._queue.get()
+            try:
+                failures = validate(xml, job)
+            except Exception as error: # the worker must survive unexpected errors of the validator
+                failures = [create_failure(job, f'The validation failed: {error}', None)]
+            self.record(failures)
+
+_validator: Optional[ResponseValidator] = None
+_validator_pid: Optional[int] = None
+_validator_lock = Lock()
+
+def get_validator() -> ResponseValidator:
+    """
+    The validator of this process. A process forked by a prefork server, e.g. with `gunicorn --preload`, inherits the
+    validator of its parent but not its worker thread, so it starts a validator of its own.
+    """
+    global _validator, _validator_pid
+    with _validator_lock:
+        if _validator is None or _validator_pid != os.getpid():
+            _validator = ResponseValidator(APP.config['OAI_VALIDATION_QUEUE_SIZE'])
+            _validator_pid = os.getpid()
+        return _validator
+
+def validate_response(response: Response, source: str) -> Response:
+    """
+    Validates the XML of a response against the bundled schemas.
+    In strict mode every response is validated before it is sent and an invalid one raises InvalidResponseException,
+    streamed responses are buffered for it, as they could not be rejected any more once their first chunk is sent.
+    Otherwise the share OAI_VALIDATION_SAMPLE_RATE of all responses is validated in the background and failures are only recorded.
+    """
+    strict = APP.config['OAI_VALIDATION_STRICT']
+    if not strict and random.random() >= APP.config['OAI_VALIDATION_SAMPLE_RATE']:
+        return response
+    job = (source, request.args.get('verb'), request.args.get('identifier'))
+    if response.is_streamed and not strict:
+        response.response = collect_stream(response.response, job)
+    else:
+        # buffers a streamed response, which is then sent like a rendered one
+        check(response.get_data(), job, strict)
+    return response
+
+def collect_stream(chunks: Iterable[Any], job: Job) -> Iterator[Any]:
+    """Passes a streamed response through and submits it to the background validation once it is complete"""
+    parts = []
+    iterator = iter(chunks)
+    try:
+        for chunk in iterator:
+            parts.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()
+    check(b''.join(parts), job, False)
+
+def check(xml: bytes, job: Job, strict: bool) -> None:
+    validator = get_validator()
+    if not strict:
+        validator.submit(xml, job)
+        return
+    failures = validate(xml, job)
+    validator.record(failures)
+    if failures:
+        raise InvalidResponseException('\n'.join(f'{x["path"]}: {x["reason"]} (identifier {x["identifier"]})' for x in failures))
@@ -0,0 +1,10 @@
+"""
+WSGI entry point of prefork servers, e.g. `gunicorn --preload --workers 4 'oai_pmh.wsgi:APP'`
+
+Importing it checks the configuration and warms the app up. With --preload this happens once in the parent process, whose workers
+share the loaded plugins, templates and schemas copy-on-write.
+"""
+from . import APP
+from .shared.startup import start
+
+start()
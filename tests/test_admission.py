@@ -0,0 +1,102 @@
+"""
+Tests of the admission control, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.shared.admission import Admission, PageSizer
+
+class AdmissionTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.executor = ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+
+    def wait_until_queued(self, admission: Admission, waiting: int) -> None:
+        deadline = time.monotonic() + 5
+        while admission.stats()['waiting'] < waiting:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_waiting_requests_get_the_released_slot(self) -> None:
+        admission = Admission(1, 1, 5)
+        self.assertTrue(admission.acquire())
+        waiting = self.executor.submit(admission.acquire)
+        self.wait_until_queued(admission, 1)
+        admission.release(0.5)
+        self.assertTrue(waiting.result(5))
+        stats = admission.stats()
+        self.assertEqual((stats['active'], stats['waiting'], stats['admitted'], stats['queued'], stats['shed']), (1, 0, 2, 1, 0))
+
+    def test_requests_that_find_the_queue_full_are_shed(self) -> None:
+        admission = Admission(1, 1, 5)
+        self.assertTrue(admission.acquire())
+        waiting = self.executor.submit(admission.acquire)
+        self.addCleanup(admission.release, 0)
+        self.wait_until_queued(admission, 1)
+        self.assertFalse(admission.acquire())
+        self.assertEqual(admission.stats()['shed'], 1)
+        admission.release(0)
+        self.assertTrue(waiting.result(5))
+
+    def test_waiting_requests_time_out(self) -> None:
+        admission = Admission(1, 4, 0.01)
+        self.assertTrue(admission.acquire())
+        self.assertFalse(admission.acquire())
+        stats = admission.stats()
+        self.assertEqual((stats['active'], stats['waiting'], stats['shed'], stats['timed_out']), (1, 0, 1, 1))
+
+    def test_retry_after_grows_with_the_queue(self) -> None:
+        admission = Admission(2, 8, 5)
+        # one second per request until a duration was measured
+        self.assertEqual(admission.retry_after(), 1)
+        self.assertTrue(admission.acquire())
+        admission.release(4.0)
+        self.assertEqual(admission.stats()['mean_duration'], 4.0)
+        self.assertEqual(admission.retry_after(), 2)
+        self.assertTrue(admission.acquire())
+        admission.release(9.0)
+        # the moving average only moves part of the way to a new duration
+        self.assertAlmostEqual(admission.stats()['mean_duration'], 5.0)
+        self.assertEqual(admission.retry_after(), 3)
+
+class PageSizerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = {x: APP.config[x] for x in ['OAI_PAGE_SIZE', 'OAI_PAGE_LATENCY_TARGET', 'OAI_MIN_PAGE_SIZE']}
+        self.addCleanup(APP.config.update, self.config)
+        APP.config.update(OAI_PAGE_SIZE=100, OAI_PAGE_LATENCY_TARGET=1.0, OAI_MIN_PAGE_SIZE=10)
+        self.sizer = PageSizer()
+
+    def test_unmeasured_pages_have_the_full_size(self) -> None:
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 100)
+        self.sizer.observe('default', 'ListRecords', 1.0, 0)
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 100)
+
+    def test_slow_pages_shrink(self) -> None:
+        self.sizer.observe('default', 'ListRecords', 2.0, 100)
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 50)
+        # sources and verbs are measured separately
+        self.assertEqual(self.sizer.page_size('default', 'ListIdentifiers'), 100)
+        self.assertEqual(self.sizer.page_size('other', 'ListRecords'), 100)
+
+    def test_page_sizes_stay_within_the_bounds(self) -> None:
+        self.sizer.observe('default', 'ListRecords', 100.0, 10)
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 10)
+        self.sizer.observe('default', 'ListIdentifiers', 0.001, 100)
+        self.assertEqual(self.sizer.page_size('default', 'ListIdentifiers'), 100)
+        APP.config['OAI_PAGE_LATENCY_TARGET'] = 0
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 100)
+
+    def test_costs_are_smoothed(self) -> None:
+        self.sizer.observe('default', 'ListRecords', 1.0, 50)
+        self.sizer.observe('default', 'ListRecords', 1.0, 100)
+        # 0.2 * 0.01 + 0.8 * 0.02 seconds per entry
+        self.assertEqual(self.sizer.page_size('default', 'ListRecords'), 55)
+
+if __name__ == '__main__':
+    unittest.main()
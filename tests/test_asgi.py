@@ -0,0 +1,197 @@
+"""
+Tests of the ASGI app, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from threading import Barrier, Event, Lock
+from types import ModuleType
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.asgi import AsgiApp, RequestSlots
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.plugin_handler import REQUIRED_FUNCTIONS, register_plugin, set_event_loop
+
+def create_plugin(source: str, create_identify) -> ModuleType:
+    """A complete plugin that answers like the default plugin, except for its own create_identify"""
+    plugin = ModuleType(f'oai_pmh.plugins.{source}.convert')
+    for name in REQUIRED_FUNCTIONS:
+        setattr(plugin, name, getattr(default, name))
+    plugin.create_identify = create_identify # type: ignore
+    return plugin
+
+async def get(app: AsgiApp, path: str, query: str) -> int:
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('latin-1'), 'headers': [],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 5000), 'client': ('127.0.0.1', 0)
+    }
+    status = 0
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+    await app(scope, receive, send)
+    return status
+
+class AsyncPluginTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.admission_limit = APP.config['OAI_ADMISSION_LIMIT']
+        APP.config['OAI_ADMISSION_LIMIT'] = 0
+
+    def tearDown(self) -> None:
+        APP.config['OAI_ADMISSION_LIMIT'] = self.admission_limit
+
+    async def test_waiting_requests_do_not_hold_a_thread_slot(self) -> None:
+        threads = 2
+        requests = 8
+        in_flight = 0
+        peak = 0
+        all_started = asyncio.Event()
+
+        async def create_identify(url):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            if in_flight == requests:
+                all_started.set()
+            try:
+                # only returns once every request is inside the plugin, which needs more requests in flight than threads
+                await asyncio.wait_for(all_started.wait(), 5)
+            finally:
+                in_flight -= 1
+            return default.create_identify(url)
+
+        register_plugin('async_concurrency_test', create_plugin('async_concurrency_test', create_identify))
+        app = AsgiApp(APP, threads, requests)
+        statuses = await asyncio.gather(*[get(app, '/async_concurrency_test/oai', 'verb=Identify') for _ in range(requests)])
+
+        self.assertEqual(statuses, [200] * requests)
+        self.assertEqual(peak, requests)
+
+    async def test_sync_plugins_are_bounded_by_the_threads(self) -> None:
+        threads = 2
+        requests = 6
+        in_flight = 0
+        peak = 0
+        lock = Lock()
+        # only lets requests pass in groups of `threads`, so the requests fail if they run one after the other
+        barrier = Barrier(threads, timeout=5)
+
+        def create_identify(url):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            try:
+                barrier.wait()
+                return default.create_identify(url)
+            finally:
+                with lock:
+                    in_flight -= 1
+
+        register_plugin('sync_concurrency_test', create_plugin('sync_concurrency_test', create_identify))
+        app = AsgiApp(APP, threads, requests)
+        statuses = await asyncio.gather(*[get(app, '/sync_concurrency_test/oai', 'verb=Identify') for _ in range(requests)])
+
+        self.assertEqual(statuses, [200] * requests)
+        self.assertEqual(peak, threads)
+
+class RequestSlotsTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.executor = ThreadPoolExecutor(3)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_waiting_threads_give_their_slot_back(self) -> None:
+        slots = RequestSlots(1)
+        coroutine: Future = Future()
+        waiting = Event()
+        resumed = Event()
+        finish = Event()
+        # a failed assertion must not leave threads behind that the executor waits for
+        self.addCleanup(finish.set)
+        self.addCleanup(lambda: coroutine.done() or coroutine.set_result(None))
+
+        def wait_for_plugin():
+            waiting.set()
+            result = slots.wait(coroutine)
+            resumed.set()
+            finish.wait(5)
+            return result
+
+        first = self.executor.submit(slots.run, wait_for_plugin)
+        self.assertTrue(waiting.wait(5))
+        # the only slot is free while the first request waits for its coroutine
+        self.assertEqual(self.executor.submit(slots.run, lambda: 'second').result(timeout=5), 'second')
+
+        coroutine.set_result('first')
+        self.assertTrue(resumed.wait(5))
+        # and taken again once the coroutine is done
+        third = self.executor.submit(slots.run, lambda: 'third')
+        self.assertRaises(TimeoutError, third.result, timeout=0.1)
+        finish.set()
+        self.assertEqual(first.result(timeout=5), 'first')
+        self.assertEqual(third.result(timeout=5), 'third')
+
+    def test_threads_without_a_slot_wait_without_giving_one_back(self) -> None:
+        slots = RequestSlots(1)
+        coroutine: Future = Future()
+        coroutine.set_result('done')
+        self.assertEqual(slots.wait(coroutine), 'done')
+        # a release without a slot would exceed the bound of the semaphore
+        self.assertEqual(slots.run(lambda: 'run'), 'run')
+
+class RunCoroutineTest(unittest.TestCase):
+
+    def test_async_plugins_fail_without_the_loop_of_the_asgi_app(self) -> None:
+        async def create_identify(url):
+            return default.create_identify(url)
+        plugin = register_plugin('async_without_loop_test', create_plugin('async_without_loop_test', create_identify))
+        set_event_loop(None)
+        self.assertRaises(RuntimeError, plugin.create_identify, 'http://localhost/oai')
+
+    def test_async_plugins_fail_on_the_loop_itself(self) -> None:
+        async def create_identify(url):
+            return default.create_identify(url)
+        plugin = register_plugin('async_on_loop_test', create_plugin('async_on_loop_test', create_identify))
+        async def call():
+            set_event_loop(asyncio.get_running_loop())
+            try:
+                # waiting for the coroutine would block the loop that has to run it
+                return plugin.create_identify('http://localhost/oai')
+            finally:
+                set_event_loop(None)
+        self.assertRaises(RuntimeError, asyncio.run, call())
+
+async def run_lifespan(app: AsgiApp) -> list[dict]:
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+    async def receive():
+        return messages.pop(0)
+    async def send(message):
+        sent.append(message)
+    await app({'type': 'lifespan'}, receive, send)
+    return sent
+
+class LifespanTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_startup_runs_before_the_startup_completes(self) -> None:
+        calls = []
+        sent = await run_lifespan(AsgiApp(APP, 1, 1, lambda: calls.append(len(calls))))
+        self.assertEqual(calls, [0])
+        self.assertEqual([x['type'] for x in sent], ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    async def test_failed_startups_are_reported_to_the_server(self) -> None:
+        def startup():
+            raise ValueError('broken plugin')
+        sent = await run_lifespan(AsgiApp(APP, 1, 1, startup))
+        self.assertEqual([x['type'] for x in sent], ['lifespan.startup.failed'])
+        self.assertIn('broken plugin', sent[0]['message'])
+
+if __name__ == '__main__':
+    unittest.main()
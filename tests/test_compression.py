@@ -0,0 +1,57 @@
+"""
+Tests of the response compression, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+import gzip
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.compression import get_cache_key, get_compressed_cache
+from oai_pmh.shared.resumption import Cursor, encode_cursor
+
+def get_key(query_string: dict[str, str]):
+    with APP.test_request_context('/default/oai', query_string=query_string):
+        return get_cache_key(default, 'default', 'gzip')
+
+class CacheKeyTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ttl = APP.config['OAI_RESUMPTION_TOKEN_TTL']
+        self.addCleanup(APP.config.__setitem__, 'OAI_RESUMPTION_TOKEN_TTL', self.ttl)
+        self.token = encode_cursor(Cursor('ListRecords', default.__name__, 'oai_dc', last_datestamp='2020-01-01T00:00:00', last_identifier='oai:1', offset=100))
+
+    def test_pages_that_only_depend_on_their_arguments_are_cached(self) -> None:
+        self.assertEqual(get_key({'verb': 'Identify'}), ('default', 'verb=Identify', 'gzip'))
+        self.assertIsNotNone(get_key({'verb': 'ListRecords', 'resumptionToken': self.token}))
+        # first pages change with the records, they are not cached
+        self.assertIsNone(get_key({'verb': 'ListRecords', 'metadataPrefix': 'oai_dc'}))
+
+    def test_tokens_are_checked_before_the_cache_is_asked(self) -> None:
+        self.assertIsNone(get_key({'verb': 'ListRecords', 'resumptionToken': self.token + 'x'}))
+        # a token of another verb or source would otherwise be answered with the page cached for it
+        self.assertIsNone(get_key({'verb': 'ListIdentifiers', 'resumptionToken': self.token}))
+        APP.config['OAI_RESUMPTION_TOKEN_TTL'] = -1
+        self.assertIsNone(get_key({'verb': 'ListRecords', 'resumptionToken': self.token}))
+
+    def test_keys_do_not_depend_on_the_order_of_the_arguments(self) -> None:
+        self.assertEqual(get_key({'verb': 'ListSets', 'resumptionToken': self.token}), get_key({'resumptionToken': self.token, 'verb': 'ListSets'}))
+
+class CompressedResponseTest(unittest.TestCase):
+
+    def test_cached_bodies_decompress_to_the_page(self) -> None:
+        client = APP.test_client()
+        plain = client.get('/default/oai?verb=ListMetadataFormats', headers={'Accept-Encoding': 'identity'}, buffered=True)
+        hits = get_compressed_cache().stats()['hits']
+        compressed = [client.get('/default/oai?verb=ListMetadataFormats', headers={'Accept-Encoding': 'gzip'}, buffered=True) for _ in range(2)]
+        self.assertEqual(get_compressed_cache().stats()['hits'], hits + 1)
+        for response in compressed:
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            # the responseDate is the only difference between the pages
+            self.assertEqual(gzip.decompress(response.data).split(b'</responseDate>')[1], plain.data.split(b'</responseDate>')[1])
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+if __name__ == '__main__':
+    unittest.main()
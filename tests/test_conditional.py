@@ -0,0 +1,71 @@
+"""
+Tests of the conditional requests, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from datetime import datetime
+from types import ModuleType
+from typing import Optional
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.plugin_handler import REQUIRED_FUNCTIONS, register_plugin
+
+IDENTIFIER = 'https://www.wikidata.org/wiki/Q43361'
+
+class ConditionalRequestTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.version = '1'
+        self.datestamp = datetime(2020, 1, 1, 12)
+        plugin = ModuleType('oai_pmh.plugins.conditional_test.convert')
+        for name in REQUIRED_FUNCTIONS:
+            setattr(plugin, name, getattr(default, name))
+        plugin.get_repository_version = lambda: self.version # type: ignore
+        plugin.get_record_datestamp = lambda identifier: self.datestamp if identifier == IDENTIFIER else None # type: ignore
+        register_plugin('conditional_test', plugin)
+        self.client = APP.test_client()
+
+    def get(self, url: str, headers: Optional[dict[str, str]] = None):
+        # buffered responses are closed, which frees the admission slot of the request
+        return self.client.get(url, headers=headers or {}, buffered=True)
+
+    def test_unchanged_pages_are_not_sent_again(self) -> None:
+        response = self.get('/conditional_test/oai?verb=ListMetadataFormats')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.get('/conditional_test/oai?verb=ListMetadataFormats', {'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+        self.version = '2'
+        response = self.get('/conditional_test/oai?verb=ListMetadataFormats', {'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etags_depend_on_the_arguments(self) -> None:
+        etag = self.get('/conditional_test/oai?verb=ListMetadataFormats').headers['ETag']
+        response = self.get('/conditional_test/oai?verb=Identify', {'If-None-Match': etag})
+        self.assertNotEqual(response.status_code, 304)
+
+    def test_records_are_validated_by_their_datestamp(self) -> None:
+        url = f'/conditional_test/oai?verb=GetRecord&metadataPrefix=oai_dc&identifier={IDENTIFIER}'
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Last-Modified'], 'Wed, 01 Jan 2020 12:00:00 GMT')
+        self.assertEqual(self.get(url, {'If-Modified-Since': 'Wed, 01 Jan 2020 12:00:00 GMT'}).status_code, 304)
+        self.assertEqual(self.get(url, {'If-Modified-Since': 'Wed, 01 Jan 2020 11:59:59 GMT'}).status_code, 200)
+        # the ETag takes precedence over the date
+        self.assertEqual(self.get(url, {'If-None-Match': 'W/"other"', 'If-Modified-Since': 'Wed, 01 Jan 2020 12:00:00 GMT'}).status_code, 200)
+
+    def test_unknown_records_are_not_validated(self) -> None:
+        response = self.get('/conditional_test/oai?verb=GetRecord&metadataPrefix=oai_dc&identifier=oai:unknown')
+        self.assertNotIn('ETag', response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
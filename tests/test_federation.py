@@ -0,0 +1,96 @@
+"""
+Tests of the federated sources, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from datetime import datetime, timedelta
+from types import ModuleType
+import unittest
+
+from oai_pmh.generated.models import Header
+from oai_pmh.shared.federation import LAST_IDENTIFIER, Federation, get_member_after
+from oai_pmh.shared.header_batch import HeaderBatch
+
+# lib sorts before library, since the separator sorts before every letter
+ENTRIES = {
+    'library': [('oai:1', 0, ['books']), ('oai:2', 1, []), ('oai:3', 1, ['books']), ('oai:4', 3, [])],
+    'lib': [('oai:9', 1, []), ('oai:1', 2, ['maps'])],
+    'museum': [('oai:1', 0, []), ('oai:2', 1, ['paintings']), ('oai:3', 1, []), ('oai:4', 2, ['paintings'])]
+}
+
+def create_member(entries: list[tuple[str, int, list[str]]], batches: bool) -> ModuleType:
+    """A member that can only return its complete list and leaves the filters to the server"""
+    member = ModuleType('member')
+    member.NATIVE_FILTERS = frozenset() # type: ignore
+    def create_identifiers(metadata_prefix, start_date, end_date, set):
+        if not batches:
+            return [Header(identifier=identifier, datestamp=datetime(2020, 1, 1) + timedelta(days=day), setSpec=sets or None) for (identifier, day, sets) in entries]
+        batch = HeaderBatch()
+        for (identifier, day, sets) in entries:
+            batch.append(identifier, datetime(2020, 1, 1) + timedelta(days=day), False, sets)
+        return batch
+    member.create_identifiers = create_identifiers # type: ignore
+    return member
+
+def get_keys(headers) -> list[tuple[datetime, str]]:
+    if isinstance(headers, HeaderBatch):
+        return [(headers.datestamp(x), headers.identifier(x)) for x in range(len(headers))]
+    return [(x.datestamp, x.identifier) for x in headers]
+
+class MemberPositionTest(unittest.TestCase):
+
+    def test_the_member_of_the_last_entry_continues_after_it(self) -> None:
+        self.assertEqual(get_member_after('museum', (datetime(2020, 1, 1), 'museum:oai:1')), (datetime(2020, 1, 1), 'oai:1'))
+
+    def test_other_members_continue_before_or_after_the_datestamp(self) -> None:
+        after = (datetime(2020, 1, 1), 'library:oai:1')
+        # entries of lib come before the ones of library at the same datestamp, so all of them were merged already
+        self.assertEqual(get_member_after('lib', after), (datetime(2020, 1, 1), LAST_IDENTIFIER))
+        self.assertEqual(get_member_after('museum', after), (datetime(2020, 1, 1), ''))
+        self.assertIsNone(get_member_after('museum', None))
+
+class MergeTest(unittest.TestCase):
+
+    def create_federation(self, batches: bool) -> Federation:
+        return Federation('all', {name: create_member(entries, batches) for (name, entries) in ENTRIES.items()})
+
+    def expected(self, set=None) -> list[tuple[datetime, str]]:
+        return sorted((datetime(2020, 1, 1) + timedelta(days=day), f'{name}:{identifier}')
+            for (name, entries) in ENTRIES.items() for (identifier, day, sets) in entries
+            if set is None or set == name or set in [f'{name}:{x}' for x in sets])
+
+    def pages(self, federation: Federation, limit: int, set=None) -> list[tuple[datetime, str]]:
+        """All pages of the list, each one continues after the last entry of the previous page"""
+        keys: list[tuple[datetime, str]] = []
+        while True:
+            page = get_keys(federation.merge('identifiers', 'oai_dc', None, None, set, keys[-1] if keys else None, limit))
+            self.assertLessEqual(len(page), limit)
+            if not page:
+                return keys
+            keys.extend(page)
+
+    def test_complete_lists_are_merged_in_order(self) -> None:
+        for batches in [False, True]:
+            headers = self.create_federation(batches).create_identifiers('oai_dc')
+            self.assertEqual(isinstance(headers, HeaderBatch), batches)
+            self.assertEqual(get_keys(headers), self.expected())
+
+    def test_pages_continue_in_every_member(self) -> None:
+        # pages of every size end between the members of a datestamp and within one member
+        for batches in [False, True]:
+            federation = self.create_federation(batches)
+            for limit in range(1, 11):
+                self.assertEqual(self.pages(federation, limit), self.expected())
+
+    def test_sets_select_members(self) -> None:
+        federation = self.create_federation(False)
+        for set in ['museum', 'library:books', 'museum:paintings', 'unknown']:
+            self.assertEqual(self.pages(federation, 2, set), self.expected(set))
+
+    def test_namespaced_headers(self) -> None:
+        headers = self.create_federation(True).create_identifiers('oai_dc')
+        self.assertEqual(headers.identifier(0), 'library:oai:1')
+        self.assertEqual(headers.set_specs(0), ['library', 'library:books'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests of the fragment cache, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+import pathlib
+import tempfile
+import unittest
+
+from oai_pmh.shared.fragment_cache import FragmentCache
+
+FRAGMENT = '<record>' + 'x' * 92 + '</record>'
+
+def create_key(number: int) -> tuple[str, str, str, str]:
+    return ('default', f'oai:{number}', 'oai_dc', '2020-01-01T00:00:00')
+
+class DiskTierTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def get_files(self) -> list[pathlib.Path]:
+        return list(pathlib.Path(self.directory.name).glob('*/*.xml'))
+
+    def test_fragments_survive_a_restart(self) -> None:
+        cache = FragmentCache(1024, self.directory.name, 1024)
+        cache.put(create_key(1), FRAGMENT)
+        cache.flush()
+        restarted = FragmentCache(1024, self.directory.name, 1024)
+        self.assertEqual(restarted.get(create_key(1)), FRAGMENT)
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+    def test_the_oldest_files_are_removed_beyond_the_budget(self) -> None:
+        cache = FragmentCache(1024, self.directory.name, 3 * len(FRAGMENT))
+        for number in range(5):
+            cache.put(create_key(number), FRAGMENT)
+        cache.flush()
+        self.assertEqual(len(self.get_files()), 3)
+        self.assertEqual(cache.stats()['disk_size'], 3 * len(FRAGMENT))
+        self.assertEqual(cache.stats()['disk_evictions'], 2)
+        # a restarted cache only finds the newest fragments on disk
+        restarted = FragmentCache(1024, self.directory.name, 3 * len(FRAGMENT))
+        self.assertIsNone(restarted.get(create_key(0)))
+        self.assertEqual(restarted.get(create_key(4)), FRAGMENT)
+
+    def test_files_of_earlier_runs_count_against_the_budget(self) -> None:
+        cache = FragmentCache(1024, self.directory.name, 3 * len(FRAGMENT))
+        for number in range(3):
+            cache.put(create_key(number), FRAGMENT)
+        cache.flush()
+        restarted = FragmentCache(1024, self.directory.name, 2 * len(FRAGMENT))
+        restarted.put(create_key(3), FRAGMENT)
+        restarted.flush()
+        self.assertEqual(len(self.get_files()), 2)
+        self.assertEqual(restarted.stats()['disk_size'], 2 * len(FRAGMENT))
+
+    def test_rewritten_fragments_are_counted_once(self) -> None:
+        cache = FragmentCache(1024, self.directory.name, 1024)
+        cache.put(create_key(1), FRAGMENT)
+        cache.put(create_key(1), FRAGMENT)
+        cache.flush()
+        self.assertEqual(cache.stats()['disk_size'], len(FRAGMENT))
+
+if __name__ == '__main__':
+    unittest.main()
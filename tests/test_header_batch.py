@@ -0,0 +1,85 @@
+"""
+Tests of HeaderBatch, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from datetime import datetime, timedelta, timezone
+import re
+import unittest
+
+from flask import render_template_string
+
+from oai_pmh import APP
+from oai_pmh.shared.header_batch import HeaderBatch
+
+HEADER_LOOP = "{% for header in headers %}{% include 'header.xml.jinja' %}{% endfor %}"
+
+def create_batch(count: int) -> HeaderBatch:
+    """Entries a day apart, every third one is deleted and every entry is in one of two sets"""
+    batch = HeaderBatch()
+    for number in range(count):
+        batch.append(f'oai:{number:03d}', datetime(2020, 1, 1) + timedelta(days=number), number % 3 == 0, ['even' if number % 2 == 0 else 'odd'])
+    return batch
+
+def get_identifiers(batch: HeaderBatch) -> list[str]:
+    return [batch.identifier(x) for x in range(len(batch))]
+
+class HeaderBatchTest(unittest.TestCase):
+
+    def test_slices_do_not_change_the_set_specs_of_their_batch(self) -> None:
+        batch = create_batch(4)
+        page = batch[:2]
+        page.append('oai:new', datetime(2021, 1, 1), sets=['new'])
+        self.assertEqual(page.set_specs(2), ['new'])
+        self.assertEqual(batch._set_specs, ['even', 'odd'])
+        self.assertNotIn('new', batch._set_index)
+
+    def test_select(self) -> None:
+        batch = create_batch(10)
+        self.assertIs(batch.select(), batch)
+        self.assertEqual(get_identifiers(batch.select(datetime(2020, 1, 3), datetime(2020, 1, 5))), ['oai:002', 'oai:003', 'oai:004'])
+        self.assertEqual(get_identifiers(batch.select(set='odd', end_date=datetime(2020, 1, 6))), ['oai:001', 'oai:003', 'oai:005'])
+        self.assertEqual(len(batch.select(set='unknown')), 0)
+        # aware datestamps are compared in UTC
+        start = datetime(2020, 1, 9, 1, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(get_identifiers(batch.select(start)), ['oai:008', 'oai:009'])
+
+    def test_sorted(self) -> None:
+        batch = HeaderBatch()
+        for (identifier, day) in [('oai:b', 2), ('oai:c', 1), ('oai:a', 2)]:
+            batch.append(identifier, datetime(2020, 1, day), identifier == 'oai:a', [identifier])
+        ordered = batch.sorted()
+        self.assertEqual(get_identifiers(ordered), ['oai:c', 'oai:a', 'oai:b'])
+        self.assertEqual([ordered.is_deleted(x) for x in range(3)], [False, True, False])
+        self.assertEqual([ordered.set_specs(x) for x in range(3)], [['oai:c'], ['oai:a'], ['oai:b']])
+        self.assertIs(ordered.sorted(), ordered)
+
+    def test_page_after_a_key(self) -> None:
+        batch = create_batch(10)
+        self.assertEqual(get_identifiers(batch.page(None, 3)), ['oai:000', 'oai:001', 'oai:002'])
+        self.assertEqual(get_identifiers(batch.page((datetime(2020, 1, 3), 'oai:002'), 3)), ['oai:003', 'oai:004', 'oai:005'])
+        # entries with the same datestamp are ordered by identifier
+        self.assertEqual(get_identifiers(batch.page((datetime(2020, 1, 3), 'oai:001'), 1)), ['oai:002'])
+        self.assertEqual(get_identifiers(batch.page((datetime(2020, 1, 9), 'oai:008'), 5)), ['oai:009'])
+        self.assertEqual(len(batch.page((datetime(2021, 1, 1), 'oai:999'), 5)), 0)
+
+    def test_deleted_flags_across_byte_boundaries(self) -> None:
+        batch = create_batch(20)
+        self.assertEqual([batch.is_deleted(x) for x in range(20)], [x % 3 == 0 for x in range(20)])
+        # a slice that does not start at a byte boundary moves every flag to another bit
+        page = batch[5:19]
+        self.assertEqual([page.is_deleted(x) for x in range(len(page))], [x % 3 == 0 for x in range(5, 19)])
+        self.assertEqual([x.status for x in page], ['deleted' if x % 3 == 0 else None for x in range(5, 19)])
+
+    def test_to_xml_writes_the_header_template(self) -> None:
+        batch = HeaderBatch()
+        batch.append('oai:a&b<c>"d"', datetime(2020, 1, 1, 12), True, ['math & physics', 'x<y'])
+        batch.append("oai:'e'", datetime(2020, 1, 2))
+        with APP.app_context():
+            rendered = render_template_string(HEADER_LOOP, headers=list(batch))
+        normalized = re.sub(r'>\s+<', '><', rendered.strip()).replace('<header >', '<header>')
+        self.assertEqual(normalized, str(batch.to_xml()).replace('\n', ''))
+        self.assertIn('<identifier>oai:a&amp;b&lt;c&gt;&#34;d&#34;</identifier>', normalized)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of the request metrics, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+import time
+from types import ModuleType
+import unittest
+
+from flask import g
+
+from oai_pmh import APP
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.metrics import phase
+from oai_pmh.shared.plugin_handler import REQUIRED_FUNCTIONS, wrap_plugin
+
+DELAY = 0.05
+
+def create_identifiers_page(metadata_prefix, start_date=None, end_date=None, set=None, after=None, limit=100):
+    # a lazy page does its work while the route iterates over it
+    for identifier in ['oai:1', 'oai:2']:
+        time.sleep(DELAY)
+        yield identifier
+
+def create_plugin() -> ModuleType:
+    plugin = ModuleType('oai_pmh.plugins.lazy_metrics_test.convert')
+    for name in REQUIRED_FUNCTIONS:
+        setattr(plugin, name, getattr(default, name))
+    plugin.create_identifiers_page = create_identifiers_page # type: ignore
+    return plugin
+
+class PluginPhaseTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        context = APP.test_request_context('/lazy_metrics_test/oai')
+        context.push()
+        self.addCleanup(context.pop)
+        g.timings = {}
+        g.phase_stack = []
+
+    def test_iteration_of_lazy_results_is_counted_as_plugin_time(self) -> None:
+        plugin = wrap_plugin(create_plugin())
+        page = plugin.create_identifiers_page('oai_dc')
+        self.assertLess(g.timings.get('plugin', 0.0), DELAY)
+        with phase('render'):
+            self.assertEqual(list(page), ['oai:1', 'oai:2'])
+        self.assertGreaterEqual(g.timings['plugin'], 2 * DELAY)
+        self.assertLess(g.timings['render'], DELAY)
+
+    def test_abandoned_iterations_close_the_result(self) -> None:
+        closed = []
+        def create_page():
+            try:
+                yield from range(10)
+            finally:
+                closed.append(True)
+        plugin = create_plugin()
+        plugin.create_identifiers_page = create_page # type: ignore
+        page = wrap_plugin(plugin).create_identifiers_page()
+        next(page)
+        page.close()
+        self.assertEqual(closed, [True])
+
+if __name__ == '__main__':
+    unittest.main()
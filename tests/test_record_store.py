@@ -0,0 +1,73 @@
+"""
+Tests of the SQLite record store, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from datetime import datetime, timedelta, timezone
+import pathlib
+import tempfile
+import unittest
+
+from oai_pmh.shared.record_store import RecordStore
+
+def get_identifiers(records) -> list[str]:
+    return [x['identifier'] for x in records]
+
+class RecordStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = RecordStore(pathlib.Path(directory.name) / 'records.sqlite')
+        self.addCleanup(self.store.close)
+        # oai:2 and oai:3 share a datestamp, so pages are ordered by identifier within it
+        self.store.load([
+            {'identifier': 'oai:1', 'datestamp': '2020-01-01T00:00:00', 'sets': ['a'], 'metadata': {'title': ['One']}},
+            {'identifier': 'oai:3', 'datestamp': '2020-01-02T00:00:00', 'sets': ['a', 'b']},
+            {'identifier': 'oai:2', 'datestamp': '2020-01-02T00:00:00', 'sets': ['b']},
+            {'identifier': 'oai:4', 'datestamp': '2020-01-03T12:00:00+02:00', 'deleted': True}
+        ])
+
+    def test_pages_continue_after_their_last_key(self) -> None:
+        pages = []
+        after = None
+        while True:
+            page = list(self.store.find(after=after, limit=2))
+            if not page:
+                break
+            pages.append(get_identifiers(page))
+            after = (page[-1]['datestamp'], page[-1]['identifier'])
+        self.assertEqual(pages, [['oai:1', 'oai:2'], ['oai:3', 'oai:4']])
+
+    def test_set_pages(self) -> None:
+        self.assertEqual(get_identifiers(self.store.find(set='a')), ['oai:1', 'oai:3'])
+        self.assertEqual(get_identifiers(self.store.find(set='b', after=(datetime(2020, 1, 2), 'oai:2'))), ['oai:3'])
+        self.assertEqual(self.store.count(set='b'), 2)
+        self.assertEqual(get_identifiers(self.store.find(set='unknown')), [])
+
+    def test_datestamps_are_stored_in_utc(self) -> None:
+        record = self.store.get('oai:4')
+        self.assertEqual(record['datestamp'], datetime(2020, 1, 3, 10))
+        self.assertTrue(record['deleted'])
+        self.assertEqual(record['sets'], [])
+
+    def test_aware_filters_are_compared_in_utc(self) -> None:
+        # 2020-01-03T11:00:00+02:00 is 09:00 UTC, before oai:4
+        start = datetime(2020, 1, 3, 11, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(get_identifiers(self.store.find(start)), ['oai:4'])
+        self.assertEqual(get_identifiers(self.store.find(end_date=datetime(2020, 1, 2, 1, tzinfo=timezone(timedelta(hours=2))))), ['oai:1'])
+        self.assertEqual(self.store.count(datetime(2020, 1, 2), datetime(2020, 1, 2)), 2)
+
+    def test_changed_datestamps_move_the_set_memberships(self) -> None:
+        self.store.load([{'identifier': 'oai:1', 'datestamp': '2021-01-01T00:00:00', 'sets': ['a']}])
+        self.assertEqual(get_identifiers(self.store.find(set='a')), ['oai:3', 'oai:1'])
+        self.assertEqual(get_identifiers(self.store.find(set='a', start_date=datetime(2020, 6, 1))), ['oai:1'])
+
+    def test_records_keep_their_metadata_and_sets(self) -> None:
+        record = self.store.get('oai:1')
+        self.assertEqual(record['metadata'], {'title': ['One']})
+        self.assertEqual(self.store.get('oai:3')['sets'], ['a', 'b'])
+        self.assertIsNone(self.store.get('oai:5'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests of the resumption tokens, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.shared.exceptions import BadResumptionTokenException, InsecureSecretException
+from oai_pmh.shared.resumption import Cursor, decode_cursor, encode_cursor, has_default_secret
+from oai_pmh.shared.startup import start
+
+SOURCE = 'oai_pmh.plugins.default.convert'
+
+class TokenTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = {x: APP.config[x] for x in ['SECRET_KEY', 'OAI_RESUMPTION_TOKEN_SECRET', 'OAI_RESUMPTION_TOKEN_TTL']}
+        self.addCleanup(APP.config.update, self.config)
+        APP.config.update(SECRET_KEY='app secret', OAI_RESUMPTION_TOKEN_SECRET=None)
+        self.cursor = Cursor('ListRecords', SOURCE, 'oai_dc', set='content', last_datestamp='2020-01-01T00:00:00', last_identifier='oai:1', offset=100)
+
+    def test_tokens_keep_the_cursor(self) -> None:
+        self.assertEqual(decode_cursor(encode_cursor(self.cursor), 'ListRecords', SOURCE), self.cursor)
+
+    def test_changed_tokens_are_rejected(self) -> None:
+        token = encode_cursor(self.cursor)
+        (payload, signature) = token.rsplit('.', 1)
+        forged = f'{payload}.{"A" if signature[0] != "A" else "B"}{signature[1:]}'
+        self.assertRaises(BadResumptionTokenException, decode_cursor, forged, 'ListRecords', SOURCE)
+        self.assertRaises(BadResumptionTokenException, decode_cursor, 'not a token', 'ListRecords', SOURCE)
+
+    def test_tokens_of_other_secrets_are_rejected(self) -> None:
+        token = encode_cursor(self.cursor)
+        APP.config['SECRET_KEY'] = 'other secret'
+        self.assertRaises(BadResumptionTokenException, decode_cursor, token, 'ListRecords', SOURCE)
+
+    def test_the_token_secret_takes_precedence(self) -> None:
+        APP.config['OAI_RESUMPTION_TOKEN_SECRET'] = 'token secret'
+        token = encode_cursor(self.cursor)
+        # rotating the app secret does not invalidate the tokens of running harvests
+        APP.config['SECRET_KEY'] = 'other secret'
+        self.assertEqual(decode_cursor(token, 'ListRecords', SOURCE), self.cursor)
+
+    def test_tokens_expire(self) -> None:
+        token = encode_cursor(self.cursor)
+        # itsdangerous only rejects tokens older than the maximum age, a negative one rejects every token
+        APP.config['OAI_RESUMPTION_TOKEN_TTL'] = -1
+        self.assertRaises(BadResumptionTokenException, decode_cursor, token, 'ListRecords', SOURCE)
+
+    def test_tokens_only_continue_their_own_list(self) -> None:
+        token = encode_cursor(self.cursor)
+        self.assertRaises(BadResumptionTokenException, decode_cursor, token, 'ListIdentifiers', SOURCE)
+        self.assertRaises(BadResumptionTokenException, decode_cursor, token, 'ListRecords', 'oai_pmh.plugins.other.convert')
+
+class SecretTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = {x: APP.config[x] for x in ['SECRET_KEY', 'OAI_RESUMPTION_TOKEN_SECRET', 'OAI_WARM_UP']}
+        self.addCleanup(APP.config.update, self.config)
+        APP.config['OAI_WARM_UP'] = False
+
+    def test_servers_refuse_to_start_with_the_default_secret(self) -> None:
+        APP.config.update(SECRET_KEY='dev', OAI_RESUMPTION_TOKEN_SECRET=None)
+        self.assertTrue(has_default_secret())
+        self.assertRaises(InsecureSecretException, start)
+
+    def test_either_secret_is_enough(self) -> None:
+        APP.config.update(SECRET_KEY='dev', OAI_RESUMPTION_TOKEN_SECRET='token secret')
+        self.assertFalse(has_default_secret())
+        start()
+        APP.config.update(SECRET_KEY='app secret', OAI_RESUMPTION_TOKEN_SECRET=None)
+        self.assertFalse(has_default_secret())
+        start()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of the selective harvesting helpers, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from datetime import datetime, timedelta, timezone
+from random import Random
+import unittest
+
+from oai_pmh.shared.selective import HarvestIndex
+
+SETS = ['a', 'b', 'c']
+
+def create_entries(count: int) -> list[tuple[str, datetime, list[str]]]:
+    """Entries in random order, many of them share a datestamp and some are in no set"""
+    random = Random(7)
+    return [(f'oai:{random.randrange(10 ** 6):06d}-{number}', datetime(2020, 1, 1) + timedelta(days=random.randrange(20)), random.sample(SETS, random.randrange(3))) for number in range(count)]
+
+class HarvestIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.entries = create_entries(100)
+        self.index = HarvestIndex(self.entries)
+        self.ordered = sorted(self.entries, key=lambda x: (x[1], x[0]))
+
+    def expected(self, start_date=None, end_date=None, set=None, after=None, limit=None) -> list[str]:
+        """The same query answered by scanning every entry"""
+        matches = [identifier for (identifier, datestamp, sets) in self.ordered
+            if (start_date is None or datestamp >= start_date) and (end_date is None or datestamp <= end_date)
+            and (set is None or set in sets) and (after is None or (datestamp, identifier) > after)]
+        return matches[:limit] if limit is not None else matches
+
+    def select(self, *args, **kwargs) -> list[str]:
+        return [self.index.identifiers[x] for x in self.index.select(*args, **kwargs)]
+
+    def test_select_matches_a_scan(self) -> None:
+        start = datetime(2020, 1, 5)
+        end = datetime(2020, 1, 12)
+        for set in [None, *SETS, 'unknown']:
+            self.assertEqual(self.select(set=set), self.expected(set=set))
+            self.assertEqual(self.select(start, end, set), self.expected(start, end, set))
+            self.assertEqual(self.select(start, set=set, limit=7), self.expected(start, set=set, limit=7))
+            self.assertEqual(self.index.count(start, end, set), len(self.expected(start, end, set)))
+
+    def test_pages_after_every_position(self) -> None:
+        # every entry is the last one of a page once, including entries that share their datestamp with the next one
+        for set in [None, 'b']:
+            for (identifier, datestamp, _) in self.ordered:
+                after = (datestamp, identifier)
+                self.assertEqual(self.select(set=set, after=after, limit=5), self.expected(set=set, after=after, limit=5))
+
+    def test_bitmaps_span_many_bytes(self) -> None:
+        index = HarvestIndex((f'oai:{x:04d}', datetime(2020, 1, 1), ['odd'] if x % 2 else []) for x in range(1000))
+        self.assertEqual(index.count(set='odd'), 500)
+        self.assertEqual(list(index.select(set='odd', after=(datetime(2020, 1, 1), 'oai:0990'))), [991, 993, 995, 997, 999])
+        self.assertEqual(list(index.select(set='odd', limit=3)), [1, 3, 5])
+
+    def test_aware_datestamps_are_indexed_in_utc(self) -> None:
+        index = HarvestIndex([('oai:1', datetime(2020, 1, 2, 1, tzinfo=timezone(timedelta(hours=2))), []), ('oai:2', datetime(2020, 1, 1, 12), [])])
+        self.assertEqual(index.identifiers, ['oai:2', 'oai:1'])
+        self.assertEqual(index.count(start_date=datetime(2020, 1, 1, 22, tzinfo=timezone.utc)), 1)
+        self.assertFalse(index.has_set('a'))
+
+if __name__ == '__main__':
+    unittest.main()
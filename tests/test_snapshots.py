@@ -0,0 +1,80 @@
+"""
+Tests of the static harvest snapshots, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import pathlib
+import tempfile
+from typing import Iterator
+import unittest
+
+from oai_pmh import APP
+from oai_pmh.plugins.default import convert as default
+from oai_pmh.shared.exceptions import BadResumptionTokenException
+from oai_pmh.shared.resumption import Cursor, decode_cursor, encode_cursor
+from oai_pmh.shared.snapshots import SnapshotIndex, get_requested_page, get_snapshot_directory
+
+class SnapshotDirectoryTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_parts_of_the_key_stay_inside_the_directory(self) -> None:
+        root = pathlib.Path(self.directory.name).resolve()
+        for key in [('default', 'ListRecords', '..', '..'), ('default', 'ListRecords', '../../..', None), ('..', 'ListRecords', 'oai_dc', 'a/../../b')]:
+            # source, verb, metadata prefix and set are one directory each
+            self.assertEqual(len(get_snapshot_directory(self.directory.name, key).resolve().relative_to(root).parts), 4)
+
+    def test_set_specs_are_quoted(self) -> None:
+        snapshot_directory = get_snapshot_directory(self.directory.name, ('default', 'ListRecords', 'oai_dc', 'parent:child'))
+        self.assertEqual(snapshot_directory.name, 'parent%3Achild')
+
+    def test_index_ignores_keys_outside_the_directory(self) -> None:
+        # a manifest next to the snapshot directory must not be found through the key
+        manifest = pathlib.Path(self.directory.name) / 'default' / 'ListRecords' / 'manifest.json'
+        manifest.parent.mkdir(parents=True)
+        manifest.write_text('{}', encoding='utf-8')
+        self.assertIsNone(SnapshotIndex(self.directory.name).get(('default', 'ListRecords', '..', None)))
+
+@contextmanager
+def expired_tokens() -> Iterator[None]:
+    ttl = APP.config['OAI_RESUMPTION_TOKEN_TTL']
+    # itsdangerous only rejects tokens older than the maximum age, a negative one rejects every token
+    APP.config['OAI_RESUMPTION_TOKEN_TTL'] = -1
+    try:
+        yield
+    finally:
+        APP.config['OAI_RESUMPTION_TOKEN_TTL'] = ttl
+
+class RequestedPageTest(unittest.TestCase):
+
+    def test_unknown_metadata_prefixes_are_answered_dynamically(self) -> None:
+        for prefix in ['../../../etc', 'unknown', '']:
+            with APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords', 'metadataPrefix': prefix}):
+                self.assertIsNone(get_requested_page(default, 'default'))
+
+    def test_snapshot_tokens_do_not_expire(self) -> None:
+        token = encode_cursor(Cursor('ListRecords', default.__name__, 'oai_dc', last_datestamp='2020-01-01T00:00:00', last_identifier='oai:1', offset=100, snapshot=True))
+        with expired_tokens(), APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords', 'resumptionToken': token}):
+            self.assertEqual(get_requested_page(default, 'default'), (('default', 'ListRecords', 'oai_dc', None), ('2020-01-01T00:00:00', 'oai:1')))
+
+    def test_expired_dynamic_tokens_are_not_served_from_snapshots(self) -> None:
+        token = encode_cursor(Cursor('ListRecords', default.__name__, 'oai_dc', last_datestamp='2020-01-01T00:00:00', last_identifier='oai:1', offset=100))
+        with APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords', 'resumptionToken': token}):
+            self.assertIsNone(get_requested_page(default, 'default'))
+        with expired_tokens():
+            self.assertRaises(BadResumptionTokenException, decode_cursor, token, 'ListRecords', default.__name__)
+
+    def test_dynamic_pages_link_to_dynamic_tokens(self) -> None:
+        cursor = Cursor('ListRecords', default.__name__, 'oai_dc', last_datestamp='2020-01-01T00:00:00', last_identifier='oai:1', offset=100, snapshot=True)
+        self.assertIsNone(cursor.advance(datetime(2021, 1, 1), 'oai:2', 100).snapshot)
+
+    def test_first_page_of_a_full_harvest(self) -> None:
+        with APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords', 'metadataPrefix': 'oai_dc', 'set': 'content'}):
+            self.assertEqual(get_requested_page(default, 'default'), (('default', 'ListRecords', 'oai_dc', 'content'), None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+Tests of the response validation, run them from the repository root:
+
+    python -m unittest discover tests
+"""
+from typing import Iterator
+import unittest
+
+from flask import Response
+
+from oai_pmh import APP
+from oai_pmh.shared.exceptions import InvalidResponseException
+from oai_pmh.shared.validation import validate_response
+
+INVALID = b'<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><unknown/></OAI-PMH>'
+
+class StreamedValidationTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = {x: APP.config[x] for x in ['OAI_VALIDATION_STRICT', 'OAI_VALIDATION_SAMPLE_RATE']}
+        self.addCleanup(APP.config.update, self.config)
+        self.sent: list[bytes] = []
+
+    def create_stream(self) -> Response:
+        def chunks() -> Iterator[bytes]:
+            for chunk in [INVALID[:20], INVALID[20:]]:
+                self.sent.append(chunk)
+                yield chunk
+        return Response(chunks(), mimetype='application/xml')
+
+    def test_strict_mode_rejects_streams_before_they_are_sent(self) -> None:
+        APP.config['OAI_VALIDATION_STRICT'] = True
+        with APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords'}):
+            response = self.create_stream()
+            self.assertRaises(InvalidResponseException, validate_response, response, 'default')
+        # the chunks were only buffered, a server has not sent any of them yet
+        self.assertEqual(b''.join(self.sent), INVALID)
+
+    def test_sampled_streams_are_passed_through(self) -> None:
+        APP.config['OAI_VALIDATION_STRICT'] = False
+        APP.config['OAI_VALIDATION_SAMPLE_RATE'] = 1.0
+        with APP.test_request_context('/default/oai', query_string={'verb': 'ListRecords'}):
+            response = validate_response(self.create_stream(), 'default')
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(self.sent, [])
+            self.assertEqual(b''.join(response.response), INVALID)
+
+if __name__ == '__main__':
+    unittest.main()